@@ -1,24 +1,51 @@
+# process pool (spawn) ของ qr_batch / invoice_pipeline: process ลูกจะรันไฟล์ __main__ ซ้ำทั้งไฟล์ถ้า __main__ ไม่มี __spec__
+# Streamlit รันไฟล์นี้เป็น __main__ แบบไม่มี __spec__ จึงประกาศไว้ ลูกจะข้ามไฟล์นี้และ import แค่โมดูลที่มีฟังก์ชันงาน
+from importlib.machinery import ModuleSpec
+__spec__ = ModuleSpec("__main__", None)
 import streamlit as st
-import gspread
-from oauth2client.service_account import ServiceAccountCredentials
-from datetime import datetime
+from datetime import datetime, timedelta
 import time
-import pandas as pd
-import requests
-import json
+import threading
 import pytz
 import uuid
-import qrcode
-import re
-from io import BytesIO
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+from formatters import fix_phone_number, fix_tax_id, strip_branch_suffix
+from storage import QUEUE_CONFLICT, SheetsMirror, SheetsStorage, SQLiteStorage, TokenConflictError, clean_token
+from token_snapshot import TokenSnapshot
+from outbox import Outbox, idempotency_key
+from postcodes import PostcodeIndex
+import address_parser
+import dashboard
+import qr_batch
+import invoice_pipeline
+import retention
+from line_notifier import LINE_API, LineNotifier
+from metrics import METRICS
+from sheets import registry_from_secrets
+from tenants import load_tenants, resolve_tenant
+from token_signing import EXPIRED, InvalidToken, signer_from_secrets
 
 # ==========================================
 # ⚙️ ตั้งค่าระบบ
 # ==========================================
 ADMIN_PASSWORD = "34573457"
+BASE_URL = "https://nami-invoice-app.streamlit.app"
+SHOP_NAME = "ร้าน Nami 345 ปากเกร็ด"
+
+# 🏪 หลายสาขา: เลือกสาขาจาก ?shop= ในลิงก์ (ตั้งค่าใน secrets หัวข้อ [tenants.<รหัสสาขา>] ดู tenants.py)
+# ค่าด้านบนเป็นค่าเริ่มต้นของสาขาที่ไม่ได้ตั้ง name / base_url / admin_password เอง
+# (อ่าน secrets ใหม่ทุกรอบ เบา และแก้ secrets แล้วมีผลทันที ส่วน client / คิวโควตา cache แยกตามสาขาด้านล่าง)
+def get_tenants():
+    return load_tenants(st.secrets, {"name": SHOP_NAME, "base_url": BASE_URL, "admin_password": ADMIN_PASSWORD})
+
+def get_tenant(tenant_key):
+    return get_tenants()[0][tenant_key]
+
+tenant = resolve_tenant(*get_tenants(), st.query_params.get("shop"))
 
 st.set_page_config(
-    page_title="ระบบออกใบกำกับภาษีร้าน Nami 345 ปากเกร็ด", 
+    page_title=f"ระบบออกใบกำกับภาษี{tenant.name if tenant else ''}", 
     page_icon="🧾",
     layout="centered",
     initial_sidebar_state="collapsed"
@@ -70,127 +97,241 @@ style_senior_friendly = """
 """
 st.markdown(style_senior_friendly, unsafe_allow_html=True)
 
+if tenant is None:
+    st.error("❌ ไม่พบสาขานี้ในระบบ กรุณาสแกน QR Code ใหม่ หรือติดต่อพนักงาน")
+    st.stop()
+
 # ==========================================
 # 🔌 ส่วนเชื่อมต่อ Database
 # ==========================================
+# 🛠️ เปิด spreadsheet / worksheet ครั้งเดียวแล้วใช้ร่วมกันทุกส่วน (login ใหม่ให้เองเมื่อ token หมดอายุ)
+# คำสั่งทั้งหมดเข้าคิวตามโควตาของ Google (งานเขียนสำคัญได้ก่อน โดน 429 จะรอแล้วลองใหม่เอง)
+# ทุกอย่างในส่วนนี้แยกตามสาขา (cache ตาม tenant_key): client / คิวโควตา / ที่เก็บข้อมูล / LINE / outbox ของใครของมัน
+# สาขาที่ลูกค้าเยอะใช้โควตาหมด สาขาอื่นยังเขียนได้ตามปกติ
+# [sheets_quota]
+# reads_per_minute = 60
+# writes_per_minute = 60
 @st.cache_resource
-def get_sheet_connection():
-    scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
-    key_dict = st.secrets["gcp_service_account"]
-    creds = ServiceAccountCredentials.from_json_keyfile_dict(key_dict, scope)
-    client = gspread.authorize(creds)
-    return client
-
-# 🛠️ นำ @st.cache_data ออกและใช้ .find() แทนเพื่อกันข้อมูลเก่าค้าง
-def check_token_status(token_str):
-    try:
-        if not token_str:
-            return None
-        
-        # ตัดช่องว่างซ้ายขวา และเอาเครื่องหมาย / ออกเผื่อแอปสแกนบางตัวแอบเติมมา
-        clean_token = str(token_str).strip().replace("/", "")
+def get_sheet_registry(tenant_key):
+    return registry_from_secrets(get_tenant(tenant_key).conf)
 
-        client = get_sheet_connection()
-        sheet_token = client.open("Invoice_Data").worksheet("TokenDB")
-        
-        cell = sheet_token.find(clean_token, in_column=1)
-        if cell:
-            row_values = sheet_token.row_values(cell.row)
-            if len(row_values) >= 3:
-                return {
-                    'Token': str(row_values[0]).strip(),
-                    'Amount': row_values[1],
-                    'Status': str(row_values[2]).strip()
-                }
+# 📴 สำเนา TokenDB ในเครื่อง (sync เบื้องหลังทุกไม่กี่วินาที) ใช้ตรวจ token ต่อได้ตอน Google Sheets ล่ม
+# [offline]
+# enabled = true
+# refresh_interval = 5
+@st.cache_resource
+def get_token_snapshot(tenant_key):
+    offline_conf = get_tenant(tenant_key).section("offline")
+    if not offline_conf.get("enabled", True):
+        return None
+    return TokenSnapshot(
+        get_sheet_registry(tenant_key).worksheet("TokenDB"),
+        offline_conf.get("snapshot_path", "data/token_snapshot.json"),
+        refresh_interval=offline_conf.get("refresh_interval", 5),
+        full_interval=offline_conf.get("full_interval", 300),
+    ).start()
+
+# 🛠️ เลือกที่เก็บข้อมูลจาก secrets ของสาขา (ค่าเริ่มต้นคือ Google Sheets แบบเดิม)
+# [storage]
+# backend = "sqlite"            # "sheets" หรือ "sqlite"
+# sqlite_path = "data/nami.db"
+# mirror_to_sheets = true       # ส่งข้อมูลต่อไป Google Sheets เบื้องหลัง
+# mirror_path = "data/sheets_mirror.jsonl"   # journal ของงานที่ยังส่งไป Sheets ไม่ถึง
+@st.cache_resource
+def get_storage(tenant_key):
+    storage_conf = get_tenant(tenant_key).section("storage")
+    if storage_conf.get("backend", "sheets") == "sqlite":
+        mirror = None
+        if storage_conf.get("mirror_to_sheets", False):
+            mirror = SheetsMirror(SheetsStorage(get_sheet_registry(tenant_key)),
+                                  storage_conf.get("mirror_path", "data/sheets_mirror.jsonl"))
+        return SQLiteStorage(storage_conf.get("sqlite_path", "data/nami.db"), mirror=mirror)
+    return SheetsStorage(get_sheet_registry(tenant_key), snapshot=get_token_snapshot(tenant_key))
+
+# 🛠️ Streamlit รันไฟล์ใหม่ทุกครั้งที่ลูกค้าพิมพ์/กดปุ่ม จึงจำผลตรวจ token ไว้ใน session
+# ถามชีตใหม่เมื่อเกิน TOKEN_RECHECK_SECONDS หรือเมื่อสั่ง force (ตอนกดส่งจริง)
+TOKEN_RECHECK_SECONDS = 60
+
+def check_token_status(token_str, force=False):
+    if not token_str:
         return None
+    cached = st.session_state.get('token_check')
+    now = time.monotonic()
+    if not force and cached and cached['token'] == token_str and now - cached['at'] < TOKEN_RECHECK_SECONDS:
+        return cached['data']
+    try:
+        data = get_storage(tenant.key).get_token(token_str)
     except Exception as e:
+        METRICS.inc("app_errors_total", where="token_check")
         st.error(f"⚠️ ระบบฐานข้อมูลขัดข้องชั่วคราว: {e}")
         return None
+    st.session_state['token_check'] = {"token": token_str, "data": data, "at": now}
+    return data
+
+# 🔏 token แบบมีลายเซ็น (ยอด + วันหมดอายุอยู่ในลิงก์) ถ้าไม่ได้ตั้ง key จะใช้ uuid4 แบบเดิม
+# ตั้ง key แยกสาขาไว้ ลิงก์ของสาขาหนึ่งจะใช้กับ ?shop= ของอีกสาขาไม่ได้
+# [token_signing]
+# key = "..."
+# ttl_days = 90
+@st.cache_resource
+def get_token_signer(tenant_key):
+    return signer_from_secrets(get_tenant(tenant_key).conf)
+
+def new_token(amount):
+    signer = get_token_signer(tenant.key)
+    return signer.issue(amount) if signer is not None else str(uuid.uuid4())
+
+# 🛠️ ตัวส่ง LINE ใช้ร่วมกันทั้งโปรเซส (connection pool + timeout + จำโควตา + X-Line-Retry-Key กันโพสต์ซ้ำ)
+# [line_messaging]
+# channel_access_token = "..."
+# group_id = "..."
+@st.cache_resource
+def get_line_notifier(tenant_key):
+    line_conf = get_tenant(tenant_key).section("line_messaging")
+    if not line_conf:
+        return None
+    return LineNotifier(
+        line_conf["channel_access_token"],
+        line_conf["group_id"],
+        api_base=line_conf.get("api_base", LINE_API),
+    )
+
+def build_line_message(p):
+    return (
+        f"🔔 **ลูกค้ากรอกฟอร์มสำเร็จ**\n"
+        f"━━━━━━━━━━━━━━━━━━━━\n"
+        f"👤 ชื่อ: {p['c_name_final']}\n"
+        f"🆔 Tax ID: {p['fixed_tax_val']}\n"
+        f"🏠 ที่อยู่: {p['final_addr1']} {p['final_addr2']}\n"
+        f"📞 โทร: {p['cl_phone']}\n"
+        f"💰 ยอด: {p['c_price']:,.2f} บาท\n"
+        f"📦 รายการ: {p['c_item']}\n"
+        f"⏰ เวลา: {p['ts']}\n"
+        f"━━━━━━━━━━━━━━━━━━━━"
+    )
+
+# ==========================================
+# 📮 Outbox: เขียนข้อมูลเบื้องหลัง (ลูกค้าไม่ต้องรอ Google Sheets / LINE)
+# ==========================================
+# [outbox]
+# path = "data/outbox.jsonl"
+@st.cache_resource
+def get_outbox(tenant_key):
+    storage = get_storage(tenant_key)
+    notifier = get_line_notifier(tenant_key)
+
+    # ขั้นที่ไม่ต้องรอกันทำพร้อมกัน: Queue (จุด commit) คู่กับ Customers แล้วค่อยปิด Token + ส่ง LINE หลัง Queue สำเร็จ
+    # 1. บันทึกเข้า Tab Queue (เพิ่ม token เข้าไปเป็นคอลัมน์ที่ 11)
+    def step_queue(p, retry):
+        if retry and storage.queue_has_token(p['token']):
+            return  # ครั้งก่อนเขียนสำเร็จไปแล้ว
+        status = "Pending"
+        if p.get('offline'):
+            # 📴 รับมาตอนออฟไลน์ (ตรวจกับสำเนาในเครื่อง) เช็คกับ TokenDB จริงก่อน ถ้าถูกใช้ที่อื่นไปแล้วไม่ให้ออกใบกำกับซ้ำ
+            sheet_status, holder = storage.token_claim(p['token'])
+            if sheet_status != 'Active' and holder != p.get('claim'):
+                status = QUEUE_CONFLICT
+        storage.append_queue([p['ts'], p['c_name_final'], p['fixed_tax_val'], p['final_addr1'], p['final_addr2'], p['cl_phone'], p['c_item'], 1, p['c_price'], status, p['token']])
+
+    # 2. บันทึก Tab Customers
+    def step_customer(p, retry):
+        storage.upsert_customer([p['c_name_final'], p['fixed_tax_val'], p['final_addr1'], p['final_addr2'], p['cl_phone']])
+
+    # 3. ปิด Token หลังเขียน Queue แล้วเท่านั้น (จองไว้แล้วตอนกดส่ง ตรงนี้เขียน Used ลงชีตครั้งเดียวด้วยแถวที่จำไว้)
+    def step_token(p, retry):
+        try:
+            storage.redeem_token(p['token'], claim=p.get('claim'))
+        except (TokenConflictError, LookupError):
+            # token ถูกใช้ไปแล้วโดยงานอื่น (ส่วนใหญ่มาจากช่วงออฟไลน์) หรือถูกย้ายไปเก็บถาวรแล้ว
+            # เปลี่ยนแถว Queue ของงานนี้เป็น Conflict (ไม่ออกใบกำกับ / ไม่นับยอดขาย) แล้วแจ้งให้พนักงานตรวจ
+            METRICS.inc("token_conflicts_total", offline=str(bool(p.get('offline'))))
+            print(f"Token redeemed twice: {p['token']} (sig {p['sig']})")
+            storage.set_queue_status(p['token'], QUEUE_CONFLICT, ts=p['ts'])
+            if notifier is not None:
+                notifier.push(f"⚠️ QR Code ถูกใช้ซ้ำ: {p['c_name_final']} ยอด {p['c_price']:,.2f} บาท (token {p['token'][:8]}…) กรุณาตรวจสอบก่อนออกใบกำกับภาษี",
+                              key=f"{idempotency_key(p['sig'])}/conflict")
+
+    # 4. ส่ง LINE (แจ้งเฉพาะรายการที่อยู่ใน Queue แล้ว) รอจน LINE ตอบรับก่อนจดว่าเสร็จ ส่งไม่ได้ outbox ลองใหม่ให้
+    def step_line(p, retry):
+        if notifier is not None:
+            notifier.push(build_line_message(p), key=f"{idempotency_key(p['sig'])}/line")
+
+    outbox_conf = get_tenant(tenant_key).section("outbox")
+    snapshot = getattr(storage, "token_snapshot", None)
+    outbox = Outbox(
+        outbox_conf.get("path", "data/outbox.jsonl"),
+        online=(lambda: snapshot.online) if snapshot is not None else None,
+        steps=[
+            ("queue", step_queue),
+            ("customer", step_customer),
+            ("token", step_token, ["queue"]),
+            ("line", step_line, ["queue"]),
+        ],
+    )
+    # งานที่ค้างจากรอบก่อน ให้จอง token ไว้เหมือนเดิม กันลิงก์ถูกใช้ซ้ำระหว่างรอเขียน
+    for entry in outbox.pending():
+        try:
+            storage.reserve_token(entry.payload['token'])
+        except Exception:
+            pass
+    if snapshot is not None:
+        snapshot.on_reconnect(outbox.wake)  # กลับมาออนไลน์ ส่งงานที่รับไว้ตอนออฟไลน์ทันที
+    return outbox.start()
+
+
+# 🛠️ ใช้ไฟล์รหัสไปรษณีย์ในเครื่อง (data/thai_postcodes.bin) แทนการโหลดจาก GitHub ทุกครั้ง (ใช้ร่วมกันทุกสาขา)
+@st.cache_resource
+def load_postcode_index():
+    with METRICS.timer("file", "load_postcode_index"):
+        return PostcodeIndex()
+
+# 🏠 ตัวแยกที่อยู่เก่าของลูกค้า (เทียบกับฐานข้อมูลรหัสไปรษณีย์ชุดเดียวกัน ใช้ร่วมกันทุกสาขา)
+@st.cache_resource
+def get_address_parser():
+    with METRICS.timer("file", "build_address_parser"):
+        return address_parser.AddressParser(load_postcode_index())
+
+# 📈 ภาพรวมร้านหน้าแอดมิน: ผลรวมอยู่ในหน่วยความจำ อ่าน Queue / TokenDB เพิ่มเฉพาะแถวใหม่ (ดู dashboard.py)
+# [dashboard]
+# refresh_interval = 30
+# history_days = 400
+@st.cache_resource
+def get_dashboard(tenant_key):
+    return dashboard.dashboard_from_conf(get_sheet_registry(tenant_key), get_tenant(tenant_key).section("dashboard"))
+
+# 📊 เขียนตัวเลข Diagnostics ลงไฟล์ JSON เป็นระยะ (ถ้าตั้งค่าไว้)
+# [metrics]
+# dump_path = "data/metrics.json"
+# dump_interval = 60
+@st.cache_resource
+def start_metrics_dump():
+    metrics_conf = st.secrets.get("metrics", {})
+    if not metrics_conf.get("dump_path"):
+        return None
+    return METRICS.start_json_dump(metrics_conf["dump_path"], metrics_conf.get("dump_interval", 60))
 
-# 🛠️ เพิ่มระบบ Retry เพื่อป้องกัน API Error จนทำให้ไม่ได้อัปเดตสถานะ
-def mark_token_as_used(token_str):
-    import time
-    max_retries = 2
-    for attempt in range(max_retries):
+# 🔥 เปิดแอปครั้งแรก (cold start) เตรียมรหัสไปรษณีย์ / ที่เก็บข้อมูล / Google Sheets ใน thread เบื้องหลัง
+# ระหว่างที่หน้าฟอร์มกำลังแสดง (ฟังก์ชัน cache_resource ด้านบนรอกันเองถ้ามีคนเรียกพร้อมกัน ไม่โหลดซ้ำ)
+@st.cache_resource
+def start_warmup(tenant_key):
+    def warm():
         try:
-            clean_token = str(token_str).strip().replace("/", "")
-            client = get_sheet_connection()
-            sheet_token = client.open("Invoice_Data").worksheet("TokenDB")
-            cell = sheet_token.find(clean_token, in_column=1)
-            if cell: 
-                sheet_token.update_cell(cell.row, 3, "Used")
-            return True
+            with METRICS.timer("app", "warmup", step="postcodes"):
+                load_postcode_index()
+                get_address_parser()
+            with METRICS.timer("app", "warmup", step="storage"):
+                storage = get_storage(tenant_key)
+            if isinstance(storage, SheetsStorage):
+                with METRICS.timer("app", "warmup", step="sheets"):
+                    get_sheet_registry(tenant_key).resolve("TokenDB")
+                    customer_index = storage.customer_index  # ต้องกำหนดให้ตัวแปร (บรรทัดที่มีแค่ค่า Streamlit จะ st.write ลงหน้าจอ)
         except Exception as e:
-            time.sleep(1)
-            if attempt == max_retries - 1:
-                print(f"Failed to mark token as used: {e}")
-                return False
+            print(f"Warm-up failed: {e}")  # หน้าฟอร์มจะลองใหม่และแสดง error ให้เอง
 
-# 🛠️ เพิ่มการเช็คโควตาข้อความ LINE ป้องกันส่งไม่ไปเพราะเต็ม
-def send_line_message(message_text):
-    try:
-        if "line_messaging" in st.secrets:
-            token = st.secrets["line_messaging"]["channel_access_token"]
-            target_id = st.secrets["line_messaging"]["group_id"]
-            
-            # เช็คโควตาของเดือนนี้ก่อน (เพื่อความปลอดภัยและแจ้งเตือนแอดมิน)
-            quota_url = 'https://api.line.me/v2/bot/message/quota/consumption'
-            headers = {'Authorization': 'Bearer ' + token}
-            try:
-                quota_res = requests.get(quota_url, headers=headers)
-                if quota_res.status_code == 200:
-                    usage = quota_res.json().get('totalUsage', 0)
-                    if usage >= 190:
-                        st.warning(f"⚠️ [ระบบแจ้งแอดมิน] โควตา LINE API ของเดือนนี้ใกล้เต็มแล้ว (ใช้ไป {usage}/200) ข้อความอาจจะไม่แจ้งเตือนในกลุ่ม")
-            except:
-                pass # ถ้าเช็คโควตาไม่ได้ ก็ปล่อยผ่านไปส่งข้อความเลย
-
-            # ส่งข้อความ
-            url = 'https://api.line.me/v2/bot/message/push'
-            headers = {'Content-Type': 'application/json', 'Authorization': 'Bearer ' + token}
-            payload = {"to": target_id, "messages": [{"type": "text", "text": message_text}]}
-            res = requests.post(url, headers=headers, data=json.dumps(payload))
-            if res.status_code != 200:
-                print(f"LINE API Error: {res.text}")
-    except Exception as e: 
-        print(f"LINE Send Exception: {e}")
-
-def fix_phone_number(phone_val):
-    if pd.isna(phone_val) or str(phone_val).strip() == "": return ""
-    s = str(phone_val).replace("'", "").replace(",", "").replace("-", "").strip()
-    if s.isdigit() and len(s) == 9: return "0" + s
-    return s
-
-def fix_tax_id(tax_val):
-    s = str(tax_val).strip().replace("-", "").replace(" ", "").replace("'", "")
-    if s.endswith(".0"): s = s[:-2]
-    if s.isdigit() and len(s) < 13: s = s.zfill(13)
-    return s
-
-@st.cache_data
-def load_thai_address_data():
-    try:
-        url = "https://raw.githubusercontent.com/earthchie/jquery.Thailand.js/master/jquery.Thailand.js/database/raw_database/raw_database.json"
-        data = pd.read_json(url)
-        return data
-    except:
-        return pd.DataFrame()
-
-def smart_clean_address(addr1, addr2):
-    house = str(addr1)
-    dist = ""
-    prov = str(addr2)
-    match_amp = re.search(r'(เขต|อำเภอ|อ\.)\s*([^\s]+)', prov)
-    if match_amp:
-        extracted = match_amp.group(0)
-        dist += extracted + " "
-        prov = prov.replace(extracted, "").strip()
-    match_tum = re.search(r'(แขวง|ตำบล|ต\.)\s*([^\s]+)', house)
-    if match_tum:
-        extracted = match_tum.group(0)
-        dist = extracted + " " + dist
-        house = house.replace(extracted, "").strip()
-    return house.strip(), dist.strip(), prov.strip()
+    thread = threading.Thread(target=warm, name=f"warmup-{tenant_key}", daemon=True)
+    add_script_run_ctx(thread, get_script_run_ctx())
+    thread.start()
+    return thread
 
 # ==========================================
 # 🎮 Main Logic
@@ -203,29 +344,84 @@ token_from_url = query_params.get("token", None)
 if isinstance(token_from_url, list) and len(token_from_url) > 0:
     token_from_url = token_from_url[0]
 
+start_metrics_dump()
+
+# 📈 วาดใหม่เฉพาะส่วนนี้ตอนเปลี่ยนช่วงเวลา / กดอัปเดต (ไม่รันหน้าแอดมินทั้งหน้าใหม่)
+DASHBOARD_RANGES = {"วันนี้": 0, "7 วัน": 6, "30 วัน": 29, "1 ปี": 364}
+
+@st.fragment
+def admin_dashboard():
+    storage_conf = tenant.section("storage")
+    if storage_conf.get("backend", "sheets") == "sqlite" and not storage_conf.get("mirror_to_sheets", False):
+        st.info("ภาพรวมใช้ข้อมูลจาก Google Sheets (ที่เก็บข้อมูลนี้ไม่ได้ส่งต่อไป Google Sheets)")
+        return
+    dash = get_dashboard(tenant.key)
+    today = datetime.now(pytz.timezone('Asia/Bangkok')).date()
+    col_range, col_refresh = st.columns([3, 1])
+    span = col_range.radio("ช่วงเวลา", list(DASHBOARD_RANGES), horizontal=True, label_visibility="collapsed")
+    force = col_refresh.button("🔄 อัปเดต", use_container_width=True)
+    with st.spinner("กำลังโหลดข้อมูล..."):
+        dash.refresh(today, force=force)
+    if dash.updated_at is None:
+        st.warning(f"⚠️ โหลดข้อมูลไม่สำเร็จ: {dash.last_error or 'โควตา Google Sheets ไม่พอ ลองใหม่อีกครั้ง'}")
+        return
+
+    totals = dash.totals()
+    start = today - timedelta(days=DASHBOARD_RANGES[span])
+    revenue = totals.daily("revenue_day", start, today)
+    orders = sum(n for _, n in totals.daily("orders_day", start, today))
+    created = totals.daily("created_day", start, today)
+    used = totals.daily("used_day", start, today)
+    created_total, used_total = sum(n for _, n in created), sum(n for _, n in used)
+
+    col_sales, col_orders, col_pending, col_rate = st.columns(4)
+    col_sales.metric("ยอดขาย (บาท)", f"{sum(v for _, v in revenue):,.2f}")
+    col_orders.metric("จำนวนรายการ", f"{orders:,}")
+    col_pending.metric("รอออกใบกำกับ", f"{totals.pending:,}", f"{totals.pending_amount:,.2f} บาท", delta_color="off")
+    col_rate.metric("QR ที่ถูกใช้", f"{used_total / created_total:.0%}" if created_total else "-",
+                    f"{used_total:,}/{created_total:,} ใบ", delta_color="off")
+    if span != "วันนี้":
+        st.bar_chart({"วันที่": [d for d, _ in revenue], "ยอดขาย": [round(v, 2) for _, v in revenue]}, x="วันที่", y="ยอดขาย")
+    hourly = totals.hourly(start, today)
+    st.caption("ยอดขายตามชั่วโมง" + ("" if span == "วันนี้" else " (รวมทั้งช่วง)"))
+    st.bar_chart({"ชั่วโมง": [h for h, _ in hourly], "ยอดขาย": [round(v, 2) for _, v in hourly]}, x="ชั่วโมง", y="ยอดขาย")
+    if span != "วันนี้":
+        st.caption("QR ที่สร้าง / ถูกใช้ (ตามวันที่สร้าง)")
+        st.bar_chart({"วันที่": [d for d, _ in created], "สร้าง": [n for _, n in created], "ใช้แล้ว": [n for _, n in used]},
+                     x="วันที่", y=["สร้าง", "ใช้แล้ว"], stack=False)
+    age = time.time() - dash.updated_at
+    st.caption(f"อัปเดต {age:,.0f} วินาทีก่อน"
+               + (f" | ⚠️ QR ใช้ซ้ำรอตรวจ {totals.conflicts} รายการ" if totals.conflicts else "")
+               + (f" | ⚠️ อัปเดตล่าสุดไม่สำเร็จ: {dash.last_error}" if dash.last_error else ""))
+
 # --- Admin Section ---
 if not token_from_url:
     st.title("🔒 ระบบจัดการร้าน Nami")
-    st.info("หน้านี้สำหรับเจ้าของร้านเท่านั้น")
+    st.info("หน้านี้สำหรับเจ้าของร้านเท่านั้น" if tenant.single else f"หน้านี้สำหรับเจ้าของร้านเท่านั้น ({tenant.name})")
     with st.expander("🔑 เข้าสู่ระบบสร้าง QR Code", expanded=True):
         pwd = st.text_input("ใส่รหัสผ่าน", type="password")
-        if pwd == ADMIN_PASSWORD:
+        if pwd and pwd == tenant.admin_password:
             st.success("ยินดีต้อนรับครับ!")
+            notifier = get_line_notifier(tenant.key)
+            if notifier is not None and notifier.near_quota():
+                st.warning(f"⚠️ [ระบบแจ้งแอดมิน] โควตา LINE API ของเดือนนี้ใกล้เต็มแล้ว (ใช้ไป {notifier.usage()}/{notifier.quota_limit}) ข้อความอาจจะไม่แจ้งเตือนในกลุ่ม")
+            st.markdown("---")
+            st.subheader("ภาพรวมร้าน")
+            admin_dashboard()
+
             st.markdown("---")
             st.subheader("สร้าง QR รับเงิน")
             gen_amount = st.number_input("ยอดเงินที่ต้องการ (บาท)", min_value=1.0, step=1.0)
             if st.button("✨ สร้าง QR Code และ ลิงก์"):
                 try:
-                    token = str(uuid.uuid4())
-                    client = get_sheet_connection()
-                    sheet_token = client.open("Invoice_Data").worksheet("TokenDB")
+                    import qrcode  # ใช้เฉพาะหน้าแอดมิน ไม่ต้องโหลด PIL ตอนลูกค้าเปิดฟอร์ม
+                    from io import BytesIO
+
+                    token = new_token(gen_amount)
                     ts = datetime.now(pytz.timezone('Asia/Bangkok')).strftime("%Y-%m-%d %H:%M:%S")
+                    get_storage(tenant.key).create_token(token, gen_amount, ts)
                     
-                    # 🛠️ แก้ไข: เปลี่ยนจาก append_row เป็น insert_row บังคับแทรกที่บรรทัดที่ 2 เสมอ เพื่อป้องกันการ Overwrite
-                    sheet_token.insert_row([token, gen_amount, "Active", ts], index=2)
-                    
-                    base_url = "https://nami-invoice-app.streamlit.app" 
-                    final_url = f"{base_url}/?token={token}"
+                    final_url = tenant.link(token)
                     qr = qrcode.make(final_url)
                     buf = BytesIO()
                     qr.save(buf)
@@ -237,260 +433,243 @@ if not token_from_url:
                         st.warning("🔗 **ลิงก์สำหรับส่งให้ลูกค้า**")
                         st.code(final_url, language=None)
                 except Exception as e: st.error(f"เกิดข้อผิดพลาด: {e}")
-    st.stop()
 
-# --- Customer Validation ---
-token_data = check_token_status(token_from_url)
-locked_amount = 0.0
+            # 🖨️ โหมดสร้างหลายใบ (สำหรับพิมพ์ใบเสร็จล่วงหน้า)
+            st.markdown("---")
+            st.subheader("สร้าง QR หลายใบพร้อมกัน")
+            st.caption("ใส่ยอดเงินบรรทัดละ 1 ยอด หรือ \"ยอดxจำนวนใบ\" เช่น 150x20 หรือ 1,200x3 (จุลภาคใช้คั่นหลักพันเท่านั้น) หรืออัปโหลดไฟล์ CSV สองคอลัมน์ \"ยอด,จำนวนใบ\"")
+            batch_text = st.text_area("รายการยอดเงิน", placeholder="150\n250x10\n1,200")
+            batch_file = st.file_uploader("หรือไฟล์ CSV", type=["csv", "txt"])
+            if st.button("🖨️ สร้าง QR ทั้งหมด"):
+                try:
+                    source = batch_file.getvalue().decode("utf-8-sig") if batch_file else batch_text
+                    amounts = qr_batch.parse_amounts(source, csv_file=batch_file is not None)
+                    if not amounts:
+                        st.error("ไม่พบยอดเงินที่ถูกต้อง")
+                    else:
+                        with st.spinner(f"กำลังสร้าง {len(amounts)} ใบ..."):
+                            ts = datetime.now(pytz.timezone('Asia/Bangkok')).strftime("%Y-%m-%d %H:%M:%S")
+                            tokens = [(new_token(amount), amount, ts) for amount in amounts]
+                            get_storage(tenant.key).create_tokens(tokens)
+                            urls = [tenant.link(token) for token, _, _ in tokens]
+                            pngs = qr_batch.render_batch(urls)
+                            items = [(token, amount, url, png) for (token, amount, _), url, png in zip(tokens, urls, pngs)]
+                            st.session_state['qr_batch'] = {
+                                "count": len(items),
+                                "zip": qr_batch.build_zip(items),
+                                "pdf": qr_batch.build_pdf(items),
+                                "name": ts.replace(" ", "_").replace(":", ""),
+                            }
+                except Exception as e: st.error(f"เกิดข้อผิดพลาด: {e}")
 
-if token_data is not None:
-    if token_data['Status'] == 'Active':
-        locked_amount = float(token_data['Amount'])
-    elif token_data['Status'] == 'Used':
-        st.error("❌ QR Code หรือลิงก์นี้ถูกใช้งานไปแล้ว")
-        st.stop()
-else:
-    st.error("❌ รหัสไม่ถูกต้อง หรือไม่พบในระบบ")
-    st.stop()
+            batch = st.session_state.get('qr_batch')
+            if batch:
+                st.success(f"✅ สร้างแล้ว {batch['count']} ใบ")
+                col_zip, col_pdf = st.columns(2)
+                col_zip.download_button("⬇️ ZIP (PNG)", batch["zip"], file_name=f"qr_{batch['name']}.zip", mime="application/zip", use_container_width=True)
+                col_pdf.download_button("⬇️ PDF สำหรับพิมพ์", batch["pdf"], file_name=f"qr_{batch['name']}.pdf", mime="application/pdf", use_container_width=True)
 
-# ==========================================
-# 📝 ส่วนฟอร์มลูกค้า (Customer App)
-# ==========================================
-st.title("🧾 ขอใบกำกับภาษี")
-st.success(f"💰 ยอดชำระ: {locked_amount:,.2f} บาท")
-st.markdown("---")
+            # 🧾 ออกใบกำกับภาษีของรายการที่ค้าง (Pending) ในแท็บ Queue ทีเดียวทั้งหมด
+            st.markdown("---")
+            st.subheader("ออกใบกำกับภาษี")
+            st.caption("สร้าง PDF จากรายการ Pending ในแท็บ Queue แล้วเปลี่ยนสถานะเป็น Invoiced (ตั้งค่าฟอนต์/ข้อมูลร้านใน secrets หัวข้อ [invoice])")
+            if st.button("🧾 ออกใบกำกับภาษีทั้งหมด"):
+                try:
+                    with st.spinner("กำลังสร้างใบกำกับภาษี..."):
+                        registry = get_sheet_registry(tenant.key)
+                        invoice_conf = tenant.section("invoice")
+                        # เก็บ PDF ลงดิสก์ก่อนเปลี่ยนสถานะเป็น Invoiced (session หลุดก็ยังมีไฟล์ใบที่ออกไปแล้ว)
+                        out_dir = invoice_conf.get("out_dir", "data/invoices")
+                        results = invoice_pipeline.run_batch(registry.worksheet("Queue"), invoice_conf,
+                                                             row_offset=retention.queue_offset(registry), out_dir=out_dir)
+                    if not results:
+                        st.info("ไม่มีรายการที่รอออกใบกำกับภาษี")
+                    else:
+                        ts = datetime.now(pytz.timezone('Asia/Bangkok')).strftime("%Y-%m-%d %H:%M:%S")
+                        st.session_state['invoice_batch'] = {
+                            "count": len(results),
+                            "out_dir": out_dir,
+                            "zip": invoice_pipeline.build_zip(results),
+                            "name": ts.replace(" ", "_").replace(":", ""),
+                        }
+                except FileNotFoundError as e:
+                    st.session_state.pop('invoice_batch', None)
+                    st.error(f"❌ {e} (ยังไม่ได้เปลี่ยนสถานะรายการใดเลย)")
+                except Exception as e: st.error(f"เกิดข้อผิดพลาด: {e}")
+
+            invoices = st.session_state.get('invoice_batch')
+            if invoices:
+                st.success(f"✅ ออกใบกำกับภาษีแล้ว {invoices['count']} ใบ (เก็บไฟล์ไว้ที่ {invoices['out_dir']})")
+                st.download_button("⬇️ ZIP (PDF แยกใบ + ไฟล์รวมสำหรับพิมพ์)", invoices["zip"], file_name=f"invoices_{invoices['name']}.zip", mime="application/zip")
+
+            # 🗄️ ย้าย token ที่ใช้แล้ว/หมดอายุ และรายการที่ออกใบกำกับแล้ว ไปแท็บเก็บถาวรรายเดือน (แท็บหลักจะเล็กและค้นเร็ว)
+            st.markdown("---")
+            st.subheader("เก็บข้อมูลเก่าถาวร")
+            st.caption("ย้ายข้อมูลเก่ากว่า keep_days วันออกจาก TokenDB / Queue ไปแท็บรายเดือน (ตั้งค่าใน secrets หัวข้อ [retention]) ควรกดหลังออกใบกำกับภาษีแล้ว")
+            if st.button("🗄️ ย้ายข้อมูลเก่าไปเก็บถาวร"):
+                try:
+                    with st.spinner("กำลังย้ายข้อมูล..."):
+                        summary = get_storage(tenant.key).archive_old_rows(tenant.section("retention"))
+                    if summary is None:
+                        st.info("ที่เก็บข้อมูลนี้ไม่ได้ใช้ Google Sheets")
+                    elif not (summary['tokens'] or summary['queue']):
+                        st.info("ไม่มีข้อมูลที่ต้องย้าย")
+                    else:
+                        st.success(f"✅ ย้าย token {summary['tokens']} รายการ และคิว {summary['queue']} แถว ไปที่ {', '.join(summary['archives'])}")
+                except Exception as e: st.error(f"เกิดข้อผิดพลาด: {e}")
 
+            # 📊 ดูเวลาตอบสนอง / จำนวนครั้งที่เรียก Google Sheets และ LINE ของโปรเซสนี้
+            st.markdown("---")
+            with st.expander("📊 Diagnostics"):
+                snap = METRICS.snapshot()
+                col_up, col_r, col_w = st.columns(3)
+                col_up.metric("Uptime (นาที)", f"{snap['uptime_s'] / 60:,.1f}")
+                col_r.metric("Sheets อ่าน/นาที", snap['sheets_reads_per_min'])
+                col_w.metric("Sheets เขียน/นาที", snap['sheets_writes_per_min'])
+                try:
+                    outbox = get_outbox(tenant.key)
+                    st.caption(f"📮 Outbox ค้างส่ง {len(outbox.pending())} รายการ, ส่งไม่สำเร็จ {len(outbox.dead_letters())} รายการ")
+                    recent = outbox.recent()
+                    if recent:
+                        # ผลของแต่ละขั้นในงานล่าสุด (ok / failed / skipped และเวลาที่ใช้)
+                        st.dataframe([
+                            {"งาน": key[:8], "เวลา": datetime.fromtimestamp(created, pytz.timezone('Asia/Bangkok')).strftime("%H:%M:%S"),
+                             **{name: f"{r.status} {r.seconds * 1000:,.0f} ms" for name, r in results.items()}}
+                            for key, created, results in recent
+                        ], use_container_width=True, hide_index=True)
+                except Exception as e:
+                    st.caption(f"📮 Outbox ใช้งานไม่ได้: {e}")
+                mirror = getattr(get_storage(tenant.key), "mirror", None)
+                if mirror is not None:
+                    st.caption(f"🔁 ส่งต่อ Google Sheets ค้าง {mirror.pending()} รายการ, ส่งไม่สำเร็จ {len(mirror.dead_letters())} รายการ")
+                snapshot = get_token_snapshot(tenant.key)
+                if snapshot is not None:
+                    age = snapshot.age()
+                    st.caption(f"🛰️ สำเนา token ในเครื่อง {len(snapshot):,} รายการ, "
+                               + ("ออนไลน์" if snapshot.online else f"📴 ออฟไลน์ ({snapshot.last_error})")
+                               + (f", sync ล่าสุด {age:,.0f} วินาทีก่อน" if age is not None else ", ยังไม่เคย sync"))
+                try:
+                    quota = get_sheet_registry(tenant.key).scheduler.stats()
+                    st.caption("🚦 คิว Google Sheets: " + " | ".join(
+                        f"{kind} รอ {q['waiting']} งาน, โควตาคงเหลือ {q['tokens']}, อัตรา {q['per_minute']}/นาที" for kind, q in quota.items()))
+                except Exception as e:
+                    st.caption(f"🚦 คิว Google Sheets ใช้งานไม่ได้: {e}")
+                if snap['timers']:
+                    st.dataframe(snap['timers'], use_container_width=True, hide_index=True)
+                if snap['counters']:
+                    st.dataframe(snap['counters'], use_container_width=True, hide_index=True)
+                prom_text = METRICS.to_prometheus()
+                st.download_button("⬇️ Prometheus (metrics.txt)", prom_text, file_name="metrics.txt", mime="text/plain")
+                st.code(prom_text, language=None)
+    st.stop()
+
+# --- Customer Validation ---
 if 'last_submitted_id' not in st.session_state:
     st.session_state['last_submitted_id'] = ""
 if 'submit_success' not in st.session_state:
     st.session_state['submit_success'] = False
 
-# ==========================================
-# สร้างฟังก์ชันจำไฟล์ชีต เพื่อไม่ให้ดึงข้อมูลซ้ำรัวๆ
-# ==========================================
-@st.cache_resource
-def get_worksheets():
-    client_conn = get_sheet_connection()
-    db = client_conn.open("Invoice_Data").worksheet("Customers")
-    queue = client_conn.open("Invoice_Data").worksheet("Queue")
-    return db, queue
-
-# โหลด Database
-try:
-    sheet_db, sheet_queue = get_worksheets()
-    thai_db = load_thai_address_data() 
-except Exception as e:
-    st.error(f"เชื่อมต่อฐานข้อมูลไม่ได้ กรุณาแจ้งพนักงาน (ระบบแจ้งว่า: {e})")
+# ส่งสำเร็จแล้ว token จะกลายเป็น Used ไม่ต้องถามชีตอีก แสดงหน้าขอบคุณแทนข้อความ "ถูกใช้งานไปแล้ว"
+if st.session_state['submit_success'] and st.session_state.get('submitted_token') == token_from_url:
+    st.title("🧾 ขอใบกำกับภาษี")
+    st.success("🎉 บันทึกข้อมูลเรียบร้อย! ขอบคุณที่ใช้บริการครับ")
+    st.balloons()
     st.stop()
 
-# ตัวแปรสำหรับเก็บค่าที่จะแสดงในฟอร์ม
-val_name = ""
-val_addr1_full = ""
-val_addr2 = ""
-val_phone = ""
-val_dist_clean = "" 
-
-# --------------------------------------------------------
-# ส่วนที่ 1: ค้นหา Tax ID
-# --------------------------------------------------------
-st.header("1️⃣ ค้นหาข้อมูลเก่า")
-col_s1, col_s2 = st.columns([3, 1])
-
-with col_s1:
-    search_taxid = st.text_input("เลขผู้เสียภาษี 13 หลัก", max_chars=13, placeholder="พิมพ์เลข 13 หลักตรงนี้...")
-with col_s2:
-    st.write("")
-    st.write("")
-    btn_search = st.button("🔍 กดค้นหา", use_container_width=True)
-
-if (len(search_taxid) == 13) or btn_search:
+# 🔏 ตรวจลายเซ็น / วันหมดอายุในเครื่องก่อน ลิงก์ที่พิมพ์ผิด / ปลอม / หมดอายุ ไม่ต้องถาม Google Sheets
+claims = None
+signer = get_token_signer(tenant.key)
+if signer is not None:
     try:
-        data = sheet_db.get_all_records()
-        df = pd.DataFrame(data)
-        if 'TaxID' in df.columns:
-            search_key = fix_tax_id(search_taxid)
-            df['TaxID_Clean'] = df['TaxID'].apply(fix_tax_id)
-            res = df[df['TaxID_Clean'] == search_key]
-            
-            if not res.empty: 
-                found_cust = res.iloc[0]
-                st.info(f"✅ พบข้อมูลเดิมของ: {found_cust['Name']}")
-                
-                val_name = found_cust['Name'] 
-                val_name_clean = re.sub(r'\s*\(สำนักงานใหญ่\)$', '', val_name)
-                val_name_clean = re.sub(r'\s*\(สาขา.*?\)$', '', val_name_clean)
-                val_name = val_name_clean
-
-                raw_addr1 = found_cust['Address1']
-                raw_addr2 = found_cust['Address2']
-                val_phone = fix_phone_number(found_cust['Phone'])
-                val_addr1_full, val_dist_clean, val_addr2 = smart_clean_address(raw_addr1, raw_addr2)
-            else:
-                st.caption("ℹ️ ไม่พบข้อมูลเก่า (กรอกใหม่ด้านล่าง)")
-    except Exception as e: 
-        st.error(f"ระบบค้นหาขัดข้อง: {e}")
-
-st.markdown("---")
-
-# --------------------------------------------------------
-# ส่วนที่ 2: ค้นหาที่อยู่ด้วยรหัสไปรษณีย์
-# --------------------------------------------------------
-st.header("2️⃣ ค้นหาที่อยู่ (ด้วยรหัสไปรษณีย์)")
-st.caption("ไม่ต้องพิมพ์ยาว! แค่ใส่รหัสไปรษณีย์ ระบบจะเติมตำบล/อำเภอ/จังหวัด ให้เองครับ")
-
-col_z1, col_z2 = st.columns([3, 1])
-with col_z1:
-    input_zip = st.text_input("รหัสไปรษณีย์ 5 หลัก", max_chars=5, placeholder="เช่น 11120", key="zip_input")
-with col_z2:
-    st.write("")
-    st.write("")
-    btn_zip = st.button("🚀 ค้นหา", use_container_width=True)
-
-display_sub_district = val_dist_clean 
-display_province = val_addr2
-
-if (len(input_zip) == 5 and not thai_db.empty) or btn_zip:
-    if len(input_zip) == 5:
-        thai_db['zipcode'] = thai_db['zipcode'].astype(str)
-        results = thai_db[thai_db['zipcode'] == input_zip]
-        
-        if not results.empty:
-            options = []
-            for index, row in results.iterrows():
-                if "กรุงเทพ" in row['province']:
-                    label = f"แขวง{row['district']} > เขต{row['amphoe']} > {row['province']}"
-                else:
-                    label = f"ต.{row['district']} > อ.{row['amphoe']} > จ.{row['province']}"
-                options.append(label)
-            
-            with st.expander(f"✅ พบ {len(options)} พื้นที่ (กรุณากดเลือกแขวงและเขตของคุณในกล่องด้านล่าง)", expanded=True):
-                selected_option = st.selectbox(
-                    "กดที่นี่เพื่อเลือกตำบล/อำเภอ:", 
-                    options, 
-                    index=0, 
-                    label_visibility="visible"
-                )
-            
-            if selected_option:
-                parts = selected_option.split(" > ")
-                display_sub_district = f"{parts[0]} {parts[1]}"
-                display_province = f"{parts[2]} {input_zip}"
+        claims = signer.check(clean_token(token_from_url))
+    except InvalidToken as e:
+        METRICS.inc("token_rejected_total", reason=e.reason)
+        if e.reason == EXPIRED:
+            st.error("❌ QR Code หรือลิงก์นี้หมดอายุแล้ว กรุณาติดต่อพนักงาน")
         else:
-            st.warning("❌ ไม่พบรหัสไปรษณีย์นี้")
-    elif btn_zip and len(input_zip) < 5:
-        st.error("กรุณากรอกรหัสไปรษณีย์ให้ครบ 5 หลัก")
-
-st.markdown("---")
-
-# --------------------------------------------------------
-# ส่วนที่ 3: กรอกรายละเอียด (มีเลือกสาขา)
-# --------------------------------------------------------
-st.header("3️⃣ ตรวจสอบข้อมูลให้ครบถ้วน")
-
-c_name_raw = st.text_input("ชื่อลูกค้า / ชื่อบริษัท (ไม่ต้องใส่คำว่า สนญ. หรือ สาขา)", value=val_name, placeholder="ตัวอย่าง: บริษัท เอบีซี จำกัด")
-
-branch_type = st.radio(
-    "เลือกประเภทหน่วยงาน (เพื่อเติมท้ายชื่อให้ถูกต้อง):",
-    options=["(สำนักงานใหญ่)", "สาขา (ระบุเลข หรือ ชื่อสาขา)", "บุคคลธรรมดา (ไม่เติมท้ายชื่อ)"],
-    index=None,
-    horizontal=True
-)
-
-branch_suffix = "" 
-branch_input_val = ""
-
-if branch_type == "สาขา (ระบุเลข หรือ ชื่อสาขา)":
-    branch_input_val = st.text_input("ระบุเลขสาขา หรือ ชื่อสาขา", placeholder="เช่น 00001 หรือ บางนา (ไม่ต้องพิมพ์คำว่าสาขา)")
-    if branch_input_val:
-        clean_branch_name = branch_input_val.replace("สาขา", "").strip() 
-        branch_suffix = f" (สาขา {clean_branch_name})"
-elif branch_type == "(สำนักงานใหญ่)":
-    branch_suffix = " (สำนักงานใหญ่)"
-elif branch_type == "บุคคลธรรมดา (ไม่เติมท้ายชื่อ)":
-    branch_suffix = "" 
-
-if c_name_raw:
-    full_name_preview = f"{c_name_raw.strip()}{branch_suffix}"
-    st.info(f"📝 ชื่อที่จะปรากฏในใบกำกับภาษี: **{full_name_preview}**")
+            st.error("❌ รหัสไม่ถูกต้อง หรือไม่พบในระบบ")
+        st.stop()
 
-c_tax = st.text_input("เลขประจำตัวผู้เสียภาษี (ตรวจสอบความถูกต้อง)", value=search_taxid, max_chars=13)
-c_phone = st.text_input("เบอร์โทรศัพท์", value=val_phone)
+start_warmup(tenant.key)
 
-default_house_no = val_addr1_full
-c_house_no = st.text_input("🏠 เลขที่บ้าน / หมู่บ้าน / ถนน / ซอย", value=default_house_no, placeholder="เช่น 99/99 หมู่ 1 ซ.วัดกู้")
+st.title("🧾 ขอใบกำกับภาษี")
+amount_box = st.empty()
+if claims is not None:
+    # ยอดอยู่ในลายเซ็นแล้ว แสดงได้ทันที ถาม TokenDB แค่ว่ายัง Active อยู่หรือไม่
+    amount_box.success(f"💰 ยอดชำระ: {claims.amount:,.2f} บาท")
 
-col_a1, col_a2 = st.columns(2)
-with col_a1:
-    c_dist = st.text_input("ตำบล / อำเภอ", value=display_sub_district, placeholder="ระบบเติมให้อัตโนมัติ")
-with col_a2:
-    c_prov = st.text_input("จังหวัด / รหัสไปรษณีย์", value=display_province, placeholder="ระบบเติมให้อัตโนมัติ")
+token_data = check_token_status(token_from_url)
+locked_amount = 0.0
 
-st.markdown("---")
-c_item = st.text_input("รายการสินค้า", value="อาหาร เครื่องดื่ม และเบเกอรี่", disabled=True)
-c_price = st.number_input("ยอดเงินรวม (บาท)", value=locked_amount, disabled=True)
+if token_data is not None:
+    if token_data['Status'] == 'Active':
+        locked_amount = claims.amount if claims is not None else float(token_data['Amount'])
+        if token_data.get('Offline'):
+            st.warning("📴 ระบบฐานข้อมูลออนไลน์ขัดข้องชั่วคราว กรอกและส่งข้อมูลได้ตามปกติ ระบบจะบันทึกให้อัตโนมัติเมื่อกลับมาออนไลน์")
+    elif token_data['Status'] == 'Used':
+        st.error("❌ QR Code หรือลิงก์นี้ถูกใช้งานไปแล้ว")
+        st.stop()
+    else:
+        st.error("❌ QR Code หรือลิงก์นี้หมดอายุแล้ว กรุณาติดต่อพนักงาน")
+        st.stop()
+else:
+    st.error("❌ รหัสไม่ถูกต้อง หรือไม่พบในระบบ")
+    st.stop()
 
 # ==========================================
 # 🟢 ฟังก์ชันบันทึกข้อมูล (Save Logic - Fixed Version)
 # ==========================================
-# 🛠️ รับพารามิเตอร์ current_token เพิ่มเติม
+# 🛠️ รับพารามิเตอร์ current_token เพิ่มเติม คืน True เมื่อบันทึกสำเร็จ
 def save_data_to_system(ts, c_name_final, fixed_tax_val, final_addr1, final_addr2, cl_phone, c_item, c_price, sig, current_token):
-    is_queue_saved = False
-    
-    # 1. บันทึกเข้า Tab Queue (เพิ่ม current_token เข้าไปเป็นคอลัมน์ที่ 11)
+    payload = {
+        "ts": ts,
+        "c_name_final": c_name_final,
+        "fixed_tax_val": fixed_tax_val,
+        "final_addr1": final_addr1,
+        "final_addr2": final_addr2,
+        "cl_phone": str(cl_phone),
+        "c_item": c_item,
+        "c_price": c_price,
+        "sig": sig,
+        "token": clean_token(current_token),
+        "claim": idempotency_key(sig),
+    }
+
+    # 🛠️ ผลตรวจ token ที่จำไว้ใน session อาจเก่าได้ถึง TOKEN_RECHECK_SECONDS ตอนกดส่งจริงให้ถามที่เก็บข้อมูลอีกครั้ง
+    fresh = check_token_status(current_token, force=True)
+    if fresh is None:
+        st.error("❌ ตรวจสอบ QR Code ไม่สำเร็จ กรุณาลองใหม่อีกครั้ง")
+        return False
+    if fresh['Status'] != 'Active':
+        st.error("❌ QR Code หรือลิงก์นี้ถูกใช้งานไปแล้ว")
+        return False
+    payload["offline"] = bool(fresh.get('Offline'))  # outbox จะเช็คซ้ำกับ TokenDB จริงตอนกลับมาออนไลน์
+
+    # 🛠️ จอง token ก่อน กันเปิดสองหน้าจอแล้วส่งซ้ำ
     try:
-        sheet_queue.append_row([ts, c_name_final, fixed_tax_val, final_addr1, final_addr2, str(cl_phone), c_item, 1, c_price, "Pending", current_token])
-        is_queue_saved = True
+        storage.reserve_token(current_token)
+    except TokenConflictError:
+        st.error("❌ QR Code หรือลิงก์นี้ถูกใช้งานไปแล้ว")
+        return False
     except Exception as e:
+        METRICS.inc("app_errors_total", where="reserve_token")
         st.error(f"❌ บันทึกคิวไม่สำเร็จ: {e}")
-        return 
+        return False
 
-    # 2. บันทึก Tab Customers 
-    if is_queue_saved:
-        try:
-            try:
-                exist_data = sheet_db.get_all_records()
-                df_ex = pd.DataFrame(exist_data)
-                need_save = True
-                if not df_ex.empty and 'TaxID' in df_ex.columns:
-                    df_ex['TaxID_Clean'] = df_ex['TaxID'].apply(fix_tax_id)
-                    if fixed_tax_val in df_ex['TaxID_Clean'].values:
-                        need_save = False
-                
-                if need_save:
-                    sheet_db.append_row([c_name_final, fixed_tax_val, final_addr1, final_addr2, str(cl_phone)])
-            except:
-                sheet_db.append_row([c_name_final, fixed_tax_val, final_addr1, final_addr2, str(cl_phone)])
-        except Exception as e:
-            print(f"Customer Save Error: {e}")
-
-    # 3. ปิด Token
+    # 🛠️ บันทึกลง Outbox ในเครื่องก่อน (ตอบลูกค้าทันที) แล้ว thread เบื้องหลังจะเขียน Queue / Customers / Token / LINE ให้เอง
     try:
-        mark_token_as_used(current_token)
-    except:
-        pass
-
-    # 4. ส่ง LINE 
-    if is_queue_saved:
-        try:
-            full_message = (
-                f"🔔 **ลูกค้ากรอกฟอร์มสำเร็จ**\n"
-                f"━━━━━━━━━━━━━━━━━━━━\n"
-                f"👤 ชื่อ: {c_name_final}\n"
-                f"🆔 Tax ID: {fixed_tax_val}\n"
-                f"🏠 ที่อยู่: {final_addr1} {final_addr2}\n"
-                f"📞 โทร: {cl_phone}\n"
-                f"💰 ยอด: {c_price:,.2f} บาท\n"
-                f"📦 รายการ: {c_item}\n"
-                f"⏰ เวลา: {ts}\n"
-                f"━━━━━━━━━━━━━━━━━━━━"
-            )
-            send_line_message(full_message)
-        except Exception as e:
-            st.error(f"ส่ง LINE ไม่สำเร็จ: {e}")
+        get_outbox(tenant.key).submit(idempotency_key(sig), payload)
+    except Exception as e:
+        METRICS.inc("app_errors_total", where="outbox_submit")
+        storage.release_token(current_token)
+        st.error(f"❌ บันทึกคิวไม่สำเร็จ: {e}")
+        return False
 
     # Update Session State
     st.session_state['last_submitted_id'] = sig
+    st.session_state['submitted_token'] = current_token
     st.session_state['submit_success'] = True
+    return True
 
 # ==========================================
 # 🟢 หน้าต่าง Pop-up ยืนยัน (Dialog)
@@ -499,22 +678,22 @@ def save_data_to_system(ts, c_name_final, fixed_tax_val, final_addr1, final_addr
 @st.dialog("🧐 ตรวจสอบความถูกต้องอีกครั้ง")
 def show_confirmation_dialog(preview_name, preview_tax, preview_addr, preview_phone, data_payload, active_token):
     st.write("กรุณาตรวจสอบข้อมูลก่อนส่ง:")
-    
+
     st.info(f"""
     **🏢 ชื่อที่ออกใบกำกับ:** {preview_name}
-    
-    **🆔 เลขผู้เสียภาษี:** {preview_tax}  
+
+    **🆔 เลขผู้เสียภาษี:** {preview_tax}
     **📞 เบอร์โทร:** {preview_phone}
-    
+
     **🏠 ที่อยู่:** {preview_addr}
     """)
-    
+
     st.markdown("---")
-    
+
     col_confirm, col_edit = st.columns(2)
-    
+
     if col_confirm.button("✅ ถูกต้อง (ส่งเลย)", type="primary", use_container_width=True):
-        save_data_to_system(
+        saved = save_data_to_system(
             data_payload['ts'],
             data_payload['c_name_final'],
             data_payload['fixed_tax_val'],
@@ -526,20 +705,216 @@ def show_confirmation_dialog(preview_name, preview_tax, preview_addr, preview_ph
             data_payload['sig'],
             active_token # ส่ง Token เข้าไปเซฟในชีตด้วย
         )
-        st.rerun()
-        
+        # บันทึกไม่สำเร็จให้ข้อความ error ค้างอยู่ใน pop-up (st.rerun จะล้างข้อความทิ้ง)
+        if saved:
+            st.rerun()
+
     if col_edit.button("❌ กลับไปแก้ไข", use_container_width=True):
         st.rerun()
 
 # ==========================================
-# 🔘 ปุ่มกดหน้าหลัก (Main Button & Validation)
+# 📝 ส่วนฟอร์มลูกค้า (Customer App)
 # ==========================================
-st.markdown("")
+amount_box.success(f"💰 ยอดชำระ: {locked_amount:,.2f} บาท")
+st.markdown("---")
+
+# โหลด Database
+try:
+    storage = get_storage(tenant.key)
+    postcode_index = load_postcode_index()
+except Exception as e:
+    st.error(f"เชื่อมต่อฐานข้อมูลไม่ได้ กรุณาแจ้งพนักงาน (ระบบแจ้งว่า: {e})")
+    st.stop()
+
+# 🛠️ แต่ละส่วนเป็น st.fragment: พิมพ์/เลือกในส่วนไหนจะรันใหม่แค่ส่วนนั้น (ไม่ตรวจ token / ค้นลูกค้าซ้ำทุกตัวอักษร)
+# ช่องในส่วนที่ 3 ผูกกับ key ใน session_state ส่วนที่ 1-2 เติมค่าให้ผ่าน prefill_form
+FORM_KEYS = ("f_name", "f_tax", "f_phone", "f_house", "f_dist", "f_prov")
+for form_key in FORM_KEYS:
+    st.session_state.setdefault(form_key, "")
+
+def prefill_form(source, sig, values):
+    # เติมครั้งเดียวต่อผลค้นหา (รอบถัดไปไม่ทับสิ่งที่ลูกค้าแก้เอง) แล้วรันทั้งหน้าใหม่ให้ส่วนที่ 3 แสดงค่าใหม่
+    if st.session_state.get(f'prefill_{source}') == sig:
+        return
+    st.session_state[f'prefill_{source}'] = sig
+    for key, value in values.items():
+        st.session_state[key] = value
+    st.rerun()
+
+# --------------------------------------------------------
+# ส่วนที่ 1: ค้นหา Tax ID
+# --------------------------------------------------------
+@st.fragment
+def customer_search_section():
+    st.header("1️⃣ ค้นหาข้อมูลเก่า")
+    col_s1, col_s2 = st.columns([3, 1])
+
+    with col_s1:
+        search_taxid = st.text_input("เลขผู้เสียภาษี 13 หลัก", max_chars=13, placeholder="พิมพ์เลข 13 หลักตรงนี้...")
+    with col_s2:
+        st.write("")
+        st.write("")
+        btn_search = st.button("🔍 กดค้นหา", use_container_width=True)
+
+    # 🔎 จำเลขภาษีไม่ได้ ค้นจากชื่อบริษัท / เบอร์โทร / เลขภาษีบางส่วนแทน
+    search_text = st.text_input("หรือค้นหาจาก ชื่อบริษัท / เบอร์โทร / เลขภาษีบางส่วน", placeholder="เช่น นามิ หรือ 0812345678")
+    picked_cust = None
+    if len(search_text.strip()) >= 2 and len(search_taxid) != 13:
+        try:
+            matches = storage.search_customers(search_text, limit=8)
+            if matches:
+                choices = ["-- เลือกรายชื่อของคุณ --"] + [
+                    f"{m['Name']} | {fix_tax_id(m['TaxID'])} | {fix_phone_number(m['Phone'])}" for m in matches
+                ]
+                picked = st.selectbox(f"พบ {len(matches)} รายการที่ใกล้เคียง", range(len(choices)), format_func=lambda i: choices[i])
+                if picked:
+                    picked_cust = matches[picked - 1]
+            else:
+                st.caption("ℹ️ ไม่พบรายชื่อที่ใกล้เคียง (กรอกใหม่ด้านล่าง)")
+        except Exception as e:
+            METRICS.inc("app_errors_total", where="customer_search")
+            st.error(f"ระบบค้นหาขัดข้อง: {e}")
+
+    found_cust = None
+    val_tax = ""
+    if (len(search_taxid) == 13) or btn_search:
+        val_tax = search_taxid
+        try:
+            found_cust = storage.find_customer(search_taxid)
+            if found_cust is None:
+                st.caption("ℹ️ ไม่พบข้อมูลเก่า (กรอกใหม่ด้านล่าง)")
+        except Exception as e:
+            METRICS.inc("app_errors_total", where="taxid_search")
+            st.error(f"ระบบค้นหาขัดข้อง: {e}")
+    elif picked_cust is not None:
+        found_cust = picked_cust
+        val_tax = fix_tax_id(found_cust['TaxID'])
+
+    if found_cust is not None:
+        st.info(f"✅ พบข้อมูลเดิมของ: {found_cust['Name']}")
+
+        # 🏠 แยกที่อยู่เก่าเป็น บ้านเลขที่ / ตำบล อำเภอ / จังหวัด รหัสไปรษณีย์ ถ้ามั่นใจพอจะเลือกพื้นที่ในส่วนที่ 2 ให้ด้วย
+        parsed = get_address_parser().parse(found_cust['Address1'], found_cust['Address2'])
+        values = {
+            "f_name": strip_branch_suffix(found_cust['Name']),
+            "f_tax": val_tax,
+            "f_phone": fix_phone_number(found_cust['Phone']),
+            "f_house": parsed.house,
+            "f_dist": address_parser.district_line(parsed),
+            "f_prov": address_parser.province_line(parsed),
+        }
+        if address_parser.complete(parsed) and parsed.confidence >= address_parser.PREFILL_CONFIDENCE:
+            area_label = address_parser.label(parsed)
+            values.update({
+                "zip_input": parsed.zipcode,
+                "zip_pick": area_label,
+                "prefill_postcode": f"{parsed.zipcode}|{area_label}",  # ไม่ต้องให้ส่วนที่ 2 เติมทับซ้ำ
+            })
+        prefill_form("customer", val_tax, values)
+    elif val_tax:
+        prefill_form("customer", val_tax, {"f_tax": val_tax})
+
+customer_search_section()
+st.markdown("---")
+
+# --------------------------------------------------------
+# ส่วนที่ 2: ค้นหาที่อยู่ด้วยรหัสไปรษณีย์
+# --------------------------------------------------------
+@st.fragment
+def postcode_section():
+    st.header("2️⃣ ค้นหาที่อยู่ (ด้วยรหัสไปรษณีย์)")
+    st.caption("ไม่ต้องพิมพ์ยาว! แค่ใส่รหัสไปรษณีย์ ระบบจะเติมตำบล/อำเภอ/จังหวัด ให้เองครับ")
+
+    col_z1, col_z2 = st.columns([3, 1])
+    with col_z1:
+        input_zip = st.text_input("รหัสไปรษณีย์ 5 หลัก", max_chars=5, placeholder="เช่น 11120", key="zip_input")
+    with col_z2:
+        st.write("")
+        st.write("")
+        btn_zip = st.button("🚀 ค้นหา", use_container_width=True)
+
+    if (len(input_zip) == 5 and not postcode_index.empty) or btn_zip:
+        if len(input_zip) == 5:
+            options = postcode_index.labels(input_zip)
+
+            if options:
+                # พื้นที่ที่แยกได้จากที่อยู่เดิมของลูกค้า (ส่วนที่ 1) เลือกไว้ให้ก่อน
+                picked_label = st.session_state.get("zip_pick")
+                with st.expander(f"✅ พบ {len(options)} พื้นที่ (กรุณากดเลือกแขวงและเขตของคุณในกล่องด้านล่าง)", expanded=True):
+                    selected_option = st.selectbox(
+                        "กดที่นี่เพื่อเลือกตำบล/อำเภอ:",
+                        options,
+                        index=options.index(picked_label) if picked_label in options else 0,
+                        label_visibility="visible"
+                    )
+
+                if selected_option:
+                    parts = selected_option.split(" > ")
+                    prefill_form("postcode", f"{input_zip}|{selected_option}", {
+                        "f_dist": f"{parts[0]} {parts[1]}",
+                        "f_prov": f"{parts[2]} {input_zip}",
+                    })
+            else:
+                st.warning("❌ ไม่พบรหัสไปรษณีย์นี้")
+        elif btn_zip and len(input_zip) < 5:
+            st.error("กรุณากรอกรหัสไปรษณีย์ให้ครบ 5 หลัก")
+
+postcode_section()
+st.markdown("---")
+
+# --------------------------------------------------------
+# ส่วนที่ 3: กรอกรายละเอียด (มีเลือกสาขา) + ปุ่มตรวจสอบ
+# --------------------------------------------------------
+@st.fragment
+def details_section(locked_amount, token_from_url):
+    st.header("3️⃣ ตรวจสอบข้อมูลให้ครบถ้วน")
+
+    c_name_raw = st.text_input("ชื่อลูกค้า / ชื่อบริษัท (ไม่ต้องใส่คำว่า สนญ. หรือ สาขา)", key="f_name", placeholder="ตัวอย่าง: บริษัท เอบีซี จำกัด")
+
+    branch_type = st.radio(
+        "เลือกประเภทหน่วยงาน (เพื่อเติมท้ายชื่อให้ถูกต้อง):",
+        options=["(สำนักงานใหญ่)", "สาขา (ระบุเลข หรือ ชื่อสาขา)", "บุคคลธรรมดา (ไม่เติมท้ายชื่อ)"],
+        index=None,
+        horizontal=True
+    )
+
+    branch_suffix = ""
+    branch_input_val = ""
+
+    if branch_type == "สาขา (ระบุเลข หรือ ชื่อสาขา)":
+        branch_input_val = st.text_input("ระบุเลขสาขา หรือ ชื่อสาขา", placeholder="เช่น 00001 หรือ บางนา (ไม่ต้องพิมพ์คำว่าสาขา)")
+        if branch_input_val:
+            clean_branch_name = branch_input_val.replace("สาขา", "").strip()
+            branch_suffix = f" (สาขา {clean_branch_name})"
+    elif branch_type == "(สำนักงานใหญ่)":
+        branch_suffix = " (สำนักงานใหญ่)"
+    elif branch_type == "บุคคลธรรมดา (ไม่เติมท้ายชื่อ)":
+        branch_suffix = ""
+
+    if c_name_raw:
+        full_name_preview = f"{c_name_raw.strip()}{branch_suffix}"
+        st.info(f"📝 ชื่อที่จะปรากฏในใบกำกับภาษี: **{full_name_preview}**")
+
+    c_tax = st.text_input("เลขประจำตัวผู้เสียภาษี (ตรวจสอบความถูกต้อง)", key="f_tax", max_chars=13)
+    c_phone = st.text_input("เบอร์โทรศัพท์", key="f_phone")
+
+    c_house_no = st.text_input("🏠 เลขที่บ้าน / หมู่บ้าน / ถนน / ซอย", key="f_house", placeholder="เช่น 99/99 หมู่ 1 ซ.วัดกู้")
+
+    col_a1, col_a2 = st.columns(2)
+    with col_a1:
+        c_dist = st.text_input("ตำบล / อำเภอ", key="f_dist", placeholder="ระบบเติมให้อัตโนมัติ")
+    with col_a2:
+        c_prov = st.text_input("จังหวัด / รหัสไปรษณีย์", key="f_prov", placeholder="ระบบเติมให้อัตโนมัติ")
+
+    st.markdown("---")
+    c_item = st.text_input("รายการสินค้า", value="อาหาร เครื่องดื่ม และเบเกอรี่", disabled=True)
+    c_price = st.number_input("ยอดเงินรวม (บาท)", value=locked_amount, disabled=True)
+
+    # ==========================================
+    # 🔘 ปุ่มกดหน้าหลัก (Main Button & Validation)
+    # ==========================================
+    st.markdown("")
 
-if st.session_state.get('submit_success', False):
-    st.success("🎉 บันทึกข้อมูลเรียบร้อย! ขอบคุณที่ใช้บริการครับ")
-    st.balloons()
-else:
     if st.button("🔍 ตรวจสอบข้อมูล (ขั้นตอนสุดท้าย)", type="primary", use_container_width=True):
         if not c_name_raw or not c_tax:
             st.error("❌ กรุณากรอก 'ชื่อ' และ 'เลขผู้เสียภาษี'")
@@ -549,22 +924,22 @@ else:
             st.error("❌ กรุณาระบุ 'เลขสาขา หรือ ชื่อสาขา'")
         elif len(c_tax) != 13:
             st.error("❌ 'เลขประจำตัวผู้เสียภาษี' ต้องมี 13 หลักเท่านั้น")
-        elif not c_house_no: 
+        elif not c_house_no:
             st.error("❌ กรุณากรอก 'ที่อยู่ (เลขที่บ้าน)'")
         else:
             sig = f"{c_tax}_{c_price}_{token_from_url}"
-            
+
             if st.session_state['last_submitted_id'] == sig:
                 st.warning("⚠️ รายการนี้ส่งไปแล้ว")
             else:
                 ts = datetime.now(pytz.timezone('Asia/Bangkok')).strftime("%Y-%m-%d %H:%M:%S")
                 cl_phone = fix_phone_number(c_phone)
-                
+
                 c_name_final = f"{c_name_raw.strip()}{branch_suffix}"
                 final_addr1 = f"{c_house_no} {c_dist}".strip()
                 final_addr2 = c_prov.strip()
                 fixed_tax_val = fix_tax_id(c_tax)
-                
+
                 payload = {
                     "ts": ts,
                     "c_name_final": c_name_final,
@@ -576,7 +951,7 @@ else:
                     "c_price": c_price,
                     "sig": sig
                 }
-                
+
                 show_confirmation_dialog(
                     preview_name=c_name_final,
                     preview_tax=fixed_tax_val,
@@ -585,3 +960,5 @@ else:
                     data_payload=payload,
                     active_token=token_from_url # ส่ง Token ไปยัง Dialog
                 )
+
+details_section(locked_amount, token_from_url)
@@ -0,0 +1,205 @@
+import argparse
+import csv
+import re
+import sys
+import time
+from collections import defaultdict, namedtuple
+
+from postcodes import PostcodeIndex, make_label
+
+# ==========================================
+# 🏠 แยกที่อยู่เก่า (Address1 / Address2) เป็น บ้านเลขที่ / ตำบล / อำเภอ / จังหวัด / รหัสไปรษณีย์
+# ==========================================
+# เทียบทีละคำกับฐานข้อมูลรหัสไปรษณีย์ (PostcodeIndex) แทน regex เดาคำนำหน้าแบบเดิม
+#   1. ตัดข้อความเป็นคำ จำคำนำหน้า (ต./ตำบล/แขวง, อ./อำเภอ/เขต, จ./จังหวัด) ว่าคำถัดไปเป็นระดับไหน
+#   2. ผู้สมัคร = พื้นที่ของรหัสไปรษณีย์ในที่อยู่ (ถ้าไม่มีรหัส ใช้พื้นที่ที่ชื่อ ตำบล/อำเภอ ตรงกับคำใดคำหนึ่ง)
+#   3. ให้คะแนนตามส่วนที่ตรง (รหัส / จังหวัด / อำเภอ / ตำบล) คะแนนสูงสุดคือ confidence (0-1)
+#   4. ผู้สมัครคะแนนเท่ากันหลายพื้นที่ เก็บเฉพาะส่วนที่ทุกพื้นที่ตรงกัน (ที่เหลือปล่อยว่าง) และลด confidence
+# คำที่ใช้จับคู่แล้ว (พร้อมคำนำหน้า) ถูกตัดออก ที่เหลือคือบ้านเลขที่ / หมู่ / ซอย / ถนน
+#
+# ใช้แยกทั้งแท็บ Customers ทีเดียว (อ่านอย่างเดียว เขียนผลเป็น CSV):
+#   python address_parser.py --secrets .streamlit/secrets.toml -o addresses.csv
+#   python address_parser.py customers.csv -o addresses.csv
+
+ParsedAddress = namedtuple("ParsedAddress", ["house", "district", "amphoe", "province", "zipcode", "confidence"])
+
+DISTRICT, AMPHOE, PROVINCE = "district", "amphoe", "province"
+PREFIXES = {
+    "แขวง": DISTRICT, "ตำบล": DISTRICT, "ต.": DISTRICT,
+    "เขต": AMPHOE, "อำเภอ": AMPHOE, "อ.": AMPHOE,
+    "จังหวัด": PROVINCE, "จ.": PROVINCE,
+}
+WEIGHTS = {"zipcode": 0.3, PROVINCE: 0.2, AMPHOE: 0.25, DISTRICT: 0.25}
+TIE_PENALTY = 0.8       # คูณ confidence เมื่อมีหลายพื้นที่คะแนนเท่ากัน
+PREFILL_CONFIDENCE = 0.75   # ตั้งแต่ค่านี้ (และครบทุกส่วน) เติมส่วนค้นหารหัสไปรษณีย์ให้ด้วย
+
+PROVINCE_ALIASES = {"กทม": "กรุงเทพมหานคร", "กรุงเทพ": "กรุงเทพมหานคร", "กรุงเทพฯ": "กรุงเทพมหานคร"}
+
+_PREFIX_RE = "|".join(re.escape(p) for p in sorted(PREFIXES, key=len, reverse=True))
+# แยกคำนำหน้าที่เขียนติดกับคำก่อนหน้า เช่น "บางพูดอ.ปากเกร็ด"
+_SPLIT_BEFORE = re.compile(rf"(?<=[^\s.])(?=(?:{_PREFIX_RE})[^\s])")
+_TOKEN = re.compile(rf"(?:({_PREFIX_RE})\s*)?([^\s,]+)")
+_ZIPCODE = re.compile(r"^\d{5}$")
+
+
+def _norm(name):
+    return name.replace(" ", "").replace("ฯ", "").rstrip(".")
+
+
+class AddressParser:
+    def __init__(self, index):
+        # โหลดทุกพื้นที่ครั้งเดียว (~7,000 แถว) ทำ dict ชื่อ -> พื้นที่ ไว้ค้นเร็ว
+        self.areas = list(index.items())   # (รหัส, ตำบล, อำเภอ, จังหวัด)
+        self._by_zip = defaultdict(list)
+        self._by_name = {DISTRICT: defaultdict(list), AMPHOE: defaultdict(list), PROVINCE: defaultdict(list)}
+        for i, (zipcode, district, amphoe, province) in enumerate(self.areas):
+            self._by_zip[zipcode].append(i)
+            self._by_name[DISTRICT][_norm(district)].append(i)
+            self._by_name[AMPHOE][_norm(amphoe)].append(i)
+            self._by_name[PROVINCE][_norm(province)].append(i)
+
+    def tokens(self, text):
+        # คืน [(ชนิดจากคำนำหน้าหรือ None, คำที่ normalize แล้ว, (start, end))]
+        out = []
+        for m in _TOKEN.finditer(text):
+            kind = PREFIXES.get(m.group(1)) if m.group(1) else None
+            word = _norm(m.group(2))
+            if kind in (None, PROVINCE):
+                word = PROVINCE_ALIASES.get(word, word)
+            out.append((kind, word, m.span()))
+        return out
+
+    def _candidates(self, tokens):
+        for _, word, _ in tokens:
+            if _ZIPCODE.match(word) and word in self._by_zip:
+                return self._by_zip[word]
+        found = set()
+        for kind, word, _ in tokens:
+            for level in (DISTRICT, AMPHOE):
+                if kind in (None, level):
+                    found.update(self._by_name[level].get(word, ()))
+        return sorted(found)
+
+    def _score(self, i, tokens):
+        # คืน (คะแนน, ตำแหน่งคำที่ใช้)
+        zipcode, district, amphoe, province = self.areas[i]
+        # อำเภอก่อนตำบล: คำที่ไม่มีคำนำหน้าและชื่อซ้ำกันทั้งสองระดับ (เช่น ปากเกร็ด) นับเป็นอำเภอ คำหนึ่งใช้ได้ครั้งเดียว
+        wanted = {"zipcode": zipcode, PROVINCE: _norm(province), AMPHOE: _norm(amphoe), DISTRICT: _norm(district)}
+        score, used = 0.0, []
+        for level, name in wanted.items():
+            for kind, word, span in tokens:
+                if span in used or not (kind is None or kind == level or level == "zipcode"):
+                    continue
+                # "อ.เมือง" แปลว่าอำเภอเมืองของจังหวัดนั้น
+                if word == name or (level == AMPHOE and kind == AMPHOE and word == "เมือง" and name.startswith("เมือง")):
+                    score += WEIGHTS[level]
+                    used.append(span)
+                    break
+        return score, used
+
+    def parse(self, addr1, addr2=""):
+        text = " ".join(str(part) for part in (addr1, addr2) if part and str(part).strip() and str(part) != "nan")
+        text = _SPLIT_BEFORE.sub(" ", text)
+        tokens = self.tokens(text)
+
+        best, best_used, ties = 0.0, [], []
+        for i in self._candidates(tokens):
+            score, used = self._score(i, tokens)
+            if score > best + 1e-9:
+                best, best_used, ties = score, used, [i]
+            elif score and abs(score - best) < 1e-9:
+                ties.append(i)
+        if not ties:
+            return ParsedAddress(" ".join(text.split()), "", "", "", "", 0.0)
+
+        # ส่วนที่ทุกพื้นที่คะแนนเท่ากันมีค่าตรงกันเท่านั้นที่เชื่อได้
+        fields = [
+            values[0] if len(set(values)) == 1 else ""
+            for values in zip(*(self.areas[i] for i in ties))
+        ]
+        confidence = best if len(ties) == 1 else best * TIE_PENALTY
+
+        # ตัดคำที่จับคู่แล้ว + คำนำหน้าจังหวัด / ตำบลที่ค้างเปล่าๆ ออก ที่เหลือคือบ้านเลขที่
+        house = text
+        for start, end in sorted(best_used, reverse=True):
+            house = house[:start] + " " + house[end:]
+        house = " ".join(w for w in house.replace(",", " ").split() if w not in PREFIXES)
+        zipcode, district, amphoe, province = fields
+        return ParsedAddress(house, district, amphoe, province, zipcode, round(confidence, 2))
+
+
+def complete(parsed):
+    return all(parsed[1:5])
+
+
+def label(parsed):
+    # ข้อความเดียวกับตัวเลือกในส่วนค้นหารหัสไปรษณีย์ (ใช้ได้เมื่อ complete)
+    return make_label(parsed.district, parsed.amphoe, parsed.province)
+
+
+def district_line(parsed):
+    # "ต.xxx อ.yyy" หรือ "แขวงxxx เขตyyy" เหมือนที่ส่วนค้นหารหัสไปรษณีย์เติมให้
+    bangkok = "กรุงเทพ" in parsed.province
+    parts = []
+    if parsed.district:
+        parts.append(("แขวง" if bangkok else "ต.") + parsed.district)
+    if parsed.amphoe:
+        parts.append(("เขต" if bangkok else "อ.") + parsed.amphoe)
+    return " ".join(parts)
+
+
+def province_line(parsed):
+    province = parsed.province
+    if province and "กรุงเทพ" not in province:
+        province = "จ." + province
+    return " ".join(p for p in (province, parsed.zipcode) if p)
+
+
+# ==========================================
+# 🧮 แยกที่อยู่ทั้งแท็บ Customers (ออฟไลน์)
+# ==========================================
+def parse_rows(parser, rows):
+    # rows = [dict ที่มี Address1 / Address2] คืน [(row, ParsedAddress)]
+    return [(row, parser.parse(row.get("Address1", ""), row.get("Address2", ""))) for row in rows]
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Split Customers addresses into house / district / amphoe / province / zipcode")
+    arg_parser.add_argument("source", nargs="?", help="CSV with Address1/Address2 columns (default: read the Customers tab)")
+    arg_parser.add_argument("--secrets", default=".streamlit/secrets.toml")
+    arg_parser.add_argument("--tenant", help="shop key from [tenants] (default: default_tenant)")
+    arg_parser.add_argument("-o", "--out", default="-")
+    args = arg_parser.parse_args(argv)
+
+    if args.source:
+        with open(args.source, encoding="utf-8-sig") as f:
+            rows = list(csv.DictReader(f))
+    else:
+        from sheets import load_secrets, registry_from_secrets
+        from tenants import tenant_secrets
+
+        registry = registry_from_secrets(tenant_secrets(load_secrets(args.secrets), args.tenant))
+        rows = registry.worksheet("Customers").get_all_records()
+
+    parser = AddressParser(PostcodeIndex())
+    started = time.perf_counter()
+    results = parse_rows(parser, rows)
+    elapsed = time.perf_counter() - started
+
+    out = sys.stdout if args.out == "-" else open(args.out, "w", encoding="utf-8-sig", newline="")
+    try:
+        writer = csv.writer(out)
+        writer.writerow(["TaxID", "Name", "Address1", "Address2", *ParsedAddress._fields])
+        for row, parsed in results:
+            writer.writerow([row.get("TaxID", ""), row.get("Name", ""), row.get("Address1", ""), row.get("Address2", ""), *parsed])
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    matched = sum(1 for _, parsed in results if complete(parsed))
+    print(f"{len(results)} addresses, {matched} fully matched, {len(results) / max(elapsed, 1e-9):,.0f} addresses/s",
+          file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+import threading
+import time
+
+# ==========================================
+# 🗄️ Index ของ token ที่ย้ายไปเก็บถาวรแล้ว (token -> ยอด / สถานะ / แท็บที่เก็บ)
+# ==========================================
+# แท็บ ArchiveIndex มีแค่ 4 คอลัมน์ โหลดเข้าหน่วยความจำครั้งเดียว แล้วอ่านเพิ่มเฉพาะแถวใหม่ (watermark แบบ CustomerIndex)
+# ลูกค้าเปิดลิงก์เก่าที่ไม่อยู่ใน TokenDB แล้ว ก็ตอบได้ทันทีโดยไม่ต้องเปิดแท็บเก็บถาวรรายเดือน
+
+ARCHIVE_INDEX = "ArchiveIndex"
+INDEX_HEADER = ["Token", "Amount", "Status", "Archive"]
+
+
+class ArchiveIndex:
+    def __init__(self, worksheet, refresh_interval=60.0):
+        self.worksheet = worksheet
+        self.refresh_interval = refresh_interval   # ค้นไม่เจอจะอ่านแถวใหม่ได้ไม่ถี่กว่านี้ (วินาที)
+        self._entries = {}
+        self._watermark = 1                        # แถวที่อ่านแล้ว (แถว 1 คือหัวตาราง)
+        self._last_refresh = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def refresh(self, force=False):
+        from gspread.exceptions import WorksheetNotFound
+
+        with self._lock:
+            now = time.monotonic()
+            if not force and self._last_refresh is not None and now - self._last_refresh < self.refresh_interval:
+                return
+            self._last_refresh = now
+            try:
+                rows = self.worksheet.get_values(f"A{self._watermark + 1}:D")
+            except WorksheetNotFound:
+                return  # ยังไม่เคยย้ายข้อมูลไปเก็บถาวร
+            for row in rows:
+                row = list(row) + [""] * (len(INDEX_HEADER) - len(row))
+                token = str(row[0]).strip()
+                if token:
+                    self._entries[token] = (row[1], str(row[2]).strip(), row[3])  # แถวหลังทับแถวก่อน
+            self._watermark += len(rows)
+
+    def contains(self, token, status=None):
+        entry = self._entries.get(token)
+        return entry is not None and (status is None or entry[1] == status)
+
+    def lookup(self, token):
+        # คืนค่าแบบเดียวกับ get_token (เพิ่ม 'Archive') หรือ None
+        if token not in self._entries:
+            self.refresh()
+        entry = self._entries.get(token)
+        if entry is None:
+            return None
+        amount, status, archive = entry
+        return {'Token': token, 'Amount': amount, 'Status': status, 'Archive': archive}
+
+    def add(self, rows):
+        # rows = [[token, amount, status, archive]] ที่เพิ่งเขียนลงแท็บ (ไม่ต้องรออ่านกลับ)
+        with self._lock:
+            for token, amount, status, archive in rows:
+                self._entries[token] = (amount, status, archive)
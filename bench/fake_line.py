@@ -0,0 +1,85 @@
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# ==========================================
+# 🧪 LINE Messaging API ปลอม (HTTP server ในโปรเซสเดียวกัน)
+# ==========================================
+
+
+class FakeLineHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, code, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _simulate(self):
+        server = self.server
+        if server.latency_ms:
+            time.sleep(server.latency_ms / 1000.0)
+        return server.random.random() < server.error_rate
+
+    def do_GET(self):
+        with self.server.lock:
+            self.server.requests.append(("GET", self.path, 0))
+        if self._simulate():
+            return self._reply(429, {"message": "fake rate limit"})
+        self._reply(200, {"totalUsage": self.server.usage})
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        messages = body.get("messages", [])
+        with self.server.lock:
+            self.server.requests.append(("POST", self.path, len(messages)))
+        if self._simulate():
+            return self._reply(429, {"message": "fake rate limit"})
+        key = self.headers.get("X-Line-Retry-Key")
+        with self.server.lock:
+            if key in self.server.retry_keys:
+                return self._reply(409, {"message": "The retry key is already accepted"})
+            if key:
+                self.server.retry_keys.add(key)
+            self.server.usage += 1
+            self.server.messages.extend(m.get("text", "") for m in messages)
+        self._reply(200, {})
+
+
+class FakeLineServer:
+    def __init__(self, latency_ms=0.0, error_rate=0.0, seed=None):
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), FakeLineHandler)
+        self.httpd.latency_ms = latency_ms
+        self.httpd.error_rate = error_rate
+        self.httpd.random = random.Random(seed)
+        self.httpd.lock = threading.Lock()
+        self.httpd.requests = []
+        self.httpd.messages = []
+        self.httpd.usage = 0
+        self.httpd.retry_keys = set()     # X-Line-Retry-Key ที่รับไปแล้ว (ส่งซ้ำตอบ 409 เหมือน LINE จริง)
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="fake-line", daemon=True)
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}"
+
+    @property
+    def requests(self):
+        return list(self.httpd.requests)
+
+    @property
+    def messages(self):
+        return list(self.httpd.messages)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
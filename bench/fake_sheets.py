@@ -0,0 +1,282 @@
+import random
+import re
+import threading
+import time
+from collections import Counter
+
+import requests
+from gspread.exceptions import APIError, WorksheetNotFound
+from gspread.utils import a1_to_rowcol
+
+# ==========================================
+# 🧪 gspread ปลอมในหน่วยความจำ สำหรับ benchmark / load test
+# ==========================================
+# รองรับเฉพาะเมธอดที่แอปใช้ นับจำนวนครั้งที่เรียกแยกตาม "แท็บ.เมธอด"
+# จำลองความหน่วงของ Google API และ error 429 (เกินโควตา) ได้
+
+
+class FakeCell:
+    def __init__(self, row, col, value):
+        self.row, self.col, self.value = row, col, value
+
+
+def quota_error():
+    res = requests.Response()
+    res.status_code = 429
+    res._content = b'{"error": {"code": 429, "message": "Quota exceeded (fake)", "status": "RESOURCE_EXHAUSTED"}}'
+    return APIError(res)
+
+
+class FakeBackend:
+    # ตั้งค่าที่ใช้ร่วมกันทุกแท็บ: ความหน่วง, อัตรา error, ตัวนับ
+    def __init__(self, latency_ms=0.0, jitter_ms=0.0, quota_error_rate=0.0, seed=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.quota_error_rate = quota_error_rate
+        self.calls = Counter()
+        self.errors = Counter()
+        self.lock = threading.RLock()
+        self._random = random.Random(seed)
+
+    def call(self, name):
+        with self.lock:
+            self.calls[name] += 1
+            fail = self._random.random() < self.quota_error_rate
+            delay = (self.latency_ms + self._random.uniform(0, self.jitter_ms)) / 1000.0
+        if delay:
+            time.sleep(delay)
+        if fail:
+            with self.lock:
+                self.errors[name] += 1
+            raise quota_error()
+
+    def snapshot(self):
+        with self.lock:
+            return Counter(self.calls)
+
+
+class FakeWorksheet:
+    def __init__(self, backend, title, rows=None):
+        self.backend = backend
+        self.title = title
+        self.id = abs(hash(title)) % 100000
+        self.rows = [list(r) for r in (rows or [])]
+
+    def _call(self, op):
+        self.backend.call(f"{self.title}.{op}")
+
+    def _grid(self, name):
+        name = name.split("!")[-1]
+        if ":" not in name:
+            name = f"{name}:{name}"
+        start, end = name.split(":")
+        r1, c1 = a1_to_rowcol(start if re.search(r"\d", start) else start + "1")
+        if re.search(r"\d", end):
+            r2, c2 = a1_to_rowcol(end)
+        else:
+            r2, c2 = max(len(self.rows), r1), a1_to_rowcol(end + "1")[1]
+        return r1, c1, r2, c2
+
+    def _set(self, r, c, value):
+        while len(self.rows) < r:
+            self.rows.append([])
+        row = self.rows[r - 1]
+        while len(row) < c:
+            row.append("")
+        row[c - 1] = value
+
+    @property
+    def row_count(self):
+        return max(len(self.rows), 1000)
+
+    # ---------- read ----------
+    def get_all_values(self, **kwargs):
+        self._call("get_all_values")
+        with self.backend.lock:
+            return [[str(v) for v in r] for r in self.rows]
+
+    def get_all_records(self, **kwargs):
+        self._call("get_all_records")
+        with self.backend.lock:
+            header = self.rows[0] if self.rows else []
+            return [dict(zip(header, list(r) + [""] * (len(header) - len(r)))) for r in self.rows[1:]]
+
+    def get_values(self, range_name=None, **kwargs):
+        self._call("get_values")
+        with self.backend.lock:
+            if range_name is None:
+                return [[str(v) for v in r] for r in self.rows]
+            r1, c1, r2, c2 = self._grid(range_name)
+            out = [[str(v) for v in r[c1 - 1:c2]] for r in self.rows[r1 - 1:r2]]
+        while out and not any(out[-1]):
+            out.pop()
+        return out
+
+    def batch_get(self, ranges, **kwargs):
+        self._call("batch_get")
+        with self.backend.lock:
+            out = []
+            for name in ranges:
+                r1, c1, r2, c2 = self._grid(name)
+                out.append([[str(v) for v in r[c1 - 1:c2]] for r in self.rows[r1 - 1:r2]])
+            return out
+
+    def find(self, query, in_column=None, **kwargs):
+        self._call("find")
+        with self.backend.lock:
+            for i, row in enumerate(self.rows, start=1):
+                cols = [in_column - 1] if in_column else range(len(row))
+                for c in cols:
+                    if c < len(row) and str(row[c]) == query:
+                        return FakeCell(i, c + 1, row[c])
+        return None
+
+    def row_values(self, row, **kwargs):
+        self._call("row_values")
+        with self.backend.lock:
+            return [str(v) for v in self.rows[row - 1]] if row <= len(self.rows) else []
+
+    def col_values(self, col, **kwargs):
+        self._call("col_values")
+        with self.backend.lock:
+            return [str(r[col - 1]) if col <= len(r) else "" for r in self.rows]
+
+    # ---------- write ----------
+    def update_cell(self, row, col, value):
+        self._call("update_cell")
+        with self.backend.lock:
+            self._set(row, col, value)
+
+    def update(self, range_name=None, values=None, **kwargs):
+        self._call("update")
+        if isinstance(range_name, list):
+            range_name, values = values, range_name
+        with self.backend.lock:
+            r1, c1, _, _ = self._grid(range_name or "A1")
+            for i, row in enumerate(values):
+                for j, v in enumerate(row):
+                    self._set(r1 + i, c1 + j, v)
+
+    def batch_update(self, data, **kwargs):
+        self._call("batch_update")
+        with self.backend.lock:
+            for item in data:
+                r1, c1, _, _ = self._grid(item["range"])
+                for i, row in enumerate(item["values"]):
+                    for j, v in enumerate(row):
+                        self._set(r1 + i, c1 + j, v)
+
+    def insert_row(self, values, index=1, **kwargs):
+        self._call("insert_row")
+        with self.backend.lock:
+            self.rows.insert(index - 1, list(values))
+
+    def append_row(self, values, **kwargs):
+        self._call("append_row")
+        with self.backend.lock:
+            self.rows.append(list(values))
+
+    def append_rows(self, values, **kwargs):
+        self._call("append_rows")
+        with self.backend.lock:
+            self.rows.extend(list(v) for v in values)
+
+    def delete_rows(self, start, end=None):
+        self._call("delete_rows")
+        with self.backend.lock:
+            del self.rows[start - 1:(end or start)]
+
+    def clear(self):
+        self._call("clear")
+        with self.backend.lock:
+            self.rows = []
+
+
+class FakeSpreadsheet:
+    def __init__(self, backend, title):
+        self.backend = backend
+        self.title = title
+        self.id = f"fake-{title}"
+        self.sheets = {}
+
+    def worksheet(self, title):
+        self.backend.call(f"{self.title}.worksheet")
+        if title not in self.sheets:
+            raise WorksheetNotFound(title)
+        return self.sheets[title]
+
+    def worksheets(self, **kwargs):
+        self.backend.call(f"{self.title}.worksheets")
+        return list(self.sheets.values())
+
+    def values_batch_get(self, ranges, params=None):
+        # รูปแบบเดียวกับ Sheets API: {"valueRanges": [{"range", "values"}]} ช่วงเป็น "'แท็บ'!A2:J"
+        self.backend.call(f"{self.title}.values_batch_get")
+        out = []
+        for name in ranges:
+            title, _, cells = name.rpartition("!")
+            ws = self.sheets.get(title.strip("'"))
+            if ws is None:
+                raise WorksheetNotFound(title)
+            with self.backend.lock:
+                r1, c1, r2, c2 = ws._grid(cells)
+                values = [[str(v) for v in r[c1 - 1:c2]] for r in ws.rows[r1 - 1:r2]]
+            while values and not any(values[-1]):
+                values.pop()
+            out.append({"range": name, "values": values})
+        return {"valueRanges": out}
+
+    def add_worksheet(self, title, rows=1000, cols=26, **kwargs):
+        self.backend.call(f"{self.title}.add_worksheet")
+        self.sheets[title] = FakeWorksheet(self.backend, title)
+        return self.sheets[title]
+
+    def batch_update(self, body):
+        # รองรับเฉพาะ deleteDimension (แถว) และ updateCells (ค่าเดียว) ที่ retention ใช้
+        self.backend.call(f"{self.title}.batch_update")
+        by_id = {ws.id: ws for ws in self.sheets.values()}
+        with self.backend.lock:
+            for request in body["requests"]:
+                if "deleteDimension" in request:
+                    r = request["deleteDimension"]["range"]
+                    del by_id[r["sheetId"]].rows[r["startIndex"]:r["endIndex"]]
+                elif "updateCells" in request:
+                    r = request["updateCells"]["range"]
+                    value = request["updateCells"]["rows"][0]["values"][0]["userEnteredValue"]
+                    by_id[r["sheetId"]]._set(r["startRowIndex"] + 1, r["startColumnIndex"] + 1, next(iter(value.values())))
+        return {"replies": [{} for _ in body["requests"]]}
+
+
+class FakeClient:
+    def __init__(self, backend=None):
+        self.backend = backend or FakeBackend()
+        self.spreadsheets = {}
+
+    def add_spreadsheet(self, title, sheets):
+        book = FakeSpreadsheet(self.backend, title)
+        for name, rows in sheets.items():
+            book.sheets[name] = FakeWorksheet(self.backend, name, rows)
+        self.spreadsheets[title] = book
+        return book
+
+    def open(self, title):
+        self.backend.call("client.open")
+        return self.spreadsheets[title]
+
+
+def seed_invoice_data(client, customers=1000, tokens=(), title="Invoice_Data", seed=0):
+    # สร้างข้อมูลตัวอย่างโครงสร้างเดียวกับชีตจริง
+    rnd = random.Random(seed)
+    customer_rows = [["Name", "TaxID", "Address1", "Address2", "Phone"]]
+    for i in range(customers):
+        customer_rows.append([
+            f"บริษัท ทดสอบ {i} จำกัด (สำนักงานใหญ่)",
+            str(1000000000000 + i),
+            f"{rnd.randint(1, 999)}/{rnd.randint(1, 99)} ม.{rnd.randint(1, 9)} ตำบลบางพูด",
+            "อำเภอปากเกร็ด นนทบุรี 11120",
+            str(800000000 + i),
+        ])
+    token_rows = [["Token", "Amount", "Status", "Timestamp"]]
+    token_rows += [[t, amount, "Active", "2026-01-01 10:00:00"] for t, amount in tokens]
+    queue_rows = [["ts", "name", "TaxID", "addr1", "addr2", "phone", "item", "qty", "price", "status", "token"]]
+    return client.add_spreadsheet(title, {"TokenDB": token_rows, "Customers": customer_rows, "Queue": queue_rows})
@@ -0,0 +1,80 @@
+import argparse
+import ast
+import json
+import os
+import subprocess
+import sys
+
+# ==========================================
+# ⏱️ งบเวลา import ตอนเปิดแอป (cold start)
+# ==========================================
+# import โมดูลทุกตัวที่ Customer_app.py import ไว้ที่ระดับบนสุดใน process ใหม่ (เหมือนตอน Streamlit Cloud ตื่นจาก sleep)
+# จับเวลาเฉพาะส่วนที่ต่อจาก streamlit แล้วเช็คว่าไม่มีโมดูลหนักที่ควรโหลดทีหลังติดมาด้วย
+#   python -m bench.import_budget --budget-ms 300
+# ไม่ผ่านงบจะ exit code 1 (ใช้ใน CI ได้)
+
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Customer_app.py")
+
+# โหลดเมื่อใช้จริงเท่านั้น: หน้าแอดมิน (qrcode / PIL / numpy), login Google Sheets (gspread / oauth2client)
+HEAVY_MODULES = ["pandas", "numpy", "PIL", "qrcode", "gspread", "oauth2client"]
+
+PROBE = """
+import importlib, json, sys, time
+importlib.import_module("streamlit")
+modules = json.loads(sys.argv[1])
+start = time.perf_counter()
+for name in modules:
+    importlib.import_module(name)
+elapsed = time.perf_counter() - start
+print(json.dumps({"ms": elapsed * 1000.0, "loaded": sorted(m for m in sys.modules if "." not in m)}))
+"""
+
+
+def app_imports(path=APP_PATH):
+    # ชื่อโมดูลที่ import ที่ระดับบนสุดของไฟล์ (ไม่นับ import ในฟังก์ชัน / ใน if ของหน้าแอดมิน)
+    with open(path, encoding="utf-8") as f:
+        tree = ast.parse(f.read(), path)
+    names = []
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            names.extend(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            names.append(node.module)
+    return [n for n in dict.fromkeys(names) if n.split(".")[0] != "streamlit"]
+
+
+def measure(modules, repeat=3):
+    # รันหลายรอบใน process ใหม่ทุกครั้ง แล้วเอารอบที่เร็วที่สุด (ตัดผลของเครื่องที่กำลังยุ่งอยู่)
+    best = None
+    for _ in range(repeat):
+        out = subprocess.run(
+            [sys.executable, "-c", PROBE, json.dumps(modules)],
+            cwd=os.path.dirname(APP_PATH), capture_output=True, text=True, check=True,
+        ).stdout
+        result = json.loads(out.strip().splitlines()[-1])
+        if best is None or result["ms"] < best["ms"]:
+            best = result
+    return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check the cold-start import time of Customer_app.py")
+    parser.add_argument("--budget-ms", type=float, default=300.0, help="max time to import the app's modules after streamlit")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    modules = app_imports()
+    result = measure(modules, args.repeat)
+    heavy = [m for m in HEAVY_MODULES if m in result["loaded"]]
+
+    print(f"modules: {', '.join(modules)}")
+    print(f"import time after streamlit: {result['ms']:.1f} ms (budget {args.budget_ms:.0f} ms)")
+    if heavy:
+        print(f"heavy modules loaded at startup: {', '.join(heavy)}")
+    ok = result["ms"] <= args.budget_ms and not heavy
+    print("OK" if ok else "FAIL")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
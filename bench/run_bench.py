@@ -0,0 +1,232 @@
+import argparse
+import json
+import math
+import os
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import gspread
+from oauth2client.service_account import ServiceAccountCredentials
+from streamlit.testing.v1 import AppTest
+
+from bench.fake_line import FakeLineServer
+from bench.fake_sheets import FakeBackend, FakeClient, seed_invoice_data
+
+# ==========================================
+# ⏱️ Benchmark / Load test ขั้นตอน token -> ส่งฟอร์ม
+# ==========================================
+# รันแอปจริงผ่าน Streamlit AppTest โดยเปลี่ยน gspread และ LINE เป็นของปลอมในเครื่อง
+#   python -m bench.run_bench --customers 50 --concurrency 5 --latency-ms 120 --quota-error-rate 0.02
+# รายงาน p50/p95/p99 ของแต่ละขั้นตอน และจำนวนครั้งที่เรียก Google API ต่อการส่ง 1 ครั้ง
+#
+# หมายเหตุ: AppTest รัน script พร้อมกันหลาย thread ไม่ได้ (ใช้ runtime กลางร่วมกัน)
+# --concurrency จึงเป็นการเปิดหลาย session สลับกันทีละขั้น ส่วนงานเบื้องหลัง (outbox, LINE) ยังทำงานขนานจริง
+# เวลาที่รายงานไม่รวมเวลารอคิวรัน script
+
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Customer_app.py")
+
+STAGES = ["token_validation", "taxid_search", "zip_search", "form_edit", "confirm_save", "write_behind"]
+
+
+def percentile(values, pct):
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100.0 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def install_fakes(client):
+    # แอปเรียก gspread.authorize(...) ผ่านโมดูลเดียวกัน จึงแทนที่ตรงนี้ได้เลย
+    gspread.authorize = lambda creds: client
+    ServiceAccountCredentials.from_json_keyfile_dict = classmethod(lambda cls, key_dict, scope: object())
+
+
+def button(at, text):
+    return next(b for b in at.button if text in b.label)
+
+
+def text_input(at, text):
+    return next(t for t in at.text_input if text in t.label)
+
+
+class Bench:
+    def __init__(self, args):
+        self.args = args
+        self.timings = defaultdict(list)
+        self.failures = Counter()
+        self.errors = Counter()
+        self.submitted = 0
+        self.lock = threading.Lock()
+        self.script_lock = threading.Lock()
+        self.workdir = tempfile.mkdtemp(prefix="nami-bench-")
+
+        self.tokens = [(str(uuid.uuid4()), 100.0 + i) for i in range(args.customers)]
+        self.backend = FakeBackend(args.latency_ms, args.jitter_ms, args.quota_error_rate, seed=args.seed)
+        self.client = FakeClient(self.backend)
+        self.book = seed_invoice_data(self.client, customers=args.rows, tokens=self.tokens, seed=args.seed)
+        self.line = FakeLineServer(args.line_latency_ms, args.line_error_rate, seed=args.seed).start()
+        install_fakes(self.client)
+
+    def secrets(self):
+        conf = {
+            "gcp_service_account": {"type": "service_account"},
+            "outbox": {"path": os.path.join(self.workdir, "outbox.jsonl")},
+            "line_messaging": {"channel_access_token": "bench", "group_id": "bench", "api_base": self.line.url},
+        }
+        if self.args.backend == "sqlite":
+            conf["storage"] = {"backend": "sqlite", "sqlite_path": os.path.join(self.workdir, "nami.db"), "mirror_to_sheets": True,
+                               "mirror_path": os.path.join(self.workdir, "sheets_mirror.jsonl")}
+        return conf
+
+    def timed(self, stage, fn):
+        with self.script_lock:
+            start = time.perf_counter()
+            try:
+                return fn()
+            finally:
+                with self.lock:
+                    self.timings[stage].append((time.perf_counter() - start) * 1000.0)
+
+    def token_status(self, token):
+        with self.backend.lock:
+            for row in self.book.sheets["TokenDB"].rows:
+                if row and row[0] == token:
+                    return row[2]
+        return None
+
+    def run_customer(self, i):
+        token, _ = self.tokens[i]
+        at = AppTest.from_file(APP_PATH, default_timeout=self.args.timeout)
+        for key, value in self.secrets().items():
+            at.secrets[key] = value
+        at.query_params["token"] = token
+
+        tax_id = str(1000000000000 + (i * 7919) % max(1, self.args.rows)).zfill(13)
+
+        def confirm():
+            button(at, "ตรวจสอบข้อมูล").click().run()
+            button(at, "ตรวจสอบข้อมูล").click()
+            button(at, "ถูกต้อง").click().run()
+
+        steps = [
+            ("token_validation", at.run),
+            ("taxid_search", lambda: text_input(at, "เลขผู้เสียภาษี 13 หลัก").input(tax_id).run()),
+            ("zip_search", lambda: text_input(at, "รหัสไปรษณีย์").input("11120").run()),
+            ("form_edit", lambda: at.radio[0].set_value("(สำนักงานใหญ่)").run()),
+            ("confirm_save", confirm),
+        ]
+        for stage, fn in steps:
+            submitted_at = time.perf_counter()
+            try:
+                self.timed(stage, fn)
+            except (StopIteration, IndexError):
+                pass  # หา widget ไม่เจอ แปลว่าแอปหยุดด้วย error (เช่นโดน 429)
+            if stage == "confirm_save":
+                failed = not at.session_state["submit_success"]
+            else:
+                failed = bool(at.exception or at.error)
+            if failed:
+                with self.lock:
+                    self.failures[stage] += 1
+                    for e in list(at.error) + list(at.exception):
+                        self.errors[str(e.value)[:80]] += 1
+                return
+
+        with self.lock:
+            self.submitted += 1
+
+        # รอจนกว่า outbox จะเขียน token เป็น Used ลงชีต (เวลาที่งานเบื้องหลังใช้จริง)
+        deadline = submitted_at + self.args.drain_timeout
+        while self.token_status(token) != "Used":
+            if time.perf_counter() > deadline:
+                with self.lock:
+                    self.failures["write_behind"] += 1
+                return
+            time.sleep(0.01)
+        with self.lock:
+            self.timings["write_behind"].append((time.perf_counter() - submitted_at) * 1000.0)
+
+    def run(self):
+        import streamlit as st
+
+        st.cache_resource.clear()
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.args.concurrency) as pool:
+            list(pool.map(self.run_customer, range(self.args.customers)))
+        elapsed = time.perf_counter() - started
+        time.sleep(self.args.line_settle)
+        return self.report(elapsed)
+
+    def report(self, elapsed):
+        calls = self.backend.snapshot()
+        submitted = max(1, self.submitted)
+        return {
+            "config": vars(self.args),
+            "elapsed_s": round(elapsed, 3),
+            "submitted": self.submitted,
+            "stages_ms": {
+                stage: {
+                    "n": len(self.timings[stage]),
+                    "p50": round(percentile(self.timings[stage], 50), 2),
+                    "p95": round(percentile(self.timings[stage], 95), 2),
+                    "p99": round(percentile(self.timings[stage], 99), 2),
+                }
+                for stage in STAGES
+            },
+            "failures": dict(self.failures),
+            "app_errors": dict(self.errors),
+            "sheets_calls_total": sum(calls.values()),
+            "sheets_calls_per_submission": round(sum(calls.values()) / submitted, 2),
+            "sheets_calls_by_op": {k: round(v / submitted, 2) for k, v in sorted(calls.items())},
+            "sheets_quota_errors": sum(self.backend.errors.values()),
+            "line_requests": Counter(f"{m} {p}" for m, p, _ in self.line.requests),
+            "line_messages_delivered": len(self.line.messages),
+        }
+
+
+def print_report(report):
+    print(f"\nelapsed {report['elapsed_s']} s   submitted {report['submitted']}   failures {report['failures'] or '-'}")
+    for message, n in report["app_errors"].items():
+        print(f"  {n} x {message}")
+    print(f"{'stage':<18}{'n':>5}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for stage, s in report["stages_ms"].items():
+        print(f"{stage:<18}{s['n']:>5}{s['p50']:>10}{s['p95']:>10}{s['p99']:>10}")
+    print(f"\nSheets API calls per submission: {report['sheets_calls_per_submission']} "
+          f"(quota errors injected: {report['sheets_quota_errors']})")
+    for op, n in report["sheets_calls_by_op"].items():
+        print(f"  {op:<32}{n:>8}")
+    print(f"LINE: {dict(report['line_requests'])}  messages delivered: {report['line_messages_delivered']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the token -> submit flow against local fakes")
+    parser.add_argument("--customers", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--rows", type=int, default=5000, help="rows seeded into the Customers tab")
+    parser.add_argument("--backend", choices=["sheets", "sqlite"], default="sheets")
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="simulated Sheets latency per call")
+    parser.add_argument("--jitter-ms", type=float, default=20.0)
+    parser.add_argument("--quota-error-rate", type=float, default=0.0, help="probability of a 429 per Sheets call")
+    parser.add_argument("--line-latency-ms", type=float, default=100.0)
+    parser.add_argument("--line-error-rate", type=float, default=0.0)
+    parser.add_argument("--line-settle", type=float, default=3.0, help="seconds to wait for outbox LINE pushes before reporting")
+    parser.add_argument("--drain-timeout", type=float, default=60.0)
+    parser.add_argument("--timeout", type=float, default=60.0, help="AppTest per-run timeout")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args(argv)
+
+    report = Bench(args).run()
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+import threading
+import time
+
+from customer_search import CustomerSearch
+from formatters import fix_tax_id
+from sheets import SheetsBusy
+
+# ==========================================
+# 🗂️ Index ลูกค้าในหน่วยความจำ (TaxID -> ข้อมูลลูกค้า)
+# ==========================================
+# โหลดแท็บ Customers ครั้งเดียว แล้วอ่านเพิ่มเฉพาะแถวใหม่ต่อท้าย (ใช้ watermark = จำนวนแถวที่อ่านแล้ว)
+# แทนการเรียก get_all_records() ทั้งแท็บทุกครั้งที่ค้นหา
+
+class CustomerIndex:
+    def __init__(self, worksheet, refresh_interval=5.0, rebuild_interval=900.0):
+        self.worksheet = worksheet
+        self.refresh_interval = refresh_interval   # อ่านแถวใหม่ได้ไม่ถี่กว่านี้ (วินาที)
+        self.rebuild_interval = rebuild_interval   # โหลดใหม่ทั้งแท็บเป็นระยะ เผื่อมีคนแก้ข้อมูลในชีตเอง
+        self.header = []
+        self._records = {}
+        self._search = CustomerSearch()
+        self._watermark = 0
+        self._last_refresh = 0.0
+        self._last_rebuild = 0.0
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._records)
+
+    def _make_record(self, row):
+        row = list(row) + [""] * (len(self.header) - len(row))
+        return dict(zip(self.header, row))
+
+    def _ingest(self, rows):
+        if 'TaxID' not in self.header:
+            return
+        for row in rows:
+            if not any(str(v).strip() for v in row):
+                continue
+            record = self._make_record(row)
+            key = fix_tax_id(record['TaxID'])
+            # เก็บแถวแรกที่เจอไว้ เหมือนเดิมที่ใช้ res.iloc[0]
+            if key not in self._records:
+                self._records[key] = record
+                self._search.add(record)
+
+    def rebuild(self):
+        with self._lock:
+            values = self.worksheet.get_all_values()
+            self.header = [str(h).strip() for h in values[0]] if values else []
+            self._records = {}
+            self._search = CustomerSearch()
+            self._ingest(values[1:])
+            self._watermark = len(values)
+            self._last_refresh = self._last_rebuild = time.monotonic()
+
+    def refresh(self, force=False):
+        with self._lock:
+            now = time.monotonic()
+            if not self.header:
+                self.rebuild()
+                return
+            try:
+                if now - self._last_rebuild >= self.rebuild_interval:
+                    self.rebuild()
+                    return
+                if not force and now - self._last_refresh < self.refresh_interval:
+                    return
+                from gspread.utils import rowcol_to_a1  # import gspread ตอนอ่านชีตจริง (ไม่ใช่ตอนเปิดแอป)
+
+                last_col = rowcol_to_a1(1, len(self.header)).rstrip("0123456789")
+                new_rows = self.worksheet.get_values(f"A{self._watermark + 1}:{last_col}")
+            except SheetsBusy:
+                return  # โควตาอ่านใกล้หมด ใช้ข้อมูลที่มีในเครื่องไปก่อน
+            self._ingest(new_rows)
+            self._watermark += len(new_rows)
+            self._last_refresh = now
+
+    def lookup(self, tax_id):
+        key = fix_tax_id(tax_id)
+        with self._lock:
+            if not self.header:
+                self.rebuild()
+            record = self._records.get(key)
+            if record is None:
+                # ไม่เจอ ลองอ่านเฉพาะแถวที่เพิ่มมาใหม่ (เผื่อเครื่องอื่นเพิ่งบันทึก)
+                self.refresh()
+                record = self._records.get(key)
+            return record
+
+    def search(self, query, limit=10):
+        # ค้นจากชื่อ / เบอร์โทร / เลขภาษีบางส่วน คืน [(record, score, field)]
+        with self._lock:
+            if not self.header:
+                self.rebuild()
+            else:
+                self.refresh()
+            return self._search.search(query, limit)
+
+    def contains(self, tax_id):
+        return self.lookup(tax_id) is not None
+
+    def add(self, row):
+        # เรียกหลัง append_row สำเร็จ ไม่ขยับ watermark เพราะแถวจริงจะถูกอ่านซ้ำตอน refresh (setdefault กันซ้ำให้)
+        with self._lock:
+            if self.header:
+                self._ingest([row])
@@ -0,0 +1,160 @@
+import heapq
+import re
+from bisect import bisect_left, insort
+from collections import Counter
+
+from formatters import fix_phone_number, fix_tax_id, strip_branch_suffix
+
+# ==========================================
+# 🔎 ค้นหาลูกค้าจาก ชื่อ / เบอร์โทร / เลขภาษีบางส่วน
+# ==========================================
+# - เลขภาษี / เบอร์โทร : list ที่เรียงไว้ + bisect หาแบบขึ้นต้นด้วย (prefix)
+# - ชื่อ : ตัดคำท้าย (สำนักงานใหญ่)/(สาขา ...) คำว่า บริษัท/จำกัด และวรรณยุกต์ออก
+#          แล้วทำ index แบบ 3 ตัวอักษร (trigram) ภาษาไทยไม่มีเว้นวรรคระหว่างคำจึงไม่ตัดคำ
+# เพิ่มทีละรายการได้ (add) ไม่ต้องสร้างใหม่ทั้งหมดเมื่อมีลูกค้าใหม่
+
+COMPANY_WORDS = sorted([
+    "ห้างหุ้นส่วนจำกัด", "ห้างหุ้นส่วนสามัญ", "บริษัท", "บจก.", "บจก", "หจก.", "หจก", "จำกัด", "มหาชน",
+    "company limited", "co., ltd.", "co.,ltd.", "co.ltd.", "co., ltd", "co.,ltd", "limited", "ltd.", "ltd",
+], key=len, reverse=True)
+
+THAI_MARKS = re.compile("[\u0e47-\u0e4e]")           # ไม้ไต่คู้ วรรณยุกต์ การันต์ (พิมพ์ผิดบ่อย)
+NON_WORD = re.compile("[^0-9a-z\u0e00-\u0e7f]+")
+
+MAX_POSTING = 5000     # trigram ที่มีในชื่อเยอะเกินนี้ไม่ช่วยคัด (เช่น "ร้าน") ข้ามไป
+MAX_CANDIDATES = 200   # จำนวนชื่อที่นำมาคิดคะแนนละเอียด
+MIN_SCORE = 0.3
+
+
+def normalize_name(name):
+    s = strip_branch_suffix(str(name)).lower()
+    for word in COMPANY_WORDS:
+        s = s.replace(word, " ")
+    s = THAI_MARKS.sub("", s)
+    return NON_WORD.sub("", s)
+
+
+def phone_key(phone):
+    digits = re.sub(r"\D", "", fix_phone_number(phone))
+    if digits.startswith("66") and len(digits) == 11:
+        digits = "0" + digits[2:]   # +66 8x-xxx-xxxx
+    return digits
+
+
+def trigrams(s):
+    padded = f"^{s}$"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class CustomerSearch:
+    def __init__(self):
+        self._records = []       # id -> record (dict ตาม CUSTOMER_COLUMNS)
+        self._names = []         # id -> ชื่อที่ normalize แล้ว
+        self._ids = {}           # tax key -> id
+        self._tax_keys = []      # [(tax key, id)] เรียงไว้
+        self._phones = []        # [(phone key, id)] เรียงไว้
+        self._grams = {}         # trigram -> [id, ...]
+
+    def __len__(self):
+        return len(self._records)
+
+    def add(self, record):
+        key = fix_tax_id(record.get('TaxID', ""))
+        if not key:
+            return
+        doc_id = self._ids.get(key)
+        if doc_id is not None:
+            # ลูกค้าเดิมถูกแก้ข้อมูล (เช่น แอดมินรวมรายการซ้ำ) ลบ index ของเบอร์/ชื่อเดิมก่อน ไม่ให้ค้นด้วยข้อมูลเก่าแล้วเจอ
+            self._unindex(doc_id)
+            self._records[doc_id] = record
+        else:
+            doc_id = len(self._records)
+            self._records.append(record)
+            self._names.append("")
+            self._ids[key] = doc_id
+            insort(self._tax_keys, (key, doc_id))
+
+        phone = phone_key(record.get('Phone', ""))
+        if len(phone) >= 6:
+            insort(self._phones, (phone, doc_id))
+
+        name = normalize_name(record.get('Name', ""))
+        self._names[doc_id] = name
+        for gram in trigrams(name) if name else ():
+            insort(self._grams.setdefault(gram, []), doc_id)
+
+    def _unindex(self, doc_id):
+        # ลบเบอร์โทรและ trigram ของชื่อเดิมออกจาก index (เลขภาษีเป็น key เดิม ไม่ต้องลบ)
+        phone = phone_key(self._records[doc_id].get('Phone', ""))
+        i = bisect_left(self._phones, (phone, doc_id))
+        if i < len(self._phones) and self._phones[i] == (phone, doc_id):
+            del self._phones[i]
+        name = self._names[doc_id]
+        for gram in trigrams(name) if name else ():
+            posting = self._grams.get(gram)
+            i = bisect_left(posting, doc_id) if posting else 0
+            if posting and i < len(posting) and posting[i] == doc_id:
+                del posting[i]
+                if not posting:
+                    del self._grams[gram]
+
+    # ---------- ค้นหา ----------
+    def search(self, query, limit=10):
+        # คืน [(record, score, field)] เรียงจากตรงที่สุด field คือ 'taxid' / 'phone' / 'name'
+        query = str(query).strip()
+        compact = re.sub(r"[\s\-']", "", query)
+        if not compact:
+            return []
+        if compact.isdigit() or (compact.startswith("+") and compact[1:].isdigit()):
+            return self._search_digits(compact.lstrip("+"), limit)
+        return self._search_name(query, limit)
+
+    def _prefix(self, table, prefix, limit):
+        i = bisect_left(table, (prefix, -1))
+        out = []
+        while i < len(table) and table[i][0].startswith(prefix) and len(out) < limit:
+            out.append(table[i])
+            i += 1
+        return out
+
+    def _search_digits(self, digits, limit):
+        results, seen = [], set()
+        for key, doc_id in self._prefix(self._tax_keys, digits, limit):
+            seen.add(doc_id)
+            results.append((self._records[doc_id], 1.0 if key == digits else 0.9, 'taxid'))
+        phone = phone_key(digits)
+        if len(phone) >= 3:
+            for key, doc_id in self._prefix(self._phones, phone, limit):
+                if doc_id not in seen:
+                    seen.add(doc_id)
+                    results.append((self._records[doc_id], 1.0 if key == phone else 0.85, 'phone'))
+        results.sort(key=lambda r: -r[1])
+        return results[:limit]
+
+    def _search_name(self, query, limit):
+        name = normalize_name(query)
+        if len(name) < 2:
+            return []
+        grams = trigrams(name)
+        postings = sorted((self._grams.get(g, ()) for g in grams), key=len)
+        useful = [p for p in postings if 0 < len(p) <= MAX_POSTING] or [p for p in postings if p][:1]
+        counts = Counter()
+        for posting in useful:
+            counts.update(posting)
+
+        scored = []
+        for doc_id, _ in counts.most_common(MAX_CANDIDATES):
+            doc_name = self._names[doc_id]
+            if doc_name == name:
+                score = 1.0
+            else:
+                # ส่วนใหญ่ลูกค้าพิมพ์แค่บางส่วนของชื่อ จึงให้น้ำหนักกับ "คำค้นอยู่ในชื่อมากแค่ไหน" มากกว่าความเหมือนทั้งชื่อ
+                doc_grams = trigrams(doc_name)
+                common = len(grams & doc_grams)
+                score = 0.7 * common / len(grams) + 0.3 * 2 * common / (len(grams) + len(doc_grams))
+                if name in doc_name:
+                    score = min(0.99, score + 0.1)
+            if score >= MIN_SCORE:
+                scored.append((round(score, 3), -len(doc_name), -doc_id))
+        best = heapq.nlargest(limit, scored)
+        return [(self._records[-neg_id], score, 'name') for score, _, neg_id in best]
@@ -0,0 +1,134 @@
+import argparse
+import csv
+import os
+import time
+from datetime import datetime
+
+import pandas as pd
+
+# ==========================================
+# 🧽 จัดระเบียบแท็บ Customers ทั้งแท็บ (เลขภาษี / เบอร์โทร / ลูกค้าซ้ำ)
+# ==========================================
+# อ่านทั้งแท็บครั้งเดียว จัดรูปแบบด้วย pandas ทั้งคอลัมน์ (ผลเหมือน fix_tax_id / fix_phone_number ทุกค่า)
+# ลบแถวที่เลขภาษีซ้ำกัน เก็บแถวล่าสุด (แถวล่างสุด) แล้วเขียนกลับด้วย update ครั้งเดียว (RAW เลข 0 นำหน้าไม่หาย)
+#
+#   python customers_maintenance.py --dry-run            # ดูว่าจะเปลี่ยนอะไร ไม่เขียน
+#   python customers_maintenance.py --report changes.csv # เขียนจริง + รายงานทุกค่าที่เปลี่ยน / แถวที่ลบ
+#
+# ก่อนเขียนจะบันทึกแท็บเดิมเป็น CSV ไว้ (--backup) และเช็คว่าไม่มีใครเพิ่มแถวระหว่างทำ
+# แอปที่เปิดอยู่จะเห็นข้อมูลใหม่ตอน CustomerIndex โหลดใหม่ทั้งแท็บ (rebuild_interval) หรือเปิดแอปใหม่
+
+
+def normalize_tax_ids(values):
+    # เหมือน fix_tax_id: ตัดช่องว่าง / - / ' , ตัด .0 ท้าย, ตัวเลขไม่ถึง 13 หลักเติม 0 ข้างหน้า
+    s = values.astype(str).str.strip().str.replace(r"[- ']", "", regex=True).str.replace(r"\.0$", "", regex=True)
+    short = s.str.isdigit() & (s.str.len() < 13)
+    return s.mask(short, s.str.zfill(13))
+
+
+def normalize_phones(values):
+    # เหมือน fix_phone_number: ค่าว่างเป็น "", ตัด ' , - , ตัวเลข 9 หลักเติม 0 ข้างหน้า
+    blank = values.isna() | (values.astype(str).str.strip() == "")
+    s = values.astype(str).str.replace(r"[',-]", "", regex=True).str.strip()
+    s = s.mask(s.str.isdigit() & (s.str.len() == 9), "0" + s)
+    return s.mask(blank, "")
+
+
+def plan(values):
+    # values = get_all_values() ของแท็บ Customers คืน dict ของผลลัพธ์ (ยังไม่เขียน)
+    header = [str(h).strip() for h in values[0]]
+    for column in ("TaxID", "Phone"):
+        if column not in header:
+            raise SystemExit(f"Customers tab has no {column} column (header: {header})")
+    width = len(header)
+    df = pd.DataFrame([list(r[:width]) + [""] * (width - len(r)) for r in values[1:]], columns=header, dtype=str)
+    df["_row"] = range(2, len(df) + 2)      # เลขแถวในชีต (ใช้ในรายงาน)
+
+    before = df[["TaxID", "Phone"]].copy()
+    df["TaxID"] = normalize_tax_ids(df["TaxID"])
+    df["Phone"] = normalize_phones(df["Phone"])
+
+    changes = []
+    for column in ("TaxID", "Phone"):
+        changed = before[column] != df[column]
+        for row, old, new in zip(df.loc[changed, "_row"], before.loc[changed, column], df.loc[changed, column]):
+            changes.append((row, column, old, new))
+
+    # แถวว่างทั้งแถวทิ้งไป แถวที่ไม่มีเลขภาษีเก็บไว้ทั้งหมด (ไม่รู้ว่าซ้ำกับใคร)
+    empty = (df[header].apply(lambda col: col.str.strip()) == "").all(axis=1)
+    duplicate = df["TaxID"].ne("") & df.duplicated("TaxID", keep="last")
+    removed = df[duplicate | empty]
+    kept = df[~(duplicate | empty)]
+    return {
+        "header": header,
+        "rows": kept[header].values.tolist(),
+        "old_rows": len(values),
+        "changes": changes,
+        "removed": removed,
+        "duplicates": int(duplicate.sum()),
+        "empty": int((empty & ~duplicate).sum()),
+    }
+
+
+def write_back(worksheet, result, original):
+    # เขียนทับตั้งแต่ A1 ถึงแถวสุดท้ายเดิม แถวที่เหลือเติมค่าว่าง (update ครั้งเดียว ไม่ต้อง clear ก่อน)
+    from gspread.utils import rowcol_to_a1
+
+    # อ่านซ้ำก่อนเขียน: ถ้ามีคนเพิ่ม/แก้ลูกค้าระหว่างนี้ ไม่เขียนทับ (แถวล่างสุดที่ว่างคอลัมน์ A ก็นับด้วย)
+    if worksheet.get_all_values() != original:
+        raise SystemExit("Customers tab changed while running, nothing written; run again")
+    values = [result["header"]] + result["rows"]
+    values += [[""] * len(result["header"])] * (result["old_rows"] - len(values))
+    worksheet.update(values, f"A1:{rowcol_to_a1(len(values), len(result['header']))}")
+
+
+def write_report(path, result):
+    with open(path, "w", encoding="utf-8-sig", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["row", "action", "column", "old", "new"])
+        for row, column, old, new in result["changes"]:
+            writer.writerow([row, "normalized", column, old, new])
+        for _, record in result["removed"].iterrows():
+            writer.writerow([record["_row"], "removed", "TaxID", record["TaxID"], ""])
+
+
+def main(argv=None):
+    from sheets import load_secrets, registry_from_secrets
+    from tenants import tenant_secrets
+
+    parser = argparse.ArgumentParser(description="Normalize TaxID / Phone and remove duplicate customers in the Customers tab")
+    parser.add_argument("--secrets", default=".streamlit/secrets.toml")
+    parser.add_argument("--tenant", help="shop key from [tenants] (default: default_tenant)")
+    parser.add_argument("--dry-run", action="store_true", help="only report what would change")
+    parser.add_argument("--report", help="CSV of every normalized value and removed row")
+    parser.add_argument("--backup", default=f"data/customers_backup_{datetime.now():%Y%m%d_%H%M%S}.csv")
+    args = parser.parse_args(argv)
+
+    registry = registry_from_secrets(tenant_secrets(load_secrets(args.secrets), args.tenant))
+    worksheet = registry.worksheet("Customers")
+    values = worksheet.get_all_values()
+    if not values:
+        print("Customers tab is empty")
+        return
+
+    started = time.perf_counter()
+    result = plan(values)
+    elapsed = time.perf_counter() - started
+    changed_tax = sum(1 for c in result["changes"] if c[1] == "TaxID")
+    print(f"{len(values) - 1} rows in {elapsed:.2f}s: {changed_tax} TaxID and {len(result['changes']) - changed_tax} phone values "
+          f"normalized, {result['duplicates']} duplicate and {result['empty']} empty rows removed, {len(result['rows'])} rows kept")
+    if args.report:
+        write_report(args.report, result)
+        print(f"report: {args.report}")
+    if args.dry_run or not (result["changes"] or len(result["removed"])):
+        return
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.backup)), exist_ok=True)
+    with open(args.backup, "w", encoding="utf-8-sig", newline="") as f:
+        csv.writer(f).writerows(values)
+    write_back(worksheet, result, values)
+    print(f"written (backup of the old tab: {args.backup})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+import json
+import os
+import re
+import threading
+import time
+from collections import defaultdict
+from datetime import timedelta
+
+from invoice_pipeline import COL_PRICE, COL_STATUS, COL_TS, STATUS_COLUMN
+from sheets import SheetsBusy
+from storage import QUEUE_CONFLICT
+
+# ==========================================
+# 📈 ภาพรวมร้านสำหรับหน้าแอดมิน (ยอดขายรายวัน/รายชั่วโมง, token ที่ถูกใช้, คิว Pending)
+# ==========================================
+# ไม่อ่านทั้งแท็บทุกครั้งที่ Streamlit รันใหม่:
+# - Queue / TokenDB : เก็บเฉพาะคอลัมน์ที่ใช้ (วันที่ / ยอด / สถานะ) ในหน่วยความจำ อ่านเพิ่มเฉพาะแถวใหม่หลัง watermark
+#                     พร้อมคอลัมน์สถานะของแถวเดิม (Pending -> Invoiced, Active -> Used) ใน batch_get เดียว
+#                     แถวแรก / แถวที่ watermark ไม่ตรง (retention ลบแถวออก) จะโหลดใหม่ทั้งแท็บ
+# - แท็บเก็บถาวรรายเดือน (Queue_YYYY-MM / TokenDB_YYYY-MM) : แถวไม่เปลี่ยนแล้ว อ่านเพิ่มเฉพาะแถวใหม่ของทุกแท็บ
+#                     ในคำสั่งเดียว แล้วเก็บผลรวมลงไฟล์ (เปิดแอปใหม่ไม่ต้องอ่านย้อนหลังทั้งปีอีก)
+# ผลรวมทุกตัวบวก/ลบทีละแถว: แถวใหม่ +1, สถานะเปลี่ยน = ลบแถวเดิมแล้วบวกแถวใหม่
+#
+# [dashboard]
+# cache_path = "data/dashboard.json"
+# refresh_interval = 30      # อ่าน Queue / TokenDB ได้ไม่ถี่กว่านี้ (วินาที)
+# archive_interval = 3600    # เช็คแท็บเก็บถาวรรายเดือน (retention ทำงานวันละครั้ง)
+# history_days = 400
+
+TOKEN_TS, TOKEN_AMOUNT, TOKEN_STATUS = 3, 1, 2      # TokenDB: Token | Amount | Status | Timestamp
+# (แท็บ, คอลัมน์สุดท้ายที่อ่าน, คอลัมน์สถานะ, ตำแหน่ง วันที่ / ยอด / สถานะ ในแถว)
+LAYOUTS = {
+    "Queue": (STATUS_COLUMN, STATUS_COLUMN, (COL_TS, COL_PRICE, COL_STATUS)),
+    "TokenDB": ("D", "C", (TOKEN_TS, TOKEN_AMOUNT, TOKEN_STATUS)),
+}
+_ARCHIVE_TITLE = re.compile(r"^(Queue|TokenDB)_(\d{4}-\d{2})$")
+
+
+def _amount(value):
+    try:
+        return float(str(value).replace(",", "").replace("฿", "").strip() or 0)
+    except ValueError:
+        return 0.0
+
+
+def _cell(row, i):
+    return str(row[i]).strip() if i < len(row) else ""
+
+
+# ==========================================
+# ➕ ผลรวมที่บวก/ลบทีละแถวได้
+# ==========================================
+class Aggregates:
+    SUMS = ("revenue_day", "orders_day", "revenue_hour", "created_day", "used_day")
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.revenue_day = defaultdict(float)   # "YYYY-MM-DD" -> ยอดขาย
+        self.orders_day = defaultdict(int)
+        self.revenue_hour = defaultdict(float)  # "YYYY-MM-DD HH" -> ยอดขาย
+        self.created_day = defaultdict(int)     # token ที่สร้าง (ตามวันที่สร้าง)
+        self.used_day = defaultdict(int)        # token ที่สร้างวันนั้นและถูกใช้แล้ว
+        self.pending = 0
+        self.pending_amount = 0.0
+        self.conflicts = 0
+
+    def apply(self, tab, ts, amount, status, sign=1):
+        day = ts[:10]
+        if len(day) != 10 or day[4] != "-":
+            return  # แถวว่าง / หัวตาราง / วันที่อ่านไม่ออก
+        if tab == "TokenDB":
+            self.created_day[day] += sign
+            if status == "Used":
+                self.used_day[day] += sign
+            return
+        if status == QUEUE_CONFLICT:
+            self.conflicts += sign
+            return  # token ถูกใช้ซ้ำ ไม่นับเป็นยอดขาย
+        if not status:
+            return
+        value = _amount(amount) * sign
+        if status == "Pending":
+            self.pending += sign
+            self.pending_amount += value
+        self.revenue_day[day] += value
+        self.orders_day[day] += sign
+        self.revenue_hour[f"{day} {ts[11:13]}"] += value
+
+    def merge(self, *others):
+        out = Aggregates()
+        for agg in (self, *others):
+            for name in self.SUMS:
+                target = getattr(out, name)
+                for key, value in getattr(agg, name).items():
+                    target[key] += value
+            out.pending += agg.pending
+            out.pending_amount += agg.pending_amount
+            out.conflicts += agg.conflicts
+        return out
+
+    def prune(self, before):
+        # ทิ้งวันที่เก่ากว่า before ("YYYY-MM-DD")
+        for name in self.SUMS:
+            values = getattr(self, name)
+            for key in [k for k in values if k[:10] < before]:
+                del values[key]
+
+    def to_dict(self):
+        return {name: dict(getattr(self, name)) for name in self.SUMS}
+
+    @classmethod
+    def from_dict(cls, data):
+        agg = cls()
+        for name in cls.SUMS:
+            getattr(agg, name).update(data.get(name, {}))
+        return agg
+
+    # ---------- อ่านค่าสำหรับกราฟ ----------
+    def daily(self, name, start, end):
+        # [(วันที่, ค่า)] ทุกวันตั้งแต่ start ถึง end (date) วันที่ไม่มีข้อมูลเป็น 0
+        values = getattr(self, name)
+        days = (end - start).days + 1
+        return [(d, values.get(d, 0)) for d in ((start + timedelta(days=i)).isoformat() for i in range(days))]
+
+    def hourly(self, start, end):
+        # ยอดขายรวมแยกตามชั่วโมงของวัน (00-23) ในช่วง start ถึง end
+        start, end = start.isoformat(), end.isoformat()
+        out = defaultdict(float)
+        for key, value in self.revenue_hour.items():
+            if start <= key[:10] <= end:
+                out[key[11:13]] += value
+        return [(f"{h:02d}", out.get(f"{h:02d}", 0.0)) for h in range(24)]
+
+
+# ==========================================
+# 🧱 สำเนาแบบแยกคอลัมน์ของ Queue / TokenDB (watermark)
+# ==========================================
+class TabColumns:
+    def __init__(self, worksheet, tab, totals):
+        self.worksheet = worksheet
+        self.tab = tab
+        self.totals = totals
+        self.last_col, self.status_col, (self._ts_i, self._amount_i, self._status_i) = LAYOUTS[tab]
+        self.ts, self.amount, self.status = [], [], []   # แถวที่ 2 เป็นต้นไป (index 0 = แถว 2)
+        self._watermark = None    # แถวที่อ่านแล้ว (รวมหัวตาราง) None = ต้องโหลดทั้งแท็บ
+        self._head = ""           # คอลัมน์ A แถว 2
+        self._edge = ""           # คอลัมน์ A แถวที่ watermark
+
+    def _append(self, rows):
+        for row in rows:
+            ts, amount, status = _cell(row, self._ts_i), _cell(row, self._amount_i), _cell(row, self._status_i)
+            self.ts.append(ts)
+            self.amount.append(amount)
+            self.status.append(status)
+            self.totals.apply(self.tab, ts, amount, status)
+
+    def full(self):
+        values = self.worksheet.batch_get([f"A2:{self.last_col}"])[0]
+        self.totals.reset()
+        self.ts, self.amount, self.status = [], [], []
+        self._append(values)
+        self._watermark = 1 + len(values)
+        self._head = _cell(values[0], 0) if values else ""
+        self._edge = _cell(values[-1], 0) if values else ""
+
+    def delta(self):
+        # คืน False ถ้าแถวเดิมถูกลบ/เลื่อน (โหลดทั้งแท็บแทนแล้ว)
+        wm = self._watermark
+        ranges = ["A2:A2", f"A{wm}:A{wm}", f"A{wm + 1}:{self.last_col}"]
+        if wm > 1:
+            ranges.append(f"{self.status_col}2:{self.status_col}{wm}")
+        first, edge, new, *status = self.worksheet.batch_get(ranges)
+        if _cell(first[0] if first else [], 0) != self._head or \
+                (wm > 1 and _cell(edge[0] if edge else [], 0) != self._edge):
+            self.full()
+            return False
+        # แถวเดิมที่สถานะเปลี่ยน: ลบค่าเก่าออกจากผลรวม แล้วบวกค่าใหม่
+        for i, row in enumerate(status[0] if status else []):
+            value = _cell(row, 0)
+            if i < len(self.status) and value != self.status[i]:
+                self.totals.apply(self.tab, self.ts[i], self.amount[i], self.status[i], -1)
+                self.status[i] = value
+                self.totals.apply(self.tab, self.ts[i], self.amount[i], value)
+        # แถวท้ายที่สถานะถูกลบเป็นค่าว่าง Sheets จะไม่ส่งมา
+        for i in range(len(status[0]) if status else 0, len(self.status)):
+            if self.status[i]:
+                self.totals.apply(self.tab, self.ts[i], self.amount[i], self.status[i], -1)
+                self.status[i] = ""
+        self._append(new)
+        if new:
+            self._watermark += len(new)
+            self._edge = _cell(new[-1], 0)
+        return True
+
+    def sync(self):
+        # คืน True ถ้าต้องโหลดทั้งแท็บ (ครั้งแรก หรือแถวถูกย้ายไปเก็บถาวร)
+        if self._watermark is None:
+            self.full()
+            return True
+        return not self.delta()
+
+
+class Dashboard:
+    def __init__(self, registry, cache_path=None, refresh_interval=30.0, archive_interval=3600.0, history_days=400):
+        self.registry = registry
+        self.cache_path = cache_path
+        self.refresh_interval = refresh_interval
+        self.archive_interval = archive_interval
+        self.history_days = history_days
+        self.live = {tab: Aggregates() for tab in LAYOUTS}
+        self.tabs = {tab: TabColumns(registry.worksheet(tab), tab, self.live[tab]) for tab in LAYOUTS}
+        self.archive = Aggregates()
+        self._marks = {}              # แท็บเก็บถาวร -> แถวที่อ่านแล้ว (รวมหัวตาราง)
+        self.last_error = None
+        self.updated_at = None        # time.time() ของการอ่านสำเร็จครั้งล่าสุด
+        self._last_refresh = 0.0
+        self._last_archive = 0.0
+        self._lock = threading.Lock()
+        self._load()
+
+    # ---------- ไฟล์ผลรวมของแท็บเก็บถาวร ----------
+    def _load(self):
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return
+        try:
+            with open(self.cache_path, encoding="utf-8") as f:
+                data = json.load(f)
+        except ValueError:
+            return  # ไฟล์เสีย อ่านแท็บเก็บถาวรใหม่
+        self._marks = data.get("marks", {})
+        self.archive = Aggregates.from_dict(data.get("archive", {}))
+
+    def _save(self):
+        if not self.cache_path:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.cache_path)), exist_ok=True)
+        tmp_path = self.cache_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"marks": self._marks, "archive": self.archive.to_dict()}, f)
+        os.replace(tmp_path, self.cache_path)
+
+    def _refresh_archive(self, today):
+        cutoff = (today - timedelta(days=self.history_days)).isoformat()
+        titles = set(self.registry.titles())
+        if any(title not in titles for title in self._marks):
+            self._marks, self.archive = {}, Aggregates()  # มีแท็บถูกลบ/เปลี่ยนชื่อ นับใหม่ทั้งหมด
+        wanted = sorted(t for t in titles if _ARCHIVE_TITLE.match(t) and _ARCHIVE_TITLE.match(t).group(2) >= cutoff[:7])
+        if wanted:
+            ranges = [f"'{t}'!A{self._marks.get(t, 1) + 1}:{LAYOUTS[t.split('_')[0]][0]}" for t in wanted]
+            for title, rows in zip(wanted, self.registry.values_batch_get(ranges)):
+                tab = title.split("_")[0]
+                ts_i, amount_i, status_i = LAYOUTS[tab][2]
+                for row in rows:
+                    self.archive.apply(tab, _cell(row, ts_i), _cell(row, amount_i), _cell(row, status_i))
+                self._marks[title] = self._marks.get(title, 1) + len(rows)
+        self._marks = {t: n for t, n in self._marks.items() if t in wanted}
+        self.archive.prune(cutoff)
+        self._save()
+        self._last_archive = time.monotonic()
+
+    def refresh(self, today, force=False):
+        # today = date ตามเวลาร้าน คืน True ถ้าอ่านสำเร็จ (ข้อมูลเก่ายังใช้ได้ถ้าไม่สำเร็จ)
+        with self._lock:
+            now = time.monotonic()
+            if not force and self.updated_at is not None and now - self._last_refresh < self.refresh_interval:
+                return True
+            self._last_refresh = now
+            try:
+                moved = False
+                for columns in self.tabs.values():
+                    moved = columns.sync() or moved
+                # แถวถูกย้ายออกจาก Queue / TokenDB = retention เพิ่งเขียนแท็บเก็บถาวร อ่านตามทันที
+                if moved or force or now - self._last_archive >= self.archive_interval:
+                    self._refresh_archive(today)
+            except SheetsBusy:
+                return False  # โควตาอ่านไม่พอ แสดงข้อมูลเดิมไปก่อน
+            except Exception as e:
+                self.last_error = str(e)
+                return False
+            self.last_error = None
+            self.updated_at = time.time()
+            return True
+
+    def totals(self):
+        with self._lock:
+            return self.archive.merge(*self.live.values())
+
+
+def dashboard_from_conf(registry, conf=None):
+    conf = conf or {}
+    return Dashboard(
+        registry,
+        cache_path=conf.get("cache_path", "data/dashboard.json"),
+        refresh_interval=conf.get("refresh_interval", 30),
+        archive_interval=conf.get("archive_interval", 3600),
+        history_days=conf.get("history_days", 400),
+    )
@@ -0,0 +1,24 @@
+import math
+import re
+
+# ==========================================
+# 🧹 ฟังก์ชันจัดรูปแบบข้อมูลลูกค้า (ใช้ร่วมกันทั้งแอปและ Index)
+# ==========================================
+
+def fix_phone_number(phone_val):
+    # ค่าว่างจากชีต / SQLite มาเป็น None, "" หรือ NaN (ไม่ต้องพึ่ง pandas แค่เพื่อเช็คค่าว่าง)
+    if phone_val is None or (isinstance(phone_val, float) and math.isnan(phone_val)) or str(phone_val).strip() == "": return ""
+    s = str(phone_val).replace("'", "").replace(",", "").replace("-", "").strip()
+    if s.isdigit() and len(s) == 9: return "0" + s
+    return s
+
+def fix_tax_id(tax_val):
+    s = str(tax_val).strip().replace("-", "").replace(" ", "").replace("'", "")
+    if s.endswith(".0"): s = s[:-2]
+    if s.isdigit() and len(s) < 13: s = s.zfill(13)
+    return s
+
+def strip_branch_suffix(name):
+    # ตัด (สำนักงานใหญ่) / (สาขา ...) ท้ายชื่อ ให้ลูกค้าเลือกประเภทสาขาใหม่เองในฟอร์ม
+    name = re.sub(r'\s*\(สำนักงานใหญ่\)$', '', str(name))
+    return re.sub(r'\s*\(สาขา.*?\)$', '', name)
@@ -0,0 +1,313 @@
+import argparse
+import io
+import os
+import zipfile
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+# ==========================================
+# 🧾 ออกใบกำกับภาษีจากแท็บ Queue ทีละชุด (งานปลายวัน)
+# ==========================================
+# 1. อ่านแท็บ Queue ทีละหน้า (ไม่ get_all_values ทั้งแท็บ) เลือกเฉพาะแถว Pending
+# 2. วาด PDF ใน process pool แบบ spawn (โหลดฟอนต์และแม่แบบครั้งเดียวต่อ process)
+# 3. เขียน PDF ลงดิสก์ (out_dir) ก่อน แล้วค่อยเปลี่ยนสถานะทุกแถวที่ทำเสร็จด้วย batch_update ครั้งเดียว
+#    แถวที่ถูกแก้ระหว่างนั้น (mark_done ข้าม) ยังเป็น Pending: ลบไฟล์ของแถวนั้นทิ้งและไม่คืนในผลลัพธ์
+#   python -m invoice_pipeline --secrets .streamlit/secrets.toml --out invoices/
+# ไฟล์นี้ห้าม import streamlit เพราะ process ลูกจะ import โมดูลนี้ใหม่
+#
+# ภาษาไทยต้องใช้ฟอนต์ที่มีอักษรไทย ไม่มีค่าเริ่มต้น ต้องกำหนด font_path ใน secrets เสมอ
+# (เช่น Sarabun-Regular.ttf จาก Google Fonts สัญญาอนุญาต OFL หรือ TH Sarabun New)
+# [invoice]
+# font_path = "data/fonts/Sarabun-Regular.ttf"
+# seller_name = "ร้าน Nami"
+# seller_tax_id = "0105556000000"
+# seller_address = "..."
+# vat_rate = 7
+# out_dir = "data/invoices"   # ที่เก็บ PDF ของใบที่ออกแล้ว (ปุ่มในหน้าแอดมิน)
+
+# คอลัมน์ที่ save_data_to_system เขียนลง Queue (A:K)
+QUEUE_RANGE_END = "K"
+COL_TS, COL_NAME, COL_TAX, COL_ADDR1, COL_ADDR2, COL_PHONE, COL_ITEM, COL_QTY, COL_PRICE, COL_STATUS, COL_TOKEN = range(11)
+STATUS_COLUMN = "J"
+TOKEN_COLUMN = "K"
+
+PAGE_SIZE = (1654, 2339)      # A4 ที่ 200 dpi
+DPI = 200
+MARGIN = 120
+CUSTOMER_LABELS = ["ชื่อลูกค้า", "เลขประจำตัวผู้เสียภาษี", "ที่อยู่", "", "โทร"]
+CUSTOMER_LABEL_WIDTH = 440
+CHUNK = 25                    # จำนวนใบต่องานที่ส่งให้ process ลูก
+
+_worker = {}                  # ฟอนต์และแม่แบบของ process นี้ (สร้างใน _init_worker)
+
+
+# ---------- อ่าน Queue ----------
+def iter_pending(worksheet, page_size=200):
+    # คืน (เลขแถว, ค่าในแถว) ของแถวที่ยัง Pending อ่านทีละ page_size แถว
+    start = 2
+    while True:
+        rows = worksheet.get_values(f"A{start}:{QUEUE_RANGE_END}{start + page_size - 1}")
+        for offset, row in enumerate(rows):
+            row = list(row) + [""] * (COL_TOKEN + 1 - len(row))
+            if str(row[COL_STATUS]).strip() == "Pending":
+                yield start + offset, row
+        if len(rows) < page_size:
+            return
+        start += page_size
+
+
+def invoice_number(row_no, row):
+    date = "".join(ch for ch in str(row[COL_TS])[:10] if ch.isdigit()) or "00000000"
+    return f"INV{date}-{row_no:05d}"
+
+
+# ---------- วาด PDF (ทำงานใน process ลูก) ----------
+def _init_worker(font_path, seller):
+    from PIL import Image, ImageDraw, ImageFont
+
+    # ไม่มีฟอนต์ไทยห้ามวาด (ฟอนต์เริ่มต้นของ Pillow แสดงภาษาไทยเป็นกล่องสี่เหลี่ยม) run_batch เช็คไว้ก่อนแล้ว
+    fonts = {name: ImageFont.truetype(font_path, size)
+             for name, size in (("title", 56), ("head", 38), ("body", 34), ("small", 28))}
+
+    # ส่วนที่เหมือนกันทุกใบ วาดครั้งเดียวแล้ว copy ไปใช้
+    template = Image.new("L", PAGE_SIZE, 255)
+    draw = ImageDraw.Draw(template)
+    width = PAGE_SIZE[0]
+    draw.text((width / 2, MARGIN), "ใบกำกับภาษี / ใบเสร็จรับเงิน", font=fonts["title"], fill=0, anchor="mt")
+    draw.text((width / 2, MARGIN + 75), "TAX INVOICE / RECEIPT", font=fonts["small"], fill=0, anchor="mt")
+    y = MARGIN + 150
+    for line in [seller.get("seller_name", ""), seller.get("seller_address", ""),
+                 f"เลขประจำตัวผู้เสียภาษี {seller.get('seller_tax_id', '')}"]:
+        if line.strip():
+            draw.text((MARGIN, y), line, font=fonts["body"], fill=0)
+            y += 50
+    draw.line([(MARGIN, 520), (width - MARGIN, 520)], fill=0, width=3)
+    draw.rectangle([MARGIN, 1000, width - MARGIN, 1080], outline=0, width=3)
+    draw.text((MARGIN + 20, 1040), "รายการ", font=fonts["head"], fill=0, anchor="lm")
+    draw.text((width - MARGIN - 420, 1040), "จำนวน", font=fonts["head"], fill=0, anchor="rm")
+    draw.text((width - MARGIN - 20, 1040), "จำนวนเงิน (บาท)", font=fonts["head"], fill=0, anchor="rm")
+    draw.text((width - MARGIN - 420, MARGIN + 150), "เลขที่", font=fonts["body"], fill=0, anchor="ra")
+    draw.text((width - MARGIN - 420, MARGIN + 200), "วันที่", font=fonts["body"], fill=0, anchor="ra")
+    for i, label in enumerate(CUSTOMER_LABELS):
+        draw.text((MARGIN, 560 + i * 75), label, font=fonts["body"], fill=0)
+    draw.line([(MARGIN, 1200), (width - MARGIN, 1200)], fill=0, width=2)
+    vat_rate = float(seller.get("vat_rate", 7))
+    for i, label in enumerate(["มูลค่าก่อนภาษี", f"ภาษีมูลค่าเพิ่ม {vat_rate:g}%", "รวมทั้งสิ้น"]):
+        draw.text((width - MARGIN - 420, 1240 + i * 65), label, font=fonts["head"], fill=0, anchor="ra")
+
+    _worker.update(fonts=fonts, template=template, vat_rate=vat_rate)
+
+
+def render_invoice(invoice_no, row):
+    # คืนภาพขาวดำ 1 bit ที่บีบอัดแล้ว (ใช้ใส่ใน PDF ได้ตรงๆ ดู pdf_document)
+    import numpy as np
+    from PIL import ImageDraw
+
+    fonts = _worker["fonts"]
+    page = _worker["template"].copy()
+    draw = ImageDraw.Draw(page)
+    width = PAGE_SIZE[0]
+
+    draw.text((width - MARGIN, MARGIN + 150), invoice_no, font=fonts["body"], fill=0, anchor="ra")
+    draw.text((width - MARGIN, MARGIN + 200), str(row[COL_TS]), font=fonts["body"], fill=0, anchor="ra")
+    for i, col in enumerate([COL_NAME, COL_TAX, COL_ADDR1, COL_ADDR2, COL_PHONE]):
+        if str(row[col]).strip():
+            draw.text((MARGIN + CUSTOMER_LABEL_WIDTH, 560 + i * 75), str(row[col]), font=fonts["body"], fill=0)
+
+    try:
+        total = float(str(row[COL_PRICE]).replace(",", "") or 0)
+        qty = int(float(row[COL_QTY] or 1))
+    except ValueError:
+        total, qty = 0.0, 1
+    vat_rate = _worker["vat_rate"]
+    before_vat = round(total * 100 / (100 + vat_rate), 2)   # ยอดในระบบเป็นราคารวม VAT แล้ว
+    vat = round(total - before_vat, 2)
+
+    draw.text((MARGIN + 20, 1140), str(row[COL_ITEM]), font=fonts["body"], fill=0, anchor="lm")
+    draw.text((width - MARGIN - 420, 1140), str(qty), font=fonts["body"], fill=0, anchor="rm")
+    draw.text((width - MARGIN - 20, 1140), f"{before_vat:,.2f}", font=fonts["body"], fill=0, anchor="rm")
+    for i, value in enumerate([before_vat, vat, total]):
+        draw.text((width - MARGIN - 20, 1240 + i * 65), f"{value:,.2f}", font=fonts["head"], fill=0, anchor="ra")
+
+    # ไม่ใช้ page.save(format="PDF") / tobytes() ของภาพ 1 bit เพราะ Pillow แพ็กบิตช้ากว่าการวาดทั้งหน้า
+    bits = np.packbits(np.asarray(page) > 127, axis=1)
+    return zlib.compress(bits.tobytes(), 1)
+
+
+def pdf_document(pages):
+    # เขียน PDF เองแบบง่ายที่สุด: 1 หน้า = ภาพขาวดำ 1 bit เต็มหน้า (FlateDecode)
+    width, height = PAGE_SIZE
+    pt_w, pt_h = width * 72 / DPI, height * 72 / DPI
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None]
+    kids = []
+    for data in pages:
+        page_id = len(objects) + 1
+        kids.append(f"{page_id} 0 R")
+        content = f"q {pt_w:.2f} 0 0 {pt_h:.2f} 0 0 cm /Im0 Do Q".encode()
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {pt_w:.2f} {pt_h:.2f}] "
+            f"/Resources << /XObject << /Im0 {page_id + 1} 0 R >> >> /Contents {page_id + 2} 0 R >>".encode()
+        )
+        objects.append(
+            f"<< /Type /XObject /Subtype /Image /Width {width} /Height {height} /ColorSpace /DeviceGray "
+            f"/BitsPerComponent 1 /Filter /FlateDecode /Length {len(data)} >>\nstream\n".encode() + data + b"\nendstream"
+        )
+        objects.append(f"<< /Length {len(content)} >>\nstream\n".encode() + content + b"\nendstream")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>".encode()
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for i, body in enumerate(objects, start=1):
+        offsets.append(out.tell())
+        out.write(f"{i} 0 obj\n".encode() + body + b"\nendobj\n")
+    xref = out.tell()
+    out.write(f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode())
+    for offset in offsets:
+        out.write(f"{offset:010d} 00000 n \n".encode())
+    out.write(f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode())
+    return out.getvalue()
+
+
+def render_chunk(jobs):
+    # jobs = [(invoice_no, row), ...] วาดหลายใบต่อการส่งงานหนึ่งครั้ง ลดค่าส่งข้อมูลข้าม process
+    return [render_invoice(invoice_no, row) for invoice_no, row in jobs]
+
+
+# ---------- ทั้งชุด ----------
+def run_batch(worksheet, conf=None, page_size=200, workers=None, dry_run=False, done_status="Invoiced", row_offset=0,
+              out_dir=None):
+    # คืน [(invoice_no, row_no, page)] (page ส่งต่อให้ pdf_document) และเปลี่ยนสถานะแถวที่ทำเสร็จ (ถ้าไม่ใช่ dry_run)
+    # ถ้าไม่ใช่ dry_run คืนเฉพาะแถวที่เปลี่ยนสถานะได้จริง
+    # row_offset = จำนวนแถวที่ย้ายไปเก็บถาวรแล้ว (retention.queue_offset) ให้เลขใบกำกับยังคิดจากเลขแถวเดิม
+    # out_dir = เขียน PDF แยกใบลงโฟลเดอร์นี้ก่อนเปลี่ยนสถานะ (None = ไม่เขียน ผู้เรียกเก็บเอง)
+    conf = dict(conf or {})
+    font_path = conf.get("font_path")
+    if not (font_path and os.path.isfile(font_path)):
+        # เช็คก่อนอ่าน Queue / วาด: ใบกำกับที่อ่านไม่ออกต้องไม่ทำให้แถวถูกเปลี่ยนเป็น Invoiced
+        raise FileNotFoundError(f"ไม่พบฟอนต์ภาษาไทยสำหรับใบกำกับภาษี ({font_path or 'ยังไม่ได้ตั้งค่า'}) "
+                                "กรุณาตั้งค่า font_path ใน secrets หัวข้อ [invoice]")
+    workers = workers or min(4, os.cpu_count() or 1)
+
+    rows = []
+
+    def read():
+        for item in iter_pending(worksheet, page_size):
+            rows.append(item)
+            yield item
+
+    def jobs(chunk):
+        return [(invoice_number(row_no + row_offset, row), row) for row_no, row in chunk]
+
+    reader = read()
+    try:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn"),
+                                 initializer=_init_worker, initargs=(font_path, conf)) as pool:
+            # ส่งงานวาดทีละ CHUNK แถวทันทีที่อ่านได้ ระหว่างนั้นอ่านหน้าถัดไปจาก Sheets ต่อ
+            futures, chunk = [], []
+            for item in reader:
+                chunk.append(item)
+                if len(chunk) >= CHUNK:
+                    futures.append(pool.submit(render_chunk, jobs(chunk)))
+                    chunk = []
+            if chunk:
+                futures.append(pool.submit(render_chunk, jobs(chunk)))
+            pages = [page for future in futures for page in future.result()]
+    except (OSError, RuntimeError) as e:
+        print(f"Invoice process pool unavailable, rendering inline: {e}")
+        for _ in reader:
+            pass
+        _init_worker(font_path, conf)
+        pages = render_chunk(jobs(rows))
+
+    results = [(invoice_no, row_no, page) for (invoice_no, _), (row_no, _), page in zip(jobs(rows), rows, pages)]
+    if results and not dry_run:
+        saved = save_invoices(out_dir, results) if out_dir else {}
+        tokens = {row_no: row[COL_TOKEN] for row_no, row in rows}
+        done = set(mark_done(worksheet, [(row_no, tokens[row_no]) for _, row_no, _ in results], done_status))
+        for row_no, path in saved.items():
+            if row_no not in done:
+                os.remove(path)     # ยัง Pending อยู่ รอบหน้าจะออกใบนี้ใหม่ (เลขเดิม)
+        results = [item for item in results if item[1] in done]
+    return results
+
+
+def save_invoices(out_dir, results):
+    # เขียน PDF ใบละไฟล์ (ชื่อไฟล์ = เลขที่ใบกำกับ) คืน {row_no: path}
+    os.makedirs(out_dir, exist_ok=True)
+    paths = {}
+    for invoice_no, row_no, page in results:
+        path = os.path.join(out_dir, f"{invoice_no}.pdf")
+        with open(path + ".tmp", "wb") as f:
+            f.write(pdf_document([page]))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
+        paths[row_no] = path
+    return paths
+
+
+def mark_done(worksheet, rows, status="Invoiced"):
+    # rows = [(row_no, token)] อ่านคอลัมน์สถานะ + token ซ้ำหนึ่งครั้ง เปลี่ยนเฉพาะแถวที่ยัง Pending และยังเป็น token เดิม
+    # (กันเขียนทับถ้ามีคนแก้ระหว่างนั้น หรือแถวเลื่อนเพราะย้ายแถวเก่าไปเก็บถาวร) แล้วเขียนครั้งเดียว
+    # คืนเลขแถวที่เปลี่ยนสถานะจริง
+    last = max(row_no for row_no, _ in rows)
+    current = worksheet.get_values(f"{STATUS_COLUMN}1:{TOKEN_COLUMN}{last}")
+    done = []
+    for row_no, token in rows:
+        values = list(current[row_no - 1]) + ["", ""] if row_no - 1 < len(current) else ["", ""]
+        if str(values[0]).strip() == "Pending" and str(values[1]).strip() == str(token).strip():
+            done.append(row_no)
+    if done:
+        worksheet.batch_update([{"range": f"{STATUS_COLUMN}{row_no}", "values": [[status]]} for row_no in done])
+    return done
+
+
+def build_zip(results):
+    # PDF แยกใบละไฟล์ + ไฟล์รวมทุกใบสำหรับสั่งพิมพ์ครั้งเดียว
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf:
+        for invoice_no, _, page in results:
+            zf.writestr(f"{invoice_no}.pdf", pdf_document([page]))
+        zf.writestr("all_invoices.pdf", pdf_document([page for _, _, page in results]))
+    return buf.getvalue()
+
+
+def main(argv=None):
+    import time
+
+    from retention import queue_offset
+    from sheets import load_secrets, registry_from_secrets
+    from tenants import tenant_secrets
+
+    parser = argparse.ArgumentParser(description="Render tax invoices for Pending rows of the Queue tab")
+    parser.add_argument("--secrets", default=".streamlit/secrets.toml")
+    parser.add_argument("--tenant", help="shop key from [tenants] (default: default_tenant)")
+    parser.add_argument("--out", default="invoices")
+    parser.add_argument("--page-size", type=int, default=200)
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--dry-run", action="store_true", help="render only, keep rows Pending")
+    args = parser.parse_args(argv)
+
+    secrets = tenant_secrets(load_secrets(args.secrets), args.tenant)
+    registry = registry_from_secrets(secrets)
+    started = time.perf_counter()
+    try:
+        results = run_batch(registry.worksheet("Queue"), secrets.get("invoice", {}), page_size=args.page_size,
+                            workers=args.workers, dry_run=args.dry_run, row_offset=queue_offset(registry), out_dir=args.out)
+    except FileNotFoundError as e:
+        raise SystemExit(str(e))
+    if args.dry_run:
+        save_invoices(args.out, results)
+    if results:
+        with open(os.path.join(args.out, "all_invoices.pdf"), "wb") as f:
+            f.write(pdf_document([page for _, _, page in results]))
+    print(f"{len(results)} invoices written to {args.out} in {time.perf_counter() - started:.1f} s")
+
+
+if __name__ == "__main__":
+    # เรียกผ่านชื่อโมดูล ให้ process ลูก import ฟังก์ชันวาดจาก invoice_pipeline ได้
+    from invoice_pipeline import main as run_main
+
+    run_main()
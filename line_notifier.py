@@ -0,0 +1,110 @@
+import json
+import time
+import uuid
+
+import requests
+
+from metrics import METRICS
+
+# ==========================================
+# 💬 ส่งแจ้งเตือน LINE (เรียกจากขั้น "line" ของ outbox)
+# ==========================================
+# - push() ส่งทันทีแล้วรอผล ล้มเหลวจะ raise ให้ outbox ลองใหม่เอง (ยังไม่ส่งไม่จดว่าเสร็จใน journal)
+# - ส่ง X-Line-Retry-Key ทุกครั้ง (คิดจาก retry_key ของงาน) ลองใหม่หลัง timeout / 5xx แล้ว LINE จะไม่โพสต์ซ้ำ
+#   ถ้ารอบก่อนส่งถึงแล้ว LINE ตอบ 409 ซึ่งถือว่าสำเร็จ
+# - ใช้ requests.Session เดียว (reuse connection) และกำหนด timeout ทุกครั้ง
+# - โควตาประจำเดือนเก็บไว้ในหน่วยความจำ (TTL) ไม่ต้องถาม LINE ทุกข้อความ
+# - ข้อความหลายข้อความของงานเดียวรวมเป็น push เดียว (สูงสุด 5 ข้อความต่อ push ตามข้อจำกัดของ LINE)
+#   LINE นับโควตาต่อ 1 push ต่อผู้รับ
+
+LINE_API = "https://api.line.me"
+MAX_MESSAGES_PER_PUSH = 5
+RETRY_KEY_NAMESPACE = uuid.UUID("6f1d3c0e-5a7b-4c1e-9d2a-8b4e0f3a1c57")
+
+
+class LinePushError(RuntimeError):
+    pass
+
+
+def retry_key(key, index=0):
+    # LINE รับเฉพาะ UUID: คิดจากกุญแจของงาน ลองใหม่กี่ครั้งก็ได้ค่าเดิม
+    return str(uuid.uuid5(RETRY_KEY_NAMESPACE, f"{key}/{index}"))
+
+
+class LineNotifier:
+    def __init__(self, channel_access_token, target_id, api_base=LINE_API,
+                 timeout=(3.05, 10), quota_ttl=600,
+                 quota_limit=200, quota_warn_at=190, max_retries=3, session=None, sleep=time.sleep):
+        self.target_id = target_id
+        self.api_base = api_base.rstrip("/")
+        self.timeout = timeout
+        self.quota_ttl = quota_ttl
+        self.quota_limit = quota_limit
+        self.quota_warn_at = quota_warn_at
+        self.max_retries = max_retries
+        self.session = session or requests.Session()
+        self.session.headers.update({'Authorization': 'Bearer ' + channel_access_token})
+        self.sleep = sleep
+        self._usage = None
+        self._usage_at = 0.0
+
+    # ---------- API ----------
+    def push(self, texts, key):
+        # ส่งข้อความทั้งหมดให้ถึงก่อนคืนค่า ไม่สำเร็จ raise LinePushError
+        # key = กุญแจคงที่ของงาน (เช่น idempotency key ของ outbox + ชื่อขั้น) ใช้ทำ X-Line-Retry-Key
+        if isinstance(texts, str):
+            texts = [texts]
+        self._refresh_quota()
+        for index, start in enumerate(range(0, len(texts), MAX_MESSAGES_PER_PUSH)):
+            self._push_with_retry(texts[start:start + MAX_MESSAGES_PER_PUSH], retry_key(key, index))
+
+    def usage(self):
+        # โควตาที่ใช้ไปเดือนนี้ (ค่าที่จำไว้ อาจเก่าได้ไม่เกิน quota_ttl) หรือ None ถ้ายังไม่เคยเช็ค
+        return self._usage
+
+    def near_quota(self):
+        return self._usage is not None and self._usage >= self.quota_warn_at
+
+    # ---------- HTTP ----------
+    def _refresh_quota(self):
+        if self._usage is not None and time.monotonic() - self._usage_at < self.quota_ttl:
+            return
+        try:
+            with METRICS.timer("line", "quota"):
+                res = self.session.get(f"{self.api_base}/v2/bot/message/quota/consumption", timeout=self.timeout)
+            if res.status_code == 200:
+                self._usage = res.json().get('totalUsage', 0)
+                self._usage_at = time.monotonic()
+                if self.near_quota():
+                    print(f"LINE quota nearly used up: {self._usage}/{self.quota_limit}")
+        except requests.RequestException as e:
+            print(f"LINE quota check failed: {e}")  # เช็คโควตาไม่ได้ ก็ส่งข้อความต่อไปเลย
+
+    def _push_with_retry(self, batch, key):
+        payload = {"to": self.target_id, "messages": [{"type": "text", "text": t} for t in batch]}
+        headers = {'Content-Type': 'application/json', 'X-Line-Retry-Key': key}
+        error = None
+        for attempt in range(self.max_retries):
+            if attempt:
+                METRICS.inc("retries_total", component="line", step="push")
+                self.sleep(2 ** (attempt - 1))
+            try:
+                with METRICS.timer("line", "push"):
+                    res = self.session.post(f"{self.api_base}/v2/bot/message/push", headers=headers,
+                                            data=json.dumps(payload), timeout=self.timeout)
+            except requests.RequestException as e:
+                error = f"LINE Send Exception: {e}"
+                continue
+            METRICS.inc("line_push_total", status=res.status_code)
+            if res.status_code == 200:
+                METRICS.inc("line_messages_total", value=len(batch))
+                if self._usage is not None:
+                    self._usage += 1
+                return
+            if res.status_code == 409:
+                return  # retry key นี้ LINE รับไปแล้วในรอบก่อน (ตอบช้า / timeout) ไม่ต้องส่งซ้ำ
+            error = f"LINE API Error {res.status_code}: {res.text}"
+            if res.status_code < 500 and res.status_code != 429:
+                break  # ข้อมูลผิด / โควตาหมด ลองใหม่ทันทีก็ไม่ผ่าน
+        METRICS.inc("failures_total", component="line", step="push")
+        raise LinePushError(error)
@@ -0,0 +1,202 @@
+import json
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+# ==========================================
+# 📊 ตัวนับและจับเวลาการเรียกระบบภายนอก (Google Sheets / LINE / ไฟล์ข้อมูล)
+# ==========================================
+# ทุกโมดูลใช้ METRICS ตัวเดียวกันทั้งโปรเซส
+# - external_call_seconds{target, op, worksheet}  : เวลาที่ใช้ (histogram)
+# - external_call_errors_total{..., error}        : จำนวน error แยกชนิด
+# - retries_total{component, step}                : จำนวนครั้งที่ลองใหม่
+# - sheets_requests_total{kind=read|write}        : ใช้ดูการกินโควตา Google Sheets ต่อนาที
+# ดูได้ที่หน้าแอดมิน (Diagnostics) และ export เป็นข้อความแบบ Prometheus หรือไฟล์ JSON
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+WINDOW_SECONDS = 60
+
+# เมธอดของ gspread ที่นับเป็นการเขียน (ที่เหลือนับเป็นการอ่าน)
+SHEETS_WRITE_OPS = {
+    "append_row", "append_rows", "insert_row", "insert_rows", "update", "update_cell",
+    "update_cells", "batch_update", "batch_clear", "clear", "delete_rows", "add_worksheet",
+    "resize", "format",
+}
+
+
+def _key(name, labels):
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+class Metrics:
+    def __init__(self):
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self._counters = defaultdict(float)
+        self._hists = {}
+        self._windows = defaultdict(deque)
+
+    # ---------- บันทึก ----------
+    def inc(self, name, value=1, **labels):
+        with self._lock:
+            self._counters[_key(name, labels)] += value
+
+    def observe(self, name, seconds, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            hist = self._hists.get(key)
+            if hist is None:
+                hist = self._hists[key] = [[0] * len(BUCKETS), 0.0, 0]
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    hist[0][i] += 1
+            hist[1] += seconds
+            hist[2] += 1
+
+    def mark(self, name, **labels):
+        # นับเหตุการณ์ในหน้าต่าง 60 วินาทีล่าสุด (ใช้คำนวณอัตราต่อนาที)
+        now = time.time()
+        key = _key(name, labels)
+        with self._lock:
+            window = self._windows[key]
+            window.append(now)
+            while window and window[0] < now - WINDOW_SECONDS:
+                window.popleft()
+
+    @contextmanager
+    def timer(self, target, op, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            self.inc("external_call_errors_total", target=target, op=op, error=_error_name(e), **labels)
+            raise
+        finally:
+            self.observe("external_call_seconds", time.perf_counter() - start, target=target, op=op, **labels)
+
+    def sheets_call(self, op, worksheet, fn, *args, **kwargs):
+        kind = "write" if op in SHEETS_WRITE_OPS else "read"
+        self.inc("sheets_requests_total", kind=kind)
+        self.mark("sheets_requests", kind=kind)
+        with self.timer("sheets", op, worksheet=worksheet):
+            return fn(*args, **kwargs)
+
+    # ---------- อ่านค่า ----------
+    def rate_per_minute(self, name, **labels):
+        now = time.time()
+        key = _key(name, labels)
+        with self._lock:
+            window = self._windows.get(key, ())
+            return sum(1 for t in window if t >= now - WINDOW_SECONDS)
+
+    def snapshot(self):
+        with self._lock:
+            counters = [
+                {"name": name, **dict(labels), "value": value}
+                for (name, labels), value in sorted(self._counters.items())
+            ]
+            timers = []
+            for (name, labels), (buckets, total, count) in sorted(self._hists.items()):
+                timers.append({
+                    "name": name, **dict(labels), "count": count,
+                    "avg_ms": round(total / count * 1000, 2) if count else 0.0,
+                    "p95_ms": _bucket_quantile(buckets, count, 0.95),
+                })
+        return {
+            "uptime_s": round(time.time() - self.started, 1),
+            "sheets_reads_per_min": self.rate_per_minute("sheets_requests", kind="read"),
+            "sheets_writes_per_min": self.rate_per_minute("sheets_requests", kind="write"),
+            "counters": counters,
+            "timers": timers,
+        }
+
+    def to_prometheus(self, prefix="nami_"):
+        lines = []
+        with self._lock:
+            seen = set()
+            for (name, labels), value in sorted(self._counters.items()):
+                if name not in seen:
+                    lines.append(f"# TYPE {prefix}{name} counter")
+                    seen.add(name)
+                lines.append(f"{prefix}{name}{_fmt_labels(labels)} {value:g}")
+            for (name, labels), (buckets, total, count) in sorted(self._hists.items()):
+                if name not in seen:
+                    lines.append(f"# TYPE {prefix}{name} histogram")
+                    seen.add(name)
+                for bound, n in zip(BUCKETS, buckets):
+                    lines.append(f"{prefix}{name}_bucket{_fmt_labels(labels + (('le', f'{bound:g}'),))} {n}")
+                lines.append(f"{prefix}{name}_bucket{_fmt_labels(labels + (('le', '+Inf'),))} {count}")
+                lines.append(f"{prefix}{name}_sum{_fmt_labels(labels)} {total:.6f}")
+                lines.append(f"{prefix}{name}_count{_fmt_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def start_json_dump(self, path, interval=60):
+        # เขียน snapshot ลงไฟล์ทุก interval วินาที (ให้ระบบอื่นมาอ่านไปทำกราฟได้)
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    tmp_path = path + ".tmp"
+                    with open(tmp_path, "w", encoding="utf-8") as f:
+                        json.dump({"ts": time.time(), **self.snapshot()}, f, ensure_ascii=False)
+                    os.replace(tmp_path, path)
+                except OSError as e:
+                    print(f"Metrics dump failed: {e}")
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        thread = threading.Thread(target=run, name="metrics-dump", daemon=True)
+        thread.start()
+        return thread
+
+
+def _error_name(e):
+    code = getattr(e, "code", None)
+    if code is None:
+        code = getattr(getattr(e, "response", None), "status_code", None)
+    return f"{type(e).__name__}:{code}" if code else type(e).__name__
+
+
+def _bucket_quantile(buckets, count, q):
+    if not count:
+        return 0.0
+    target = q * count
+    for bound, n in zip(BUCKETS, buckets):
+        if n >= target:
+            return bound * 1000
+    return float("inf")
+
+
+def _fmt_labels(labels):
+    if not labels:
+        return ""
+
+    def escape(v):
+        return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+    return "{" + ",".join(f'{k}="{escape(v)}"' for k, v in labels) + "}"
+
+
+class InstrumentedWorksheet:
+    # ห่อ gspread Worksheet ให้ทุกเมธอดถูกจับเวลาและนับ โดยไม่ต้องแก้โค้ดที่เรียกใช้
+    def __init__(self, worksheet, metrics):
+        self._worksheet = worksheet
+        self._metrics = metrics
+
+    @property
+    def title(self):
+        return self._worksheet.title
+
+    def __getattr__(self, name):
+        attr = getattr(self._worksheet, name)
+        if not callable(attr) or name.startswith("_"):
+            return attr
+
+        def call(*args, **kwargs):
+            return self._metrics.sheets_call(name, self._worksheet.title, attr, *args, **kwargs)
+
+        return call
+
+
+METRICS = Metrics()
@@ -0,0 +1,252 @@
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import METRICS
+
+# ==========================================
+# 📮 Outbox: บันทึกลงเครื่องก่อน แล้วค่อยเขียนไป Sheets / LINE เบื้องหลัง
+# ==========================================
+# - ทุกงานถูกเขียนลง journal (ไฟล์ JSONL ต่อท้ายอย่างเดียว + fsync) ก่อนตอบลูกค้า
+# - thread เบื้องหลังทำทีละขั้น (step) ขั้นไหนสำเร็จแล้วจะจดไว้ ไม่ทำซ้ำ
+#   ขั้นที่ไม่ได้รอกัน (after) ทำพร้อมกันเป็นรอบๆ ใช้เวลาเท่าขั้นที่ช้าที่สุดของรอบ ไม่ใช่ผลรวมทุกขั้น
+# - ผลของแต่ละขั้น (ok / failed / skipped + เวลา + error) เก็บเป็น StepResult ดูได้จาก status() / recent()
+# - ล้มเหลวจะลองใหม่แบบ exponential backoff + jitter
+# - ระหว่างออฟไลน์ (online() คืน False) งานที่ล้มจะพักไว้ลองใหม่ทุก offline_delay วินาที ไม่นับรอบ ไม่ตกเป็น dead letter
+#   พอกลับมาออนไลน์ให้เรียก wake() ส่งงานที่ค้างทั้งหมดทันที
+# - เปิดแอปใหม่จะอ่าน journal แล้วทำงานที่ค้างต่อจนครบ
+
+
+OK = "ok"
+FAILED = "failed"
+SKIPPED = "skipped"     # ไม่ได้ทำในรอบนี้ เพราะขั้นที่ต้องรอ (after) ยังไม่สำเร็จ
+
+StepResult = namedtuple("StepResult", ["status", "seconds", "error"])
+
+
+def idempotency_key(sig):
+    # ใช้ sig เดิมของฟอร์ม (TaxID_ยอด_token) เป็นกุญแจกันส่งซ้ำ
+    return hashlib.sha256(str(sig).encode("utf-8")).hexdigest()[:24]
+
+
+class OutboxEntry:
+    def __init__(self, key, payload, created_at):
+        self.key = key
+        self.payload = payload
+        self.created_at = created_at
+        self.done_steps = set()
+        self.attempts = 0
+        self.failures = 0           # ครั้งที่ล้มตอนออนไลน์ (นับเทียบ max_attempts)
+        self.next_attempt = 0.0
+        self.last_error = None
+        self.dead = False
+        self.results = {}           # ชื่อขั้น -> StepResult ล่าสุด
+
+
+class Outbox:
+    def __init__(self, path, steps, max_attempts=10, base_delay=1.0, max_delay=300.0, keep_results=50,
+                 online=None, offline_delay=30.0):
+        self.path = path
+        # [(ชื่อขั้น, fn(payload, retry), after), ...] after = ชื่อขั้นที่ต้องสำเร็จก่อน (ไม่ใส่ = ทำได้ทันที)
+        self.steps = [(step[0], step[1], tuple(step[2]) if len(step) > 2 else ()) for step in steps]
+        names = {name for name, _, _ in self.steps}
+        for name, _, after in self.steps:
+            if not set(after) <= names:
+                raise ValueError(f"step {name!r} waits for unknown steps: {sorted(set(after) - names)}")
+        self.max_attempts = max_attempts
+        self.online = online        # fn() -> bool หรือ None (ถือว่าออนไลน์เสมอ)
+        self.offline_delay = offline_delay
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._entries = {}
+        self._recent = deque(maxlen=keep_results)   # งานที่เสร็จแล้ว: (key, created_at, results)
+        self._cond = threading.Condition()
+        self._thread = None
+        self._pool = ThreadPoolExecutor(max_workers=max(1, len(self.steps)), thread_name_prefix="outbox-step")
+        folder = os.path.dirname(os.path.abspath(path))
+        os.makedirs(folder, exist_ok=True)
+        self._replay()
+        self._compact()
+
+    # ---------- journal ----------
+    def _write(self, record):
+        line = json.dumps(record, ensure_ascii=False)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _replay(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # บรรทัดสุดท้ายอาจเขียนไม่ครบตอนเครื่องดับ
+                op, key = record.get("op"), record.get("key")
+                if op == "add":
+                    entry = OutboxEntry(key, record["payload"], record.get("ts", 0))
+                    entry.attempts = 1  # เคยเริ่มทำไปแล้วหรือยังไม่รู้ ให้ถือว่าเป็นการลองใหม่
+                    self._entries[key] = entry
+                elif key in self._entries:
+                    if op == "step":
+                        self._entries[key].done_steps.add(record["step"])
+                    elif op == "done":
+                        del self._entries[key]
+                    elif op == "dead":
+                        self._entries[key].dead = True
+
+    def _compact(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for entry in self._entries.values():
+                f.write(json.dumps({"op": "add", "key": entry.key, "payload": entry.payload, "ts": entry.created_at}, ensure_ascii=False) + "\n")
+                for step in sorted(entry.done_steps):
+                    f.write(json.dumps({"op": "step", "key": entry.key, "step": step}) + "\n")
+                if entry.dead:
+                    f.write(json.dumps({"op": "dead", "key": entry.key}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    # ---------- API ----------
+    def submit(self, key, payload):
+        # คืนค่า False ถ้ากุญแจนี้ยังค้างอยู่ในคิว (กดส่งซ้ำ)
+        with self._cond:
+            if key in self._entries:
+                return False
+            entry = OutboxEntry(key, payload, time.time())
+            self._write({"op": "add", "key": key, "payload": payload, "ts": entry.created_at})
+            self._entries[key] = entry
+            self._cond.notify()
+        return True
+
+    def pending(self):
+        with self._cond:
+            return [e for e in self._entries.values() if not e.dead]
+
+    def dead_letters(self):
+        with self._cond:
+            return [e for e in self._entries.values() if e.dead]
+
+    def wake(self):
+        # กลับมาออนไลน์: งานที่พักไว้ (ไม่รวม dead letter) ทำต่อทันที
+        with self._cond:
+            for entry in self._entries.values():
+                if not entry.dead:
+                    entry.next_attempt = 0.0
+            self._cond.notify()
+
+    def status(self, key):
+        # คืน {"state": "pending" / "dead" / "done", "steps": {ชื่อขั้น: StepResult}} หรือ None ถ้าไม่รู้จัก
+        with self._cond:
+            entry = self._entries.get(key)
+            if entry is not None:
+                return {"state": "dead" if entry.dead else "pending", "steps": dict(entry.results)}
+            for done_key, _, results in self._recent:
+                if done_key == key:
+                    return {"state": "done", "steps": dict(results)}
+        return None
+
+    def recent(self):
+        # งานที่เสร็จล่าสุด (ใหม่สุดก่อน) สำหรับหน้า Diagnostics
+        with self._cond:
+            return list(reversed(self._recent))
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="outbox-worker", daemon=True)
+            self._thread.start()
+        return self
+
+    # ---------- worker ----------
+    def _next_ready(self):
+        now = time.time()
+        ready = [e for e in self._entries.values() if not e.dead and e.next_attempt <= now]
+        if ready:
+            return min(ready, key=lambda e: e.created_at), 0
+        waiting = [e.next_attempt for e in self._entries.values() if not e.dead]
+        return None, (min(waiting) - now if waiting else None)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                entry, wait = self._next_ready()
+                while entry is None:
+                    self._cond.wait(timeout=wait)
+                    entry, wait = self._next_ready()
+            self._process(entry)
+
+    def _run_step(self, name, fn, payload, retry):
+        started = time.perf_counter()
+        try:
+            with METRICS.timer("outbox", name):
+                fn(payload, retry)
+        except Exception as e:
+            return StepResult(FAILED, time.perf_counter() - started, str(e))
+        return StepResult(OK, time.perf_counter() - started, None)
+
+    def _process(self, entry):
+        retry = entry.attempts > 0
+        entry.attempts += 1
+        failed, ran = [], set()
+        while not failed:
+            ready = [(name, fn) for name, fn, after in self.steps
+                     if name not in entry.done_steps and all(dep in entry.done_steps for dep in after)]
+            if not ready:
+                break
+            if len(ready) == 1:
+                name, fn = ready[0]
+                outcomes = [(name, self._run_step(name, fn, entry.payload, retry))]
+            else:
+                futures = [(name, self._pool.submit(self._run_step, name, fn, entry.payload, retry)) for name, fn in ready]
+                outcomes = [(name, future.result()) for name, future in futures]
+            with self._cond:
+                for name, result in outcomes:
+                    ran.add(name)
+                    entry.results[name] = result
+                    if result.status == OK:
+                        entry.done_steps.add(name)
+                        self._write({"op": "step", "key": entry.key, "step": name})
+                    else:
+                        failed.append(name)
+
+        waiting = [name for name, _, _ in self.steps if name not in entry.done_steps]
+        if waiting:
+            with self._cond:
+                for name in waiting:
+                    if name not in ran:
+                        entry.results[name] = StepResult(SKIPPED, 0.0, None)
+            entry.last_error = "; ".join(f"{name}: {entry.results[name].error}" for name in failed) \
+                or f"steps never became ready: {', '.join(waiting)}"
+            step = (failed or waiting)[0]
+            if self.online is not None and not self.online():
+                METRICS.inc("offline_parked_total", component="outbox", step=step)
+                entry.next_attempt = time.time() + self.offline_delay
+                return
+            entry.failures += 1
+            if entry.failures >= self.max_attempts:
+                METRICS.inc("failures_total", component="outbox", step=step)
+                print(f"Outbox gave up on {entry.key} ({entry.last_error})")
+                with self._cond:
+                    entry.dead = True
+                    self._write({"op": "dead", "key": entry.key})
+            else:
+                METRICS.inc("retries_total", component="outbox", step=step)
+                delay = min(self.max_delay, self.base_delay * (2 ** (entry.failures - 1)))
+                entry.next_attempt = time.time() + random.uniform(delay / 2, delay)
+            return
+
+        with self._cond:
+            self._write({"op": "done", "key": entry.key})
+            del self._entries[entry.key]
+            self._recent.append((entry.key, entry.created_at, dict(entry.results)))
+            if not self._entries:
+                self._compact()
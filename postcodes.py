@@ -0,0 +1,133 @@
+import csv
+import json
+import mmap
+import os
+import struct
+import sys
+from functools import lru_cache
+
+# ==========================================
+# 📮 ฐานข้อมูลรหัสไปรษณีย์แบบออฟไลน์ (ไม่ต้องโหลดจาก GitHub ทุกครั้งที่เปิดแอป)
+# ==========================================
+# ไฟล์ data/thai_postcodes.bin สร้างล่วงหน้าด้วย:
+#   python postcodes.py raw_database.json   (jquery.Thailand.js)
+#   python postcodes.py thai_address_data.csv
+#
+# โครงสร้างไฟล์ (little-endian) เปิดด้วย mmap ได้ทันทีไม่ต้อง parse ทั้งไฟล์
+#   b"NAMIZIP1" | u32 จำนวนรหัส | [u32 รหัส, u32 offset, u32 ความยาว] * N (เรียงตามรหัส) | ข้อมูล
+#   ข้อมูลของแต่ละรหัส = ข้อความใน dropdown ที่ทำไว้ล่วงหน้า (UTF-8) บรรทัดละพื้นที่
+#   (ไม่เก็บชื่อ ตำบล/อำเภอ/จังหวัด ซ้ำ เพราะแยกกลับจาก label ได้ ไฟล์เล็กลงครึ่งหนึ่ง)
+
+MAGIC = b"NAMIZIP1"
+HEADER = struct.Struct("<8sI")
+ENTRY = struct.Struct("<III")
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "thai_postcodes.bin")
+
+
+def make_label(district, amphoe, province):
+    if "กรุงเทพ" in province:
+        return f"แขวง{district} > เขต{amphoe} > {province}"
+    return f"ต.{district} > อ.{amphoe} > จ.{province}"
+
+
+def split_label(label):
+    # ย้อนกลับ make_label -> (ตำบล, อำเภอ, จังหวัด)
+    d, a, p = label.split(" > ")
+    if d.startswith("แขวง"):
+        return d[len("แขวง"):], a[len("เขต"):], p
+    return d[len("ต."):], a[len("อ."):], p[len("จ."):]
+
+
+class PostcodeIndex:
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, count = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"not a postcode index: {path}")
+        # อ่านแค่ตารางดัชนี (ไม่กี่ KB) เป็น dict รหัส -> ตำแหน่งข้อมูล
+        self._offsets = {}
+        pos = HEADER.size
+        for _ in range(count):
+            zipcode, offset, length = ENTRY.unpack_from(self._mm, pos)
+            self._offsets[f"{zipcode:05d}"] = (offset, length)
+            pos += ENTRY.size
+        self.lookup = lru_cache(maxsize=2048)(self._lookup)
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def __contains__(self, zipcode):
+        return str(zipcode).strip() in self._offsets
+
+    @property
+    def empty(self):
+        return not self._offsets
+
+    def _lookup(self, zipcode):
+        # คืนค่า tuple ของ (ตำบล, อำเภอ, จังหวัด, label) เรียงตามข้อมูลต้นฉบับ
+        found = self._offsets.get(str(zipcode).strip())
+        if found is None:
+            return ()
+        offset, length = found
+        labels = self._mm[offset:offset + length].decode("utf-8").split("\n")
+        return tuple((*split_label(label), label) for label in labels)
+
+    def labels(self, zipcode):
+        return [row[3] for row in self.lookup(zipcode)]
+
+    def items(self):
+        # ใช้ตอนต้องการข้อมูลทั้งหมด เช่น ตัวแยกที่อยู่
+        for zipcode in self._offsets:
+            for district, amphoe, province, _ in self.lookup(zipcode):
+                yield zipcode, district, amphoe, province
+
+
+# ==========================================
+# 🏗️ สร้างไฟล์จากข้อมูลต้นฉบับ
+# ==========================================
+def read_source(path):
+    # คืนค่า [(ตำบล, อำเภอ, จังหวัด, รหัสไปรษณีย์), ...]
+    if path.endswith(".json"):
+        with open(path, encoding="utf-8") as f:
+            return [(r["district"], r["amphoe"], r["province"], str(r["zipcode"])) for r in json.load(f)]
+    with open(path, encoding="utf-8") as f:
+        return [(r["subdistrict"], r["district"], r["province"], r["zipcode"]) for r in csv.DictReader(f)]
+
+
+def build(rows, out_path=DEFAULT_PATH):
+    grouped = {}
+    for district, amphoe, province, zipcode in rows:
+        district, amphoe, province = district.strip(), amphoe.strip(), province.strip()
+        zipcode = str(zipcode).strip().zfill(5)
+        label = make_label(district, amphoe, province)
+        bucket = grouped.setdefault(zipcode, [])
+        if label not in bucket:
+            bucket.append(label)
+
+    zipcodes = sorted(grouped)
+    data_start = HEADER.size + ENTRY.size * len(zipcodes)
+    index, blobs, offset = [], [], data_start
+    for zipcode in zipcodes:
+        blob = "\n".join(grouped[zipcode]).encode("utf-8")
+        index.append(ENTRY.pack(int(zipcode), offset, len(blob)))
+        blobs.append(blob)
+        offset += len(blob)
+
+    os.makedirs(os.path.dirname(os.path.abspath(out_path)), exist_ok=True)
+    with open(out_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, len(zipcodes)))
+        f.writelines(index)
+        f.writelines(blobs)
+    return len(zipcodes)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        sys.exit("usage: python postcodes.py <raw_database.json | thai_address_data.csv> [output.bin]")
+    source = sys.argv[1]
+    out = sys.argv[2] if len(sys.argv) > 2 else DEFAULT_PATH
+    rows = read_source(source)
+    print(f"{build(rows, out)} zipcodes from {len(rows)} rows -> {out}")
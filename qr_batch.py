@@ -0,0 +1,139 @@
+import csv
+import io
+import os
+import re
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+# ==========================================
+# 🖨️ สร้าง QR หลายใบพร้อมกัน (โหมดแอดมิน)
+# ==========================================
+# - รับรายการยอดเงิน (บรรทัดละยอด หรือ "ยอดxจำนวนใบ") หรือไฟล์ CSV สองคอลัมน์ (ยอด, จำนวนใบ)
+# - วาด QR ใน process pool แล้วรวมเป็น ZIP (PNG) หรือ PDF สำหรับพิมพ์
+# ไฟล์นี้ห้าม import streamlit เพราะ process ลูกจะ import โมดูลนี้ใหม่
+
+MAX_BATCH = 1000
+
+PAGE_SIZE = (1240, 1754)      # A4 ที่ 150 dpi
+GRID = (3, 4)                 # 3 คอลัมน์ x 4 แถว ต่อหน้า
+QR_SIZE = 330
+
+
+# ยอดเงิน: ตัวเลขล้วน หรือมีจุลภาคคั่นหลักพันที่ทุกกลุ่มมี 3 หลักพอดี ("1,200") กลุ่มอื่นเช่น "12,34" ไม่เดา ให้แจ้งว่าผิด
+_AMOUNT = r"\d{1,3}(?:,\d{3})+(?:\.\d+)?|\d+(?:\.\d+)?"
+_AMOUNT_ONLY = re.compile(rf"^\s*({_AMOUNT})\s*$")
+# ในช่องข้อความ จำนวนใบต้องระบุด้วย x / × / * หรือ tab (วางจาก Excel) เท่านั้น จุลภาคเป็นตัวคั่นหลักพันเสมอ
+# เช่น "150x20", "1,200x3", "1200<tab>3"
+_AMOUNT_LINE = re.compile(rf"^\s*({_AMOUNT})\s*(?:[xX×*\t]\s*(\d+))?\s*$")
+
+
+def _line_error(no, line):
+    return ValueError(f"บรรทัด {no} อ่านไม่ได้: {line.strip()!r} (จำนวนใบให้ใช้ x เช่น 150x20, ยอดหลักพันใช้ 1,200 หรือ 1200)")
+
+
+def _rows(text, csv_file):
+    # คืน (ยอด, จำนวนใบ) เป็นข้อความ ข้ามบรรทัดที่ไม่มีตัวเลขเลย (หัวตาราง / บรรทัดว่าง)
+    if csv_file:
+        # ไฟล์ CSV จริง: คอลัมน์ 1 = ยอด (ยอดที่มีจุลภาคต้องอยู่ในเครื่องหมายคำพูด เช่น "1,200") คอลัมน์ 2 = จำนวนใบ
+        try:
+            dialect = csv.Sniffer().sniff(text[:4096], delimiters=",;\t")
+        except csv.Error:
+            dialect = csv.excel
+        for no, row in enumerate(csv.reader(io.StringIO(text), dialect), start=1):
+            line = ",".join(row)
+            if not row or not any(ch.isdigit() for ch in row[0]):
+                continue
+            amount = _AMOUNT_ONLY.match(row[0])
+            copies = row[1].strip() if len(row) > 1 else ""
+            if not amount or (copies and not copies.isdigit()):
+                raise _line_error(no, line)
+            yield amount.group(1), copies or "1"
+        return
+    for no, line in enumerate(text.splitlines(), start=1):
+        if not any(ch.isdigit() for ch in line):
+            continue
+        m = _AMOUNT_LINE.match(line)
+        if not m:
+            raise _line_error(no, line)
+        yield m.group(1), m.group(2) or "1"
+
+
+def parse_amounts(text, csv_file=False):
+    # คืนค่า list ของยอดเงิน (float) ตามลำดับ ข้ามหัวตาราง / บรรทัดว่าง / ยอด 0
+    # บรรทัดที่มีตัวเลขแต่รูปแบบไม่ชัดเจน raise ValueError (ไม่เดาว่าจุลภาคเป็นหลักพันหรือจำนวนใบ)
+    amounts = []
+    for amount, copies in _rows(text, csv_file):
+        amount, copies = float(amount.replace(",", "")), int(copies)
+        if amount > 0 and copies > 0:
+            amounts.extend([amount] * copies)
+        if len(amounts) > MAX_BATCH:
+            break
+    if len(amounts) > MAX_BATCH:
+        raise ValueError(f"สร้างได้ครั้งละไม่เกิน {MAX_BATCH} ใบ")
+    return amounts
+
+
+def render_qr_png(url):
+    import qrcode
+
+    # กำหนด mask pattern ไว้เลย ไม่ให้ qrcode ลองทั้ง 8 แบบ (ส่วนที่ช้าที่สุด) สแกนได้เหมือนเดิม
+    qr = qrcode.QRCode(border=4, mask_pattern=0)
+    qr.add_data(url)
+    qr.make(fit=True)
+    buf = io.BytesIO()
+    qr.make_image().save(buf)
+    return buf.getvalue()
+
+
+def render_batch(urls, workers=None):
+    # วาด QR หลาย process พร้อมกัน (spawn: ไม่ fork ทั้ง process ของ Streamlit ที่มีหลาย thread)
+    if len(urls) < 20:
+        return [render_qr_png(u) for u in urls]
+    workers = workers or min(4, os.cpu_count() or 1)
+    try:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn")) as pool:
+            return list(pool.map(render_qr_png, urls, chunksize=max(1, len(urls) // (workers * 4))))
+    except (OSError, RuntimeError) as e:
+        print(f"QR process pool unavailable, rendering inline: {e}")
+        return [render_qr_png(u) for u in urls]
+
+
+def build_zip(items):
+    # items = [(token, amount, url, png_bytes), ...]
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf:
+        lines = ["no,amount,token,url"]
+        for no, (token, amount, url, png) in enumerate(items, start=1):
+            zf.writestr(f"{no:04d}_{amount:.2f}_{token[:8]}.png", png)
+            lines.append(f"{no},{amount:.2f},{token},{url}")
+        zf.writestr("tokens.csv", "\n".join(lines) + "\n")
+    return buf.getvalue()
+
+
+def build_pdf(items):
+    # หน้า A4 วาง QR เป็นตาราง พร้อมยอดเงินใต้ภาพ (ใช้ฟอนต์พื้นฐาน จึงเขียนเป็น THB)
+    from PIL import Image, ImageDraw, ImageFont
+
+    font = ImageFont.load_default(size=28)
+    cols, rows = GRID
+    cell_w, cell_h = PAGE_SIZE[0] // cols, PAGE_SIZE[1] // rows
+    pages = []
+    for start in range(0, len(items), cols * rows):
+        # ใช้ภาพขาวดำ 1 bit ไฟล์ PDF เล็กและเร็วกว่าภาพสีมาก
+        page = Image.new("1", PAGE_SIZE, 1)
+        draw = ImageDraw.Draw(page)
+        for i, (token, amount, url, png) in enumerate(items[start:start + cols * rows]):
+            x, y = (i % cols) * cell_w, (i // cols) * cell_h
+            qr = Image.open(io.BytesIO(png)).convert("1").resize((QR_SIZE, QR_SIZE), Image.NEAREST)
+            page.paste(qr, (x + (cell_w - QR_SIZE) // 2, y + 20))
+            caption = f"{amount:,.2f} THB  #{start + i + 1}"
+            text_w = draw.textlength(caption, font=font)
+            draw.text((x + (cell_w - text_w) / 2, y + QR_SIZE + 30), caption, fill=0, font=font)
+            draw.rectangle([x + 5, y + 5, x + cell_w - 5, y + cell_h - 5], outline=0)
+        pages.append(page)
+
+    buf = io.BytesIO()
+    if pages:
+        pages[0].save(buf, format="PDF", save_all=True, append_images=pages[1:], resolution=150)
+    return buf.getvalue()
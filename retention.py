@@ -0,0 +1,251 @@
+import argparse
+from datetime import datetime, timedelta
+
+from archive_index import ARCHIVE_INDEX, INDEX_HEADER, ArchiveIndex
+from invoice_pipeline import COL_STATUS, COL_TOKEN, COL_TS, QUEUE_RANGE_END
+
+# ==========================================
+# 🗄️ ย้ายข้อมูลเก่าออกจาก TokenDB / Queue ไปเก็บถาวรรายเดือน (เหลือแค่ข้อมูลที่ยังใช้งานในแท็บหลัก)
+# ==========================================
+# - TokenDB : token ที่ Used แล้ว และ token ที่ Active แต่เก่าเกิน expire_days (เก็บเป็น Expired)
+#             ย้ายไป TokenDB_YYYY-MM ตามเดือนที่สร้าง และเขียน token -> แท็บที่เก็บ ลง ArchiveIndex
+# - Queue   : แถวที่ออกใบกำกับแล้ว (ไม่ใช่ Pending) ย้ายไป Queue_YYYY-MM
+#             ย้ายเฉพาะช่วงต่อเนื่องจากบนสุด และเก็บจำนวนแถวที่ย้ายไปแล้ว (queue_offset) ใน ArchiveMeta
+#             เลขใบกำกับคิดจาก "เลขแถว + queue_offset" จึงได้เลขเดิมเสมอ ไม่ชนกับใบที่ออกไปแล้ว
+# ลำดับ: เขียนแท็บเก็บถาวร + index ก่อน แล้วลบแถว (+ แก้ queue_offset) ด้วย batch_update ครั้งเดียว
+# ล้มกลางทางแล้วรันใหม่ได้ (แถวที่เคยเขียนลงแท็บเก็บถาวรแล้วจะถูกข้าม)
+#   python -m retention --secrets .streamlit/secrets.toml --dry-run
+#
+# [retention]
+# keep_days = 7        # เก็บข้อมูลล่าสุดกี่วันไว้ในแท็บหลัก
+# expire_days = 90     # token ที่ไม่ถูกใช้เกินกี่วันถือว่าหมดอายุ (0 = ไม่หมดอายุ)
+
+ARCHIVE_META = "ArchiveMeta"
+META_HEADER = ["Key", "Value"]
+QUEUE_OFFSET_KEY = "queue_offset"
+TOKEN_COLUMNS = 4                 # Token | Amount | Status | Timestamp
+
+
+def parse_date(value):
+    try:
+        return datetime.strptime(str(value).strip()[:10], "%Y-%m-%d")
+    except ValueError:
+        return None
+
+
+def archive_title(base, created):
+    return f"{base}_{created:%Y-%m}"
+
+
+def _pad(row, width):
+    return list(row) + [""] * (width - len(row))
+
+
+def _row_key(row):
+    # Sheets ตัดช่องว่างท้ายแถวทิ้งตอนอ่าน เทียบแถวโดยไม่สนช่องว่างท้ายแถว
+    values = [str(v) for v in row]
+    while values and values[-1] == "":
+        values.pop()
+    return tuple(values)
+
+
+# ---------- เลือกแถวที่จะย้าย ----------
+def select_tokens(rows, now, keep_days=7, expire_days=90):
+    # rows = ค่าทั้งแท็บ TokenDB (รวมหัวตาราง) คืน [(เลขแถว, แถวที่จะเก็บ, วันที่สร้าง)]
+    keep_before = now - timedelta(days=keep_days)
+    expire_before = now - timedelta(days=expire_days) if expire_days else None
+    selected = []
+    for row_no, row in enumerate(rows[1:], start=2):
+        row = _pad(row, TOKEN_COLUMNS)[:TOKEN_COLUMNS]
+        created = parse_date(row[3])
+        if not str(row[0]).strip() or created is None:
+            continue
+        status = str(row[2]).strip()
+        if status == "Used" and created < keep_before:
+            selected.append((row_no, row, created))
+        elif status == "Active" and expire_before is not None and created < expire_before:
+            selected.append((row_no, [row[0], row[1], "Expired", row[3]], created))
+    return selected
+
+
+def select_queue(rows, now, keep_days=7):
+    # เฉพาะแถวต่อเนื่องจากแถว 2 ลงไป หยุดที่แถว Pending / แถวว่าง / แถวที่ใหม่กว่า keep_days แถวแรก
+    keep_before = now - timedelta(days=keep_days)
+    width = COL_TOKEN + 1
+    selected = []
+    for row_no, row in enumerate(rows[1:], start=2):
+        row = _pad(row, width)[:width]
+        created = parse_date(row[COL_TS])
+        status = str(row[COL_STATUS]).strip()
+        if status in ("", "Pending") or created is None or created >= keep_before:
+            break
+        selected.append((row_no, row, created))
+    return selected
+
+
+# ---------- เขียนแท็บเก็บถาวร ----------
+def ensure_worksheet(registry, title, header):
+    from gspread.exceptions import WorksheetNotFound
+
+    try:
+        registry.resolve(title)
+        return registry.worksheet(title), False
+    except WorksheetNotFound:
+        ws = registry.add_worksheet(title, rows=1000, cols=len(header))
+        ws.append_row(header)
+        return ws, True
+
+
+def append_archive(registry, base, header, selected):
+    # เขียนแถวที่เลือกลงแท็บรายเดือน คืนชื่อแท็บของแต่ละแถว (เรียงตาม selected)
+    by_title = {}
+    for _, row, created in selected:
+        by_title.setdefault(archive_title(base, created), []).append(row)
+    for title, rows in by_title.items():
+        ws, created = ensure_worksheet(registry, title, header)
+        existing = set() if created else {_row_key(r) for r in ws.get_values()}
+        new_rows = [row for row in rows if _row_key(row) not in existing]
+        if new_rows:
+            ws.append_rows(new_rows, table_range="A1")
+    return [archive_title(base, created) for _, _, created in selected]
+
+
+def queue_offset(registry):
+    # จำนวนแถว Queue ที่ย้ายไปเก็บถาวรแล้ว (บวกกับเลขแถวปัจจุบัน = เลขแถวเดิมตอนบันทึก)
+    from gspread.exceptions import WorksheetNotFound
+
+    try:
+        rows = registry.worksheet(ARCHIVE_META).get_values("A:B")
+    except WorksheetNotFound:
+        return 0
+    for row in rows[1:]:
+        if len(row) >= 2 and str(row[0]).strip() == QUEUE_OFFSET_KEY:
+            return int(str(row[1]).strip() or 0)
+    return 0
+
+
+def _meta_row(registry):
+    # คืน (worksheet, เลขแถวของ queue_offset, ค่าปัจจุบัน) สร้างแท็บ / แถวให้ถ้ายังไม่มี
+    ws, _ = ensure_worksheet(registry, ARCHIVE_META, META_HEADER)
+    rows = ws.get_values("A:B")
+    for row_no, row in enumerate(rows, start=1):
+        if row_no > 1 and len(row) >= 2 and str(row[0]).strip() == QUEUE_OFFSET_KEY:
+            return ws, row_no, int(str(row[1]).strip() or 0)
+    ws.append_row([QUEUE_OFFSET_KEY, 0])
+    return ws, max(len(rows), 1) + 1, 0
+
+
+def delete_rows_requests(sheet_id, row_numbers):
+    # รวมแถวที่ติดกันเป็นช่วงเดียว และลบจากล่างขึ้นบน (เลขแถวด้านบนจะไม่เลื่อนระหว่างลบ)
+    ranges = []
+    for row_no in sorted(set(row_numbers), reverse=True):
+        if ranges and ranges[-1][0] == row_no + 1:
+            ranges[-1][0] = row_no
+        else:
+            ranges.append([row_no, row_no])
+    return [
+        {"deleteDimension": {"range": {"sheetId": sheet_id, "dimension": "ROWS", "startIndex": start - 1, "endIndex": end}}}
+        for start, end in ranges
+    ]
+
+
+def _unchanged(rows, row_no, key_col, key, status_col, status):
+    if row_no - 1 >= len(rows):
+        return False
+    row = _pad(rows[row_no - 1], max(key_col, status_col) + 1)
+    return str(row[key_col]).strip() == key and str(row[status_col]).strip() == status
+
+
+# ---------- ทั้งชุด ----------
+def run_retention(registry, conf=None, now=None, dry_run=False):
+    # คืนสรุป {'tokens': จำนวน, 'queue': จำนวน, 'archives': [แท็บ], 'queue_offset': ค่าใหม่}
+    conf = dict(conf or {})
+    keep_days = conf.get("keep_days", 7)
+    expire_days = conf.get("expire_days", 90)
+    now = now or datetime.now()
+
+    token_ws = registry.worksheet("TokenDB")
+    queue_ws = registry.worksheet("Queue")
+    token_rows = token_ws.get_values("A:D")
+    queue_rows = queue_ws.get_values(f"A:{QUEUE_RANGE_END}")
+    tokens = select_tokens(token_rows, now, keep_days, expire_days)
+    queue = select_queue(queue_rows, now, keep_days)
+
+    summary = {"tokens": len(tokens), "queue": len(queue), "archives": [], "queue_offset": None}
+    if dry_run or not (tokens or queue):
+        return summary
+
+    # 1. เขียนแท็บเก็บถาวร + index (ยังไม่ลบอะไรจากแท็บหลัก)
+    token_header = _pad(token_rows[0], TOKEN_COLUMNS)[:TOKEN_COLUMNS]
+    token_titles = append_archive(registry, "TokenDB", token_header, tokens)
+    queue_titles = append_archive(registry, "Queue", _pad(queue_rows[0], COL_TOKEN + 1), queue)
+    summary["archives"] = sorted(set(token_titles) | set(queue_titles))
+
+    if tokens:
+        index_ws, _ = ensure_worksheet(registry, ARCHIVE_INDEX, INDEX_HEADER)
+        index = ArchiveIndex(index_ws)
+        index.refresh(force=True)
+        entries = [[row[0], row[1], row[2], title] for (_, row, _), title in zip(tokens, token_titles)
+                   if not index.contains(str(row[0]).strip(), row[2])]
+        if entries:
+            index_ws.append_rows(entries, table_range="A1")
+
+    # 2. อ่านอีกครั้งก่อนลบ: ข้ามแถวที่มีคนแก้ระหว่างนั้น (เช่น token หมดอายุถูกใช้พอดี) ไว้รอบหน้า
+    requests = []
+    if tokens:
+        current = token_ws.get_values("A:C")
+        rows = [row_no for row_no, row, _ in tokens
+                if _unchanged(current, row_no, 0, str(row[0]).strip(), 2, "Used" if row[2] == "Used" else "Active")]
+        requests += delete_rows_requests(token_ws.id, rows)
+        summary["tokens"] = len(rows)
+    if queue:
+        current = queue_ws.get_values(f"A:{QUEUE_RANGE_END}")
+        count = 0
+        for row_no, row, _ in queue:
+            if not _unchanged(current, row_no, COL_TOKEN, str(row[COL_TOKEN]).strip(), COL_STATUS, str(row[COL_STATUS]).strip()):
+                break  # ต้องเป็นช่วงต่อเนื่องจากบนสุดเท่านั้น
+            count += 1
+        if count:
+            meta_ws, meta_row, offset = _meta_row(registry)
+            requests += delete_rows_requests(queue_ws.id, range(2, 2 + count))
+            requests.append({"updateCells": {
+                "range": {"sheetId": meta_ws.id, "startRowIndex": meta_row - 1, "endRowIndex": meta_row,
+                          "startColumnIndex": 1, "endColumnIndex": 2},
+                "rows": [{"values": [{"userEnteredValue": {"numberValue": offset + count}}]}],
+                "fields": "userEnteredValue",
+            }})
+            summary["queue_offset"] = offset + count
+        summary["queue"] = count
+
+    # 3. ลบแถว (และแก้ queue_offset) พร้อมกันใน request เดียว
+    if requests:
+        registry.batch_update({"requests": requests})
+    return summary
+
+
+def main(argv=None):
+    from sheets import load_secrets, registry_from_secrets
+    from tenants import tenant_secrets
+
+    parser = argparse.ArgumentParser(description="Move Used/expired tokens and invoiced Queue rows into monthly archive tabs")
+    parser.add_argument("--secrets", default=".streamlit/secrets.toml")
+    parser.add_argument("--tenant", help="shop key from [tenants] (default: default_tenant)")
+    parser.add_argument("--keep-days", type=int)
+    parser.add_argument("--expire-days", type=int)
+    parser.add_argument("--dry-run", action="store_true", help="only count the rows that would move")
+    args = parser.parse_args(argv)
+
+    secrets = tenant_secrets(load_secrets(args.secrets), args.tenant)
+    conf = dict(secrets.get("retention", {}))
+    if args.keep_days is not None:
+        conf["keep_days"] = args.keep_days
+    if args.expire_days is not None:
+        conf["expire_days"] = args.expire_days
+    summary = run_retention(registry_from_secrets(secrets), conf, dry_run=args.dry_run)
+    print(f"tokens: {summary['tokens']}, queue rows: {summary['queue']}"
+          + (f", archives: {', '.join(summary['archives'])}" if summary['archives'] else "")
+          + (" (dry run)" if args.dry_run else ""))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+import heapq
+import itertools
+import random
+import threading
+import time
+
+from metrics import METRICS, SHEETS_WRITE_OPS, InstrumentedWorksheet
+
+# ==========================================
+# 📒 ที่เก็บ spreadsheet / worksheet ที่เปิดไว้แล้ว (ใช้ร่วมกันทั้งโปรเซส)
+# ==========================================
+# - เปิด client.open() และ .worksheet() ครั้งเดียว ครั้งต่อไปใช้ handle เดิม (ไม่ต้องดึง metadata ซ้ำ)
+# - ได้ 401 (token ของ service account หมดอายุ) จะ login ใหม่แล้วลองอีกครั้ง
+# - ได้ 404 (ชีตถูกลบ / เปลี่ยนชื่อ) จะทิ้ง handle เก่าแล้วเปิดใหม่อีกครั้ง
+# - ทุกคำสั่งผ่าน SheetScheduler ที่คุมโควตาอ่าน/เขียนต่อนาทีของ Google ให้
+
+SPREADSHEET_NAME = "Invoice_Data"
+SCOPE = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
+
+# ลำดับความสำคัญ (เลขน้อยได้ก่อน)
+CRITICAL = 0     # งานที่ต้องไม่ตก: ต่อท้าย Queue, ปิด token
+NORMAL = 1       # ตรวจ token และคำสั่งทั่วไป
+STALE_OK = 2     # อ่านที่ใช้ข้อมูลเก่าในเครื่องแทนได้ (index ลูกค้า, เช็คซ้ำใน Queue)
+
+PRIORITIES = {
+    ("Queue", "append_row"): CRITICAL,
+    ("TokenDB", "batch_update"): CRITICAL,
+    ("TokenDB", "update_cell"): CRITICAL,
+    ("Customers", "get_all_values"): STALE_OK,
+    ("Customers", "get_values"): STALE_OK,
+    ("Queue", "find"): STALE_OK,
+    ("TokenDB", "batch_get"): STALE_OK,    # sync สำเนา token เบื้องหลัง (token_snapshot.py) / ภาพรวมหน้าแอดมิน
+    ("Queue", "batch_get"): STALE_OK,      # ภาพรวมหน้าแอดมิน (dashboard.py)
+}
+
+
+class SheetsBusy(Exception):
+    # คำสั่งที่ใช้ข้อมูลเก่าแทนได้ถูกเลื่อนออกไป เพราะโควตาไม่พอ (ผู้เรียกควรใช้ข้อมูลที่มีอยู่)
+    pass
+
+
+def status_code(e):
+    # APIError ของ gspread เก็บ code จาก body ของ Google ถ้าอ่านไม่ได้จะเป็น -1 จึงดูจาก response ด้วย
+    code = getattr(e, "code", None)
+    if not isinstance(code, int) or code < 0:
+        code = getattr(getattr(e, "response", None), "status_code", None)
+    return code
+
+
+class TokenBucket:
+    # เติมโควตา rate ครั้ง/วินาที เก็บได้สูงสุด capacity ครั้ง
+    # โดน 429 จะลดอัตราลงครึ่งหนึ่ง แล้วค่อยๆ เพิ่มกลับทีละนิดเมื่อเรียกสำเร็จ
+    def __init__(self, per_minute, capacity=None):
+        self.base_rate = per_minute / 60.0
+        self.rate = self.base_rate
+        self.capacity = capacity or max(1, per_minute // 2)
+        self.tokens = float(self.capacity)
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def take(self):
+        # คืน 0 ถ้าได้โควตาแล้ว ไม่งั้นคืนจำนวนวินาทีที่ต้องรอ
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    def throttle(self):
+        self._refill()
+        self.tokens = min(self.tokens, 0.0)
+        self.rate = max(self.base_rate / 16, self.rate / 2)
+
+    def recover(self):
+        self.rate = min(self.base_rate, self.rate + self.base_rate / 20)
+
+
+class SheetScheduler:
+    # คิวกลางของทุกคำสั่ง gspread แยกโควตาอ่าน / เขียน (Google จำกัดต่อนาทีต่อ service account)
+    def __init__(self, reads_per_minute=60, writes_per_minute=60, max_retries=5,
+                 base_delay=1.0, max_delay=32.0, stale_wait=3.0):
+        self.buckets = {"read": TokenBucket(reads_per_minute), "write": TokenBucket(writes_per_minute)}
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.stale_wait = stale_wait    # อ่านแบบ STALE_OK รอคิวได้ไม่เกินนี้ (วินาที)
+        self._waiting = {"read": [], "write": []}
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+
+    def depth(self):
+        with self._cond:
+            return {kind: len(heap) for kind, heap in self._waiting.items()}
+
+    def stats(self):
+        with self._cond:
+            return {
+                kind: {
+                    "waiting": len(self._waiting[kind]),
+                    "tokens": round(bucket.tokens, 1),
+                    "per_minute": round(bucket.rate * 60, 1),
+                }
+                for kind, bucket in self.buckets.items()
+            }
+
+    def run(self, kind, priority, fn, *args, **kwargs):
+        for attempt in range(self.max_retries + 1):
+            self._acquire(kind, priority)
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                if status_code(e) != 429:
+                    raise
+                with self._cond:
+                    self.buckets[kind].throttle()
+                if priority >= STALE_OK:
+                    raise SheetsBusy(f"{kind} quota exceeded") from e
+                if attempt == self.max_retries:
+                    raise
+                METRICS.inc("retries_total", component="sheets_scheduler", step=kind)
+                delay = min(self.max_delay, self.base_delay * (2 ** attempt))
+                time.sleep(random.uniform(delay / 2, delay))
+                continue
+            with self._cond:
+                self.buckets[kind].recover()
+            return result
+
+    def _acquire(self, kind, priority):
+        start = time.monotonic()
+        deadline = start + self.stale_wait if priority >= STALE_OK else None
+        ticket = (priority, next(self._seq))
+        heap = self._waiting[kind]
+        with self._cond:
+            heapq.heappush(heap, ticket)
+            try:
+                while True:
+                    wait = None
+                    if heap[0] == ticket:
+                        wait = self.buckets[kind].take()
+                        if wait == 0:
+                            break
+                    if deadline is not None:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            METRICS.inc("sheets_deferred_total", kind=kind)
+                            raise SheetsBusy(f"{kind} queue is busy")
+                        wait = remaining if wait is None else min(wait, remaining)
+                    self._cond.wait(timeout=wait)
+            finally:
+                heap.remove(ticket)
+                heapq.heapify(heap)
+                self._cond.notify_all()
+        METRICS.observe("sheets_queue_wait_seconds", time.monotonic() - start, kind=kind)
+
+
+class SheetRegistry:
+    def __init__(self, connect, spreadsheet_name=SPREADSHEET_NAME, scheduler=None):
+        self.connect = connect        # ฟังก์ชันที่คืน gspread client ที่ login แล้ว
+        self.spreadsheet_name = spreadsheet_name
+        self.scheduler = scheduler or SheetScheduler()
+        self._client = None
+        self._spreadsheet = None
+        self._worksheets = {}
+        self._lock = threading.RLock()
+
+    @property
+    def client(self):
+        with self._lock:
+            if self._client is None:
+                with METRICS.timer("sheets", "authorize"):
+                    self._client = self.connect()
+            return self._client
+
+    def spreadsheet(self):
+        with self._lock:
+            if self._spreadsheet is None:
+                self._spreadsheet = self.scheduler.run(
+                    "read", NORMAL, METRICS.sheets_call, "open", self.spreadsheet_name, self.client.open, self.spreadsheet_name)
+            return self._spreadsheet
+
+    def worksheet(self, title):
+        # คืน handle ที่เรียกเมธอดของ gspread ได้ตามปกติ แต่ลองใหม่ให้เองเมื่อเจอ 401/404
+        return RegistryWorksheet(self, title)
+
+    def resolve(self, title):
+        ws = self._worksheets.get(title)
+        if ws is not None:
+            return ws
+        with self._lock:
+            if title not in self._worksheets:
+                spreadsheet = self.spreadsheet()
+                ws = self.scheduler.run("read", NORMAL, METRICS.sheets_call, "worksheet", title, spreadsheet.worksheet, title)
+                self._worksheets[title] = InstrumentedWorksheet(ws, METRICS)
+            return self._worksheets[title]
+
+    def add_worksheet(self, title, rows=1000, cols=26):
+        with self._lock:
+            spreadsheet = self.spreadsheet()
+            ws = self.scheduler.run("write", NORMAL, METRICS.sheets_call, "add_worksheet", title,
+                                    spreadsheet.add_worksheet, title, rows, cols)
+            self._worksheets[title] = InstrumentedWorksheet(ws, METRICS)
+        return self.worksheet(title)
+
+    def batch_update(self, body):
+        # คำสั่งระดับ spreadsheet หลายอย่าง (เช่นลบแถวหลายแท็บ + แก้ค่า) ใน request เดียว Google ทำทั้งชุดหรือไม่ทำเลย
+        spreadsheet = self.spreadsheet()
+        return self.scheduler.run("write", NORMAL, METRICS.sheets_call, "batch_update", self.spreadsheet_name,
+                                  spreadsheet.batch_update, body)
+
+    def titles(self):
+        # ชื่อแท็บทั้งหมด (ใช้หาแท็บเก็บถาวรรายเดือน)
+        spreadsheet = self.spreadsheet()
+        sheets = self.scheduler.run("read", STALE_OK, METRICS.sheets_call, "worksheets", self.spreadsheet_name,
+                                    spreadsheet.worksheets)
+        return [ws.title for ws in sheets]
+
+    def values_batch_get(self, ranges):
+        # อ่านหลายช่วงจากหลายแท็บใน request เดียว เช่น "'Queue_2025-01'!A2:J" คืน list ของค่าแต่ละช่วง
+        spreadsheet = self.spreadsheet()
+        result = self.scheduler.run("read", STALE_OK, METRICS.sheets_call, "values_batch_get", self.spreadsheet_name,
+                                    spreadsheet.values_batch_get, ranges)
+        return [r.get("values", []) for r in result.get("valueRanges", [])]
+
+    def invalidate(self, title=None, reauth=False):
+        with self._lock:
+            if reauth:
+                self._client = None
+            if reauth or title is None:
+                self._spreadsheet = None
+                self._worksheets.clear()
+            else:
+                self._worksheets.pop(title, None)
+                self._spreadsheet = None  # 404 อาจมาจาก spreadsheet ถูกย้ายด้วย เปิดใหม่ไปเลย
+
+    def call(self, title, name, *args, **kwargs):
+        kind = "write" if name in SHEETS_WRITE_OPS else "read"
+        priority = PRIORITIES.get((title, name), NORMAL)
+        for attempt in range(2):
+            try:
+                return self.scheduler.run(kind, priority, getattr(self.resolve(title), name), *args, **kwargs)
+            except Exception as e:
+                code = status_code(e)
+                if attempt or code not in (401, 404):
+                    raise
+                METRICS.inc("retries_total", component="sheet_registry", step=str(code))
+                print(f"Sheets {code} on {title}.{name}, reopening")
+                self.invalidate(title, reauth=(code == 401))
+
+
+class RegistryWorksheet:
+    def __init__(self, registry, title):
+        self._registry = registry
+        self.title = title
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        attr = getattr(self._registry.resolve(self.title), name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            return self._registry.call(self.title, name, *args, **kwargs)
+
+        return call
+
+
+# ==========================================
+# 🔑 สร้าง registry จากค่าใน secrets (ใช้ทั้งในแอปและสคริปต์ที่รันนอก Streamlit)
+# ==========================================
+def load_secrets(path=".streamlit/secrets.toml"):
+    import tomllib
+
+    with open(path, "rb") as f:
+        return tomllib.load(f)
+
+
+def registry_from_secrets(secrets):
+    # secrets คือ st.secrets, dict ที่อ่านจาก load_secrets() หรือ conf ของสาขา (tenants.py)
+    key_dict = dict(secrets["gcp_service_account"])
+
+    def connect():
+        # gspread / oauth2client ใช้เวลา import หลายร้อย ms จึง import ตอน login ครั้งแรก (ไม่ใช่ตอนเปิดแอป)
+        import gspread
+        from oauth2client.service_account import ServiceAccountCredentials
+
+        creds = ServiceAccountCredentials.from_json_keyfile_dict(key_dict, SCOPE)
+        return gspread.authorize(creds)
+
+    quota_conf = secrets.get("sheets_quota", {})
+    scheduler = SheetScheduler(
+        reads_per_minute=quota_conf.get("reads_per_minute", 60),
+        writes_per_minute=quota_conf.get("writes_per_minute", 60),
+    )
+    return SheetRegistry(connect, secrets.get("spreadsheet_name", SPREADSHEET_NAME), scheduler=scheduler)
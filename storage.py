@@ -0,0 +1,588 @@
+import os
+import sqlite3
+import threading
+import uuid
+
+from archive_index import ARCHIVE_INDEX, ArchiveIndex
+from customer_index import CustomerIndex
+from customer_search import CustomerSearch
+from formatters import fix_tax_id
+from metrics import METRICS
+from outbox import Outbox
+
+# ==========================================
+# 💾 ชั้นจัดเก็บข้อมูล (Storage Backend)
+# ==========================================
+# ทุกส่วนของแอปคุยกับข้อมูลผ่าน interface นี้ที่เดียว
+# - SheetsStorage : ใช้ Google Sheets ตรงๆ แบบเดิม
+# - SQLiteStorage : เก็บในเครื่อง (WAL) ตอบเร็ว แล้วค่อยส่งต่อไป Sheets เบื้องหลังได้ (mirror ผ่าน Outbox)
+
+CUSTOMER_COLUMNS = ["Name", "TaxID", "Address1", "Address2", "Phone"]
+QUEUE_COLUMNS = ["ts", "name", "tax_id", "addr1", "addr2", "phone", "item", "qty", "price", "status", "token"]
+QUEUE_CONFLICT = "Conflict"     # สถานะแถว Queue ที่รับตอนออฟไลน์แต่ token ถูกใช้ที่อื่นไปแล้ว (ไม่ออกใบกำกับอัตโนมัติ)
+REDEEMED_BY_COLUMN = "E"        # TokenDB: กุญแจของงานที่ปิด token (เทียบตอนเขียนซ้ำ / หา token ที่ถูกใช้สองครั้ง)
+TOKEN_CACHE_SIZE = 5000         # จำแถว / สถานะของ token ไว้ไม่เกินเท่านี้ (เกินแล้วทิ้งตัวที่จำไว้นานที่สุด)
+
+
+def _remember(cache, key, value, limit=TOKEN_CACHE_SIZE):
+    # dict เรียงตามลำดับที่ใส่ ตัวแรกคือตัวที่จำไว้นานที่สุด
+    cache.pop(key, None)
+    cache[key] = value
+    while len(cache) > limit:
+        del cache[next(iter(cache))]
+
+
+class TokenConflictError(Exception):
+    # token ถูกใช้ไปแล้ว (หรือมีอีกหน้าจอกำลังใช้อยู่) ตอนพยายามเปลี่ยนเป็น Used
+    pass
+
+
+def clean_token(token_str):
+    # ตัดช่องว่างซ้ายขวา และเอาเครื่องหมาย / ออกเผื่อแอปสแกนบางตัวแอบเติมมา
+    return str(token_str).strip().replace("/", "")
+
+
+class StorageBackend:
+    # --- Token ---
+    def get_token(self, token):
+        # คืนค่า {'Token', 'Amount', 'Status'} หรือ None ถ้าไม่พบ
+        raise NotImplementedError
+
+    def create_token(self, token, amount, ts):
+        self.create_tokens([(token, amount, ts)])
+
+    def create_tokens(self, tokens):
+        # tokens = [(token, amount, ts), ...] เขียนทีเดียวทั้งชุด
+        raise NotImplementedError
+
+    def reserve_token(self, token):
+        # จองสิทธิ์ใช้ token ในเครื่องทันที (ไม่รอ Google API) ถ้าไม่ใช่ Active หรือมีคนจองแล้วจะ raise TokenConflictError
+        raise NotImplementedError
+
+    def release_token(self, token):
+        # คืนสิทธิ์เมื่อบันทึกไม่สำเร็จ
+        raise NotImplementedError
+
+    def redeem_token(self, token, claim=None):
+        # เรียกหลัง reserve_token: เปลี่ยน Active -> Used ที่ที่เก็บจริง (ดูข้อจำกัดของแต่ละที่เก็บที่ reserve_token)
+        # claim คือกุญแจของงานที่ปิด (เก็บไว้คู่กับ token) ถ้าเป็น Used อยู่แล้วโดยงานอื่น จะ raise TokenConflictError
+        raise NotImplementedError
+
+    def token_claim(self, token):
+        # อ่านสถานะจริงจากที่เก็บ (ไม่สนการจองในเครื่อง) คืน (สถานะหรือ None, claim ที่ปิดไว้หรือ None)
+        raise NotImplementedError
+
+    # --- Customers ---
+    def find_customer(self, tax_id):
+        # คืนค่า dict ตามหัวคอลัมน์ CUSTOMER_COLUMNS หรือ None
+        raise NotImplementedError
+
+    def search_customers(self, query, limit=10):
+        # ค้นจากชื่อ (ไม่ต้องตรงทุกตัว) / เบอร์โทร / เลขภาษีบางส่วน คืน list ของ dict แบบ find_customer
+        raise NotImplementedError
+
+    def upsert_customer(self, row):
+        # row = [Name, TaxID, Address1, Address2, Phone]
+        # ถ้ามี TaxID นี้อยู่แล้วจะเก็บข้อมูลเดิมไว้ (เหมือนระบบเดิม) คืนค่า True เมื่อเพิ่มลูกค้าใหม่
+        raise NotImplementedError
+
+    # --- Queue ---
+    def append_queue(self, row):
+        # row เรียงตาม QUEUE_COLUMNS
+        raise NotImplementedError
+
+    def queue_has_token(self, token):
+        # ใช้ตอนลองเขียนซ้ำ กันคิวซ้อนถ้าครั้งก่อนเขียนสำเร็จไปแล้วแต่ไม่ได้รับคำตอบ
+        raise NotImplementedError
+
+    def set_queue_status(self, token, status, ts=None):
+        # เปลี่ยนสถานะแถว Queue ของ token นี้ เฉพาะแถวที่ยัง Pending (เช่น Conflict เมื่อ token ถูกใช้ซ้ำ)
+        # token ที่ถูกใช้ซ้ำมีได้หลายแถว ระบุ ts (เวลาที่บันทึก) ให้ตรงแถวของงานนี้ ถ้าตรงหลายแถวใช้แถวล่างสุด
+        # คืนค่า True ถ้าเปลี่ยน ไม่พบแถวของ token นี้ raise LookupError
+        raise NotImplementedError
+
+    # --- เก็บถาวร ---
+    def archive_old_rows(self, conf=None, now=None, dry_run=False):
+        # ย้าย token ที่ใช้แล้ว/หมดอายุ และแถว Queue ที่ออกใบกำกับแล้ว ไปแท็บเก็บถาวร (ดู retention.py)
+        # คืนสรุปจาก run_retention หรือ None ถ้าที่เก็บนี้ไม่มีแท็บใน Google Sheets
+        raise NotImplementedError
+
+
+# ==========================================
+# 📗 Google Sheets
+# ==========================================
+class SheetsStorage(StorageBackend):
+    def __init__(self, registry, snapshot=None):
+        # registry คือ SheetRegistry ที่ใช้ร่วมกันทั้งแอป (handle ของ worksheet เปิดครั้งเดียว)
+        # snapshot คือ TokenSnapshot (สำเนา TokenDB ในเครื่อง) ใช้ตรวจ token แทนเมื่อ Sheets ล่ม
+        self.registry = registry
+        self.token_snapshot = snapshot
+        self._customer_index = None
+        self._archive_index = None
+        # จำแถวและสถานะของ token จากการค้นหาครั้งแรก ตอนปิด token จะได้ไม่ต้องค้นทั้งคอลัมน์ซ้ำ
+        # จำเฉพาะ token ที่ยังใช้ได้ (Used / เก็บถาวรแล้วไม่ต้องจำ ถามชีตได้คำตอบเดิมเสมอ) และไม่เกิน TOKEN_CACHE_SIZE ตัว
+        self._token_rows = {}
+        self._token_status = {}
+        self._reserved = set()
+        self._token_lock = threading.Lock()
+
+    def worksheet(self, title):
+        return self.registry.worksheet(title)
+
+    @property
+    def customer_index(self):
+        if self._customer_index is None:
+            index = CustomerIndex(self.worksheet("Customers"))
+            index.rebuild()
+            self._customer_index = index
+        return self._customer_index
+
+    @property
+    def archive_index(self):
+        if self._archive_index is None:
+            self._archive_index = ArchiveIndex(self.worksheet(ARCHIVE_INDEX))
+        return self._archive_index
+
+    def _read_token_row(self, row, token):
+        values = self.worksheet("TokenDB").get_values(f"A{row}:{REDEEMED_BY_COLUMN}{row}")
+        if values and len(values[0]) >= 3 and str(values[0][0]).strip() == token:
+            return values[0]
+        return None
+
+    def _locate_token(self, token):
+        # อ่านคอลัมน์ A:E รอบเดียว (find ของ gspread ก็โหลดทั้งชีตอยู่แล้ว) ได้ทั้งเลขแถวและค่าในแถว
+        for i, row_values in enumerate(self.worksheet("TokenDB").get_values(f"A:{REDEEMED_BY_COLUMN}"), start=1):
+            if row_values and str(row_values[0]).strip() == token:
+                _remember(self._token_rows, token, i)
+                return i, row_values
+        self._token_rows.pop(token, None)
+        return None, None
+
+    def get_token(self, token):
+        token = clean_token(token)
+        snapshot = self.token_snapshot
+        if snapshot is not None and not snapshot.online:
+            # 📴 ออฟไลน์อยู่ (thread ของ snapshot จะเช็คทุกไม่กี่วินาทีว่ากลับมาหรือยัง) ไม่ต้องรอ Sheets ล้มซ้ำ
+            offline = self._offline_token(token)
+            if offline is not None:
+                return offline
+        try:
+            return self._get_token_online(token)
+        except Exception as e:
+            if snapshot is None:
+                raise
+            snapshot.last_error = str(e)
+            snapshot.mark_offline()
+            offline = self._offline_token(token)
+            if offline is None:
+                raise  # ไม่มีในสำเนา แสดง error ฐานข้อมูลขัดข้องตามเดิม
+            return offline
+
+    def _offline_token(self, token):
+        data = self.token_snapshot.lookup(token)
+        if data is None:
+            return None
+        METRICS.inc("offline_reads_total", op="get_token")
+        self._note_status(token, data['Status'])
+        if token in self._reserved:
+            data['Status'] = 'Used'
+        data['Offline'] = True
+        return data
+
+    def _get_token_online(self, token):
+        _, row_values = self._locate_token(token)
+        if row_values and len(row_values) >= 3:
+            status = str(row_values[2]).strip()
+            self._note_status(token, status)
+            if token in self._reserved:
+                status = 'Used'
+            return {
+                'Token': str(row_values[0]).strip(),
+                'Amount': row_values[1],
+                'Status': status
+            }
+        # ไม่อยู่ใน TokenDB แล้ว อาจถูกย้ายไปเก็บถาวร (ลิงก์เก่าที่ใช้ไปแล้ว / หมดอายุ)
+        archived = self.archive_index.lookup(token)
+        if archived is not None:
+            self._note_status(token, archived['Status'])
+        return archived
+
+    def _note_status(self, token, status):
+        if status == 'Active':
+            _remember(self._token_status, token, status)
+        else:
+            self._forget(token)
+
+    def _forget(self, token):
+        # token ปิดแล้ว ถามใหม่จะได้ Used จากชีต / สำเนาในเครื่อง ไม่ต้องจำแถวหรือสถานะไว้อีก
+        self._token_rows.pop(token, None)
+        self._token_status.pop(token, None)
+
+    def create_tokens(self, tokens):
+        # 🛠️ ต่อท้ายตารางด้วย append_rows ครั้งเดียว (ระบุ table_range="A1" กันการเขียนทับ ซึ่งเป็นเหตุผลที่เดิมใช้ insert_row ที่บรรทัด 2)
+        # ไม่ต้องให้ชีตเลื่อนทุกแถวลงทุกครั้งที่สร้าง QR
+        rows = [[token, amount, "Active", ts] for token, amount, ts in tokens]
+        self.worksheet("TokenDB").append_rows(rows, table_range="A1")
+        if self.token_snapshot is not None:
+            self.token_snapshot.add(rows)
+
+    # ⚠️ กันใช้ token ซ้ำได้เฉพาะภายใน process นี้ (_token_lock + _reserved) ไม่ใช่ atomic ที่ Google Sheets
+    # redeem_token อ่านแถวแล้วค่อย batch_update: แอปสองเครื่อง (หรือหลายสาขาที่ใช้ชีตเดียวกัน) ปิด token เดียวกัน
+    # พร้อมกันได้ทั้งคู่ และ claim ในคอลัมน์ E จะเป็นของคนที่เขียนทีหลัง ต้องรันแอปเครื่องเดียวต่อ spreadsheet
+    def reserve_token(self, token):
+        token = clean_token(token)
+        with self._token_lock:
+            if token not in self._token_status:
+                self.get_token(token)
+            if token in self._reserved or self._token_status.get(token) != 'Active':
+                raise TokenConflictError(token)
+            self._reserved.add(token)
+
+    def release_token(self, token):
+        with self._token_lock:
+            self._reserved.discard(clean_token(token))
+
+    def redeem_token(self, token, claim=None):
+        token = clean_token(token)
+        with self._token_lock:
+            row = self._token_rows.get(token)
+            row_values = self._read_token_row(row, token) if row else None
+            if row_values is None:
+                # แถวเลื่อน (retention ลบแถวที่ย้ายไปเก็บถาวรออก) หรือยังไม่เคยค้น ค้นตำแหน่งใหม่
+                row, row_values = self._locate_token(token)
+                if row is None:
+                    raise LookupError(f"token not found: {token}")
+            status = str(row_values[2]).strip()
+            holder = str(row_values[4]).strip() if len(row_values) > 4 else ""
+            if status != 'Active':
+                # ครั้งก่อนเราเขียนไปแล้วแต่ไม่ได้รับคำตอบ (ลองซ้ำ) ไม่ถือว่าชน
+                # มี claim ในแถวให้เทียบ claim (แม่นกว่า และยังถูกหลังเปิดแอปใหม่) ไม่มีใช้สถานะที่จำไว้แบบเดิม
+                ours = holder == claim if (holder and claim) else self._token_status.get(token) in ('Redeeming', 'Used')
+                if status == 'Used' and ours:
+                    self._reserved.discard(token)
+                    self._forget(token)
+                    return True
+                raise TokenConflictError(token)
+            _remember(self._token_status, token, 'Redeeming')
+            updates = [{"range": f"C{row}", "values": [["Used"]]}]
+            if claim:
+                updates.append({"range": f"{REDEEMED_BY_COLUMN}{row}", "values": [[claim]]})
+            self.worksheet("TokenDB").batch_update(updates)
+            # ชีตเป็น Used แล้ว (สำเนาในเครื่องด้านล่างด้วย) ถามครั้งหน้าได้ Used ไม่ต้องจองไว้ในหน่วยความจำอีก
+            self._reserved.discard(token)
+            self._forget(token)
+            if self.token_snapshot is not None:
+                self.token_snapshot.set_status(token, 'Used')
+            return True
+
+    def token_claim(self, token):
+        _, row_values = self._locate_token(clean_token(token))
+        if not row_values:
+            return None, None
+        row_values = list(row_values) + [""] * (5 - len(row_values))
+        return str(row_values[2]).strip(), str(row_values[4]).strip() or None
+
+    def find_customer(self, tax_id):
+        return self.customer_index.lookup(tax_id)
+
+    def search_customers(self, query, limit=10):
+        return [record for record, _, _ in self.customer_index.search(query, limit)]
+
+    def upsert_customer(self, row):
+        try:
+            customer_index = self.customer_index
+            need_save = not customer_index.contains(row[1])
+        except Exception:
+            customer_index = None
+            need_save = True
+
+        if need_save:
+            self.worksheet("Customers").append_row(row)
+            if customer_index is not None:
+                customer_index.add(row)
+        return need_save
+
+    def append_queue(self, row):
+        self.worksheet("Queue").append_row(row)
+
+    def queue_has_token(self, token):
+        return self.worksheet("Queue").find(clean_token(token), in_column=QUEUE_COLUMNS.index("token") + 1) is not None
+
+    def set_queue_status(self, token, status, ts=None):
+        # ใช้ไม่บ่อย (token ชน) อ่านทั้งแท็บครั้งเดียวเพื่อหาแถวให้ตรงทั้ง token และเวลา ไม่ทับแถวที่ออกใบกำกับไปแล้ว
+        token = clean_token(token)
+        ts_i, status_i, token_i = (QUEUE_COLUMNS.index(c) for c in ("ts", "status", "token"))
+        matches = []
+        for row_no, row in enumerate(self.worksheet("Queue").get_values(f"A:{chr(ord('A') + token_i)}"), start=1):
+            row = list(row) + [""] * (token_i + 1 - len(row))
+            if row_no > 1 and str(row[token_i]).strip() == token and (ts is None or str(row[ts_i]).strip() == str(ts)):
+                matches.append((row_no, str(row[status_i]).strip()))
+        if not matches:
+            raise LookupError(f"no Queue row for token: {token}")
+        row_no, current = matches[-1]
+        if current != "Pending":
+            return False
+        self.worksheet("Queue").batch_update([{"range": f"{chr(ord('A') + status_i)}{row_no}", "values": [[status]]}])
+        return True
+
+    def archive_old_rows(self, conf=None, now=None, dry_run=False):
+        from retention import run_retention
+
+        # ถือ lock ของ token ไว้ระหว่างลบแถว กันการปิด token ในโปรเซสนี้เขียนลงแถวที่กำลังเลื่อน
+        with self._token_lock:
+            summary = run_retention(self.registry, conf, now=now, dry_run=dry_run)
+            if not dry_run:
+                self._token_rows.clear()
+                if self.token_snapshot is not None:
+                    self.token_snapshot.invalidate()
+        return summary
+
+
+# ==========================================
+# 📘 SQLite (WAL) + ส่งต่อ Sheets เบื้องหลัง
+# ==========================================
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tokens (
+    token       TEXT PRIMARY KEY,
+    amount      REAL NOT NULL,
+    status      TEXT NOT NULL,
+    created_at  TEXT
+);
+CREATE TABLE IF NOT EXISTS customers (
+    tax_key     TEXT PRIMARY KEY,
+    name        TEXT,
+    tax_id      TEXT,
+    address1    TEXT,
+    address2    TEXT,
+    phone       TEXT
+);
+CREATE TABLE IF NOT EXISTS queue (
+    id          INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts          TEXT,
+    name        TEXT,
+    tax_id      TEXT,
+    addr1       TEXT,
+    addr2       TEXT,
+    phone       TEXT,
+    item        TEXT,
+    qty         INTEGER,
+    price       REAL,
+    status      TEXT,
+    token       TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_queue_status ON queue(status);
+CREATE INDEX IF NOT EXISTS idx_queue_token ON queue(token);
+"""
+
+
+class SheetsMirror:
+    # ส่งการเขียนต่อไปยัง SheetsStorage เบื้องหลัง ลูกค้าไม่ต้องรอ Google API
+    # ทุกงานจดลง journal ของ Outbox ก่อน (fsync) เปิดแอปใหม่ / Sheets ล่มนานๆ ก็ส่งต่อจนครบ ไม่ทิ้งงานกลางทาง
+    # งานที่ลองครบ max_attempts แล้วยังไม่ผ่านเป็น dead letter (ยังอยู่ใน journal ดูได้จาก dead_letters())
+    def __init__(self, target, path, max_attempts=10, base_delay=1.0):
+        self.target = target
+        self.outbox = Outbox(path, [("sheets", self._apply)], max_attempts=max_attempts, base_delay=base_delay).start()
+
+    def submit(self, method, *args):
+        self.outbox.submit(f"{method}-{uuid.uuid4().hex}", {"method": method, "args": list(args)})
+
+    def pending(self):
+        return len(self.outbox.pending())
+
+    def dead_letters(self):
+        return self.outbox.dead_letters()
+
+    def _apply(self, payload, retry):
+        method, args = payload["method"], payload["args"]
+        if retry and method == "append_queue":
+            if self.target.queue_has_token(args[0][QUEUE_COLUMNS.index("token")]):
+                return  # ครั้งก่อนเขียนสำเร็จไปแล้วแต่ไม่ได้รับคำตอบ
+        elif retry and method == "create_tokens":
+            existing = {str(v).strip() for v in self.target.worksheet("TokenDB").col_values(1)}
+            args = [[t for t in args[0] if t[0] not in existing]]
+            if not args[0]:
+                return
+        elif method == "redeem_token":
+            # token ยังไม่อยู่ในชีต (create_tokens ยังส่งไม่ถึง) ปล่อย LookupError ให้ลองใหม่รอบหน้า
+            try:
+                self.target.redeem_token(*args)
+            except TokenConflictError:
+                # SQLite คือข้อมูลหลัก ในชีตเป็น Used โดยงานอื่นอยู่แล้ว ลองใหม่ก็ได้ผลเดิม
+                METRICS.inc("token_conflicts_total", component="sheets_mirror")
+                print(f"Sheets mirror: token already used in TokenDB: {args[0]}")
+            return
+        getattr(self.target, method)(*args)
+
+
+class SQLiteStorage(StorageBackend):
+    def __init__(self, path, mirror=None):
+        self.path = path
+        self.mirror = mirror
+        self._local = threading.local()
+        self._search = None
+        self._search_lock = threading.Lock()
+        folder = os.path.dirname(os.path.abspath(path))
+        os.makedirs(folder, exist_ok=True)
+        self._conn().executescript(SQLITE_SCHEMA)
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _mirror(self, method, *args):
+        if self.mirror is not None:
+            self.mirror.submit(method, *args)
+
+    def get_token(self, token):
+        token = clean_token(token)
+        row = self._conn().execute(
+            "SELECT token, amount, status FROM tokens WHERE token = ?", (token,)
+        ).fetchone()
+        if row is not None:
+            return {'Token': row['token'], 'Amount': row['amount'], 'Status': row['status']}
+
+        # ไม่เจอในเครื่อง ลองถาม Sheets (token ที่สร้างไว้ก่อนเปลี่ยนมาใช้ SQLite) แล้วเก็บไว้ในเครื่อง
+        if self.mirror is not None:
+            found = self.mirror.target.get_token(token)
+            if found is not None:
+                self._conn().execute(
+                    "INSERT OR IGNORE INTO tokens (token, amount, status) VALUES (?, ?, ?)",
+                    (found['Token'], float(found['Amount']), found['Status']),
+                )
+            return found
+        return None
+
+    def create_tokens(self, tokens):
+        tokens = list(tokens)
+        with self._conn() as conn:
+            conn.execute("BEGIN")
+            conn.executemany(
+                "INSERT INTO tokens (token, amount, status, created_at) VALUES (?, ?, 'Active', ?)",
+                [(token, float(amount), ts) for token, amount, ts in tokens],
+            )
+        self._mirror("create_tokens", tokens)
+
+    def reserve_token(self, token):
+        # SQLite เป็นข้อมูลหลักอยู่แล้ว จองด้วย UPDATE ... WHERE status = 'Active' ได้เลย (atomic)
+        token = clean_token(token)
+        if self.get_token(token) is None:
+            raise LookupError(f"token not found: {token}")
+        cur = self._conn().execute(
+            "UPDATE tokens SET status = 'Used' WHERE token = ? AND status = 'Active'", (token,)
+        )
+        if cur.rowcount == 0:
+            raise TokenConflictError(token)
+
+    def release_token(self, token):
+        self._conn().execute(
+            "UPDATE tokens SET status = 'Active' WHERE token = ? AND status = 'Used'", (clean_token(token),)
+        )
+
+    def redeem_token(self, token, claim=None):
+        # reserve_token ทำ compare-and-set ที่ SQLite ไปแล้ว เหลือแค่ส่งต่อไป Sheets
+        # (SheetsStorage.redeem_token: แถวที่จำไว้ + batch_update ครั้งเดียว พร้อม claim กันนับว่าชนตอนลองซ้ำ)
+        token = clean_token(token)
+        self._conn().execute("UPDATE tokens SET status = 'Used' WHERE token = ?", (token,))
+        self._mirror("redeem_token", token, claim)
+        return True
+
+    def token_claim(self, token):
+        # SQLite เป็นข้อมูลหลักในเครื่อง (ไม่มีโหมดออฟไลน์) ไม่ได้เก็บ claim
+        row = self._conn().execute("SELECT status FROM tokens WHERE token = ?", (clean_token(token),)).fetchone()
+        return (row['status'] if row is not None else None), None
+
+    def find_customer(self, tax_id):
+        row = self._conn().execute(
+            "SELECT name, tax_id, address1, address2, phone FROM customers WHERE tax_key = ?",
+            (fix_tax_id(tax_id),),
+        ).fetchone()
+        if row is not None:
+            return dict(zip(CUSTOMER_COLUMNS, tuple(row)))
+
+        if self.mirror is not None:
+            found = self.mirror.target.find_customer(tax_id)
+            if found is not None:
+                self._insert_customer([found.get(c, "") for c in CUSTOMER_COLUMNS])
+            return found
+        return None
+
+    def _insert_customer(self, row):
+        cur = self._conn().execute(
+            "INSERT OR IGNORE INTO customers (tax_key, name, tax_id, address1, address2, phone) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (fix_tax_id(row[1]), *[str(v) for v in row]),
+        )
+        if cur.rowcount > 0:
+            with self._search_lock:
+                if self._search is not None:
+                    self._search.add(dict(zip(CUSTOMER_COLUMNS, [str(v) for v in row])))
+        return cur.rowcount > 0
+
+    def search_customers(self, query, limit=10):
+        with self._search_lock:
+            if self._search is None:
+                # สร้าง index จากตารางในเครื่องครั้งแรกที่ค้น หลังจากนั้น _insert_customer เติมให้ทีละราย
+                search = CustomerSearch()
+                for row in self._conn().execute("SELECT name, tax_id, address1, address2, phone FROM customers"):
+                    search.add(dict(zip(CUSTOMER_COLUMNS, tuple(row))))
+                self._search = search
+            results = self._search.search(query, limit)
+
+        if self.mirror is not None:
+            # ลูกค้าเก่าส่วนใหญ่ยังอยู่ใน Sheets เท่านั้น รวมผลทั้งสองที่ (ข้อมูลในเครื่องมาก่อน)
+            try:
+                results += self.mirror.target.customer_index.search(query, limit)
+            except Exception as e:
+                print(f"Sheets customer search failed: {e}")
+            results.sort(key=lambda r: -r[1])
+
+        found, seen = [], set()
+        for record, _, _ in results:
+            key = fix_tax_id(record['TaxID'])
+            if key not in seen:
+                seen.add(key)
+                found.append(record)
+        return found[:limit]
+
+    def upsert_customer(self, row):
+        inserted = self._insert_customer(row)
+        if inserted:
+            # ให้ฝั่ง Sheets เช็คซ้ำเองอีกรอบ (อาจมีลูกค้าคนนี้อยู่ในชีตแล้ว)
+            self._mirror("upsert_customer", row)
+        return inserted
+
+    def append_queue(self, row):
+        self._conn().execute(
+            f"INSERT INTO queue ({', '.join(QUEUE_COLUMNS)}) VALUES ({', '.join('?' * len(QUEUE_COLUMNS))})",
+            tuple(row),
+        )
+        self._mirror("append_queue", row)
+
+    def queue_has_token(self, token):
+        row = self._conn().execute("SELECT 1 FROM queue WHERE token = ? LIMIT 1", (clean_token(token),)).fetchone()
+        return row is not None
+
+    def set_queue_status(self, token, status, ts=None):
+        token = clean_token(token)
+        row = self._conn().execute(
+            "SELECT id, status FROM queue WHERE token = ? AND (? IS NULL OR ts = ?) ORDER BY id DESC LIMIT 1", (token, ts, ts)
+        ).fetchone()
+        if row is None:
+            raise LookupError(f"no Queue row for token: {token}")
+        if row['status'] != 'Pending':
+            return False
+        self._conn().execute("UPDATE queue SET status = ? WHERE id = ?", (status, row['id']))
+        self._mirror("set_queue_status", token, status, ts)
+        return True
+
+    def archive_old_rows(self, conf=None, now=None, dry_run=False):
+        # ตารางใน SQLite มี index อยู่แล้ว ไม่ต้องย้าย เก็บถาวรเฉพาะแท็บใน Sheets ที่ส่งต่อไป
+        if self.mirror is None:
+            return None
+        return self.mirror.target.archive_old_rows(conf, now=now, dry_run=dry_run)
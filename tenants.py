@@ -0,0 +1,110 @@
+import re
+from collections.abc import Mapping
+
+from sheets import SPREADSHEET_NAME
+
+# ==========================================
+# 🏪 หลายสาขาในแอปเดียว (แต่ละสาขามี spreadsheet / LINE / รหัสแอดมิน / โควตา Sheets ของตัวเอง)
+# ==========================================
+# เลือกสาขาจาก ?shop=<รหัสสาขา> ในลิงก์ ลิงก์ที่ไม่มี shop (ลิงก์/QR ที่พิมพ์ไปแล้ว) ใช้สาขา default_tenant
+# ค่าที่ไม่ได้ตั้งในสาขาจะใช้ค่ากลางด้านบนของ secrets (หัวข้อที่ตั้งในสาขาจะแทนทั้งหัวข้อ ไม่รวมรายคีย์)
+#
+# default_tenant = "pakkret"
+# [tenants.pakkret]
+# name = "ร้าน Nami 345 ปากเกร็ด"
+# spreadsheet_name = "Invoice_Data"
+# base_url = "https://nami-invoice-app.streamlit.app"
+# admin_password = "..."
+# [tenants.pakkret.line_messaging]
+# channel_access_token = "..."
+# group_id = "..."
+# [tenants.pakkret.sheets_quota]
+# reads_per_minute = 30
+#
+# ไม่มีหัวข้อ [tenants] = ร้านเดียวแบบเดิม (ใช้ secrets ทั้งไฟล์ ลิงก์ไม่มี ?shop=)
+
+DEFAULT_TENANT = "default"
+TENANT_KEY = re.compile(r"^[a-z0-9_-]{1,32}$")
+
+# ไฟล์ในเครื่องที่ต้องแยกตามสาขา (ถ้าสาขาไม่ได้ตั้ง path เอง): หัวข้อ, คีย์, ค่าเริ่มต้น
+LOCAL_PATHS = (
+    ("outbox", "path", "data/outbox.jsonl"),
+    ("storage", "sqlite_path", "data/nami.db"),
+    ("storage", "mirror_path", "data/sheets_mirror.jsonl"),
+    ("offline", "snapshot_path", "data/token_snapshot.json"),
+    ("dashboard", "cache_path", "data/dashboard.json"),
+    ("invoice", "out_dir", "data/invoices"),
+)
+
+
+def _plain(value):
+    # st.secrets / AttrDict -> dict ธรรมดา (แก้ไขได้ และส่งต่อให้ registry_from_secrets ฯลฯ ได้ตามเดิม)
+    if isinstance(value, Mapping):
+        return {k: _plain(v) for k, v in value.items()}
+    return value
+
+
+def _suffixed(path, key):
+    stem, dot, ext = path.rpartition(".")
+    return f"{stem}_{key}.{ext}" if dot else f"{path}_{key}"
+
+
+class Tenant:
+    def __init__(self, key, conf, single=False):
+        self.key = key
+        self.conf = conf          # ใช้แทน st.secrets ได้ทุกที่ (รวมค่ากลาง + ค่าของสาขาแล้ว)
+        self.single = single      # ร้านเดียวแบบเดิม: ลิงก์ไม่ต้องมี ?shop=
+        self.name = conf.get("name", key)
+        self.spreadsheet_name = conf.get("spreadsheet_name", SPREADSHEET_NAME)
+        self.base_url = conf.get("base_url")
+        self.admin_password = conf.get("admin_password")
+
+    def section(self, name):
+        return self.conf.get(name, {})
+
+    def link(self, token):
+        if self.single:
+            return f"{self.base_url}/?token={token}"
+        return f"{self.base_url}/?shop={self.key}&token={token}"
+
+
+def load_tenants(secrets, defaults=None):
+    # คืน (dict รหัสสาขา -> Tenant, รหัสสาขาเริ่มต้น)
+    # defaults คือค่าที่ใช้เมื่อ secrets ไม่ได้ตั้งไว้ (base_url / admin_password ที่ฝังในแอปเดิม)
+    shared = dict(defaults or {})
+    shared.update({k: _plain(v) for k, v in secrets.items() if k not in ("tenants", "default_tenant")})
+
+    tenant_conf = _plain(secrets.get("tenants", {}))
+    if not tenant_conf:
+        return {DEFAULT_TENANT: Tenant(DEFAULT_TENANT, shared, single=True)}, DEFAULT_TENANT
+
+    tenants = {}
+    for key, own in tenant_conf.items():
+        if not TENANT_KEY.match(key):
+            raise ValueError(f"invalid tenant key: {key!r} (use a-z, 0-9, _ or -)")
+        conf = {**shared, **own}
+        for section, name, default in LOCAL_PATHS:
+            if name not in own.get(section, {}):
+                conf[section] = {**conf.get(section, {}), name: _suffixed(conf.get(section, {}).get(name, default), key)}
+        tenants[key] = Tenant(key, conf)
+
+    default = secrets.get("default_tenant") or next(iter(tenants))
+    if default not in tenants:
+        raise ValueError(f"default_tenant {default!r} is not in [tenants]")
+    return tenants, default
+
+
+def resolve_tenant(tenants, default, shop=None):
+    # คืน Tenant ตาม ?shop= หรือ None ถ้าไม่รู้จักรหัสสาขานี้
+    if not shop:
+        return tenants[default]
+    return tenants.get(str(shop).strip().lower())
+
+
+def tenant_secrets(secrets, key=None):
+    # สำหรับสคริปต์ที่รันนอก Streamlit: คืน conf ของสาขา (ไม่ระบุ = สาขาเริ่มต้น)
+    tenants, default = load_tenants(secrets)
+    tenant = resolve_tenant(tenants, default, key)
+    if tenant is None:
+        raise SystemExit(f"unknown tenant: {key} (known: {', '.join(tenants)})")
+    return tenant.conf
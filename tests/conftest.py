@@ -0,0 +1,6 @@
+# ติดตั้ง: pip install -r requirements-dev.txt แล้วรัน python -m pytest -q tests (ที่รากของ repo)
+import os
+import sys
+
+# ให้ test import โมดูลของแอปที่อยู่ที่รากของ repo ได้ (repo ไม่มี package)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
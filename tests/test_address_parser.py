@@ -0,0 +1,65 @@
+import pytest
+
+from address_parser import PREFILL_CONFIDENCE, TIE_PENALTY, AddressParser, complete, district_line, province_line
+
+
+class FakeIndex:
+    # แทน PostcodeIndex: items() คืน (รหัส, ตำบล, อำเภอ, จังหวัด)
+    AREAS = [
+        ("11120", "บางพูด", "ปากเกร็ด", "นนทบุรี"),
+        ("11120", "ปากเกร็ด", "ปากเกร็ด", "นนทบุรี"),
+        ("10110", "คลองเตย", "คลองเตย", "กรุงเทพมหานคร"),
+        ("50000", "ศรีภูมิ", "เมืองเชียงใหม่", "เชียงใหม่"),
+        ("50200", "ศรีภูมิ", "เมืองเชียงราย", "เชียงราย"),
+    ]
+
+    def items(self):
+        return list(self.AREAS)
+
+
+@pytest.fixture(scope="module")
+def parser():
+    return AddressParser(FakeIndex())
+
+
+def test_full_address_has_full_confidence(parser):
+    parsed = parser.parse("99/1 หมู่ 2 ต.บางพูด", "อ.ปากเกร็ด จ.นนทบุรี 11120")
+    assert parsed.confidence == 1.0
+    assert (parsed.district, parsed.amphoe, parsed.province, parsed.zipcode) == ("บางพูด", "ปากเกร็ด", "นนทบุรี", "11120")
+    assert parsed.house == "99/1 หมู่ 2"
+    assert complete(parsed) and parsed.confidence >= PREFILL_CONFIDENCE
+    assert district_line(parsed) == "ต.บางพูด อ.ปากเกร็ด"
+    assert province_line(parsed) == "จ.นนทบุรี 11120"
+
+
+def test_prefix_glued_to_previous_word_and_bangkok_alias(parser):
+    parsed = parser.parse("12 ซอยสุขุมวิท 4 แขวงคลองเตย เขตคลองเตย กทม 10110")
+    assert parsed.confidence == 1.0
+    assert parsed.province == "กรุงเทพมหานคร"
+    assert district_line(parsed) == "แขวงคลองเตย เขตคลองเตย"
+
+    glued = parser.parse("99/1 ต.บางพูดอ.ปากเกร็ด นนทบุรี")
+    assert (glued.district, glued.amphoe) == ("บางพูด", "ปากเกร็ด")
+
+
+def test_partial_address_scores_only_matched_parts(parser):
+    parsed = parser.parse("5 ถนนแจ้งวัฒนะ", "บางพูด ปากเกร็ด")
+    assert parsed.confidence == pytest.approx(0.5)     # ตำบล + อำเภอ ไม่มีรหัสและจังหวัด
+    assert (parsed.district, parsed.amphoe, parsed.zipcode) == ("บางพูด", "ปากเกร็ด", "11120")
+    assert parsed.house == "5 ถนนแจ้งวัฒนะ"
+    assert parsed.confidence < PREFILL_CONFIDENCE
+
+
+def test_ambiguous_district_keeps_only_agreeing_fields(parser):
+    # ศรีภูมิ มีทั้งเชียงใหม่และเชียงราย ไม่มีส่วนอื่นช่วยตัดสิน
+    parsed = parser.parse("1 ถนนมูลเมือง ต.ศรีภูมิ")
+    assert parsed.district == "ศรีภูมิ"
+    assert parsed.amphoe == parsed.province == parsed.zipcode == ""
+    assert parsed.confidence == pytest.approx(0.25 * TIE_PENALTY)
+    assert not complete(parsed)
+
+
+def test_unknown_address_has_zero_confidence(parser):
+    parsed = parser.parse("อาคารไม่มีในฐาน ชั้น 3", "")
+    assert parsed.confidence == 0.0
+    assert parsed.house == "อาคารไม่มีในฐาน ชั้น 3"
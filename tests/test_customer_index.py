@@ -0,0 +1,63 @@
+from bench.fake_sheets import FakeClient, seed_invoice_data
+from customer_index import CustomerIndex
+from sheets import SheetsBusy
+
+
+def customers_tab(customers=3):
+    client = FakeClient()
+    book = seed_invoice_data(client, customers=customers)
+    return client.backend, book.sheets["Customers"]
+
+
+def test_lookup_normalizes_tax_id_and_loads_once():
+    backend, ws = customers_tab()
+    index = CustomerIndex(ws, refresh_interval=60)
+    assert index.lookup("1-0000-00000-00-1")["Name"] == "บริษัท ทดสอบ 1 จำกัด (สำนักงานใหญ่)"
+    assert index.lookup("1000000000002")["Phone"] == "800000002"
+    assert len(index) == 3
+    assert backend.calls["Customers.get_all_values"] == 1
+
+
+def test_miss_reads_only_new_rows():
+    backend, ws = customers_tab()
+    index = CustomerIndex(ws, refresh_interval=0)
+    index.rebuild()
+    ws.append_row(["ร้านใหม่", "0105551234567", "", "", "0812345678"])
+
+    assert index.lookup("105551234567")["Name"] == "ร้านใหม่"
+    assert backend.calls["Customers.get_all_values"] == 1
+    assert backend.calls["Customers.get_values"] == 1
+    assert index.search("ร้านใหม่")[0][0]["TaxID"] == "0105551234567"
+
+
+def test_first_row_wins_for_duplicate_tax_ids():
+    _, ws = customers_tab(customers=1)
+    ws.append_row(["ชื่อซ้ำ", "1000000000000", "", "", ""])
+    index = CustomerIndex(ws)
+    assert index.lookup("1000000000000")["Name"] == "บริษัท ทดสอบ 0 จำกัด (สำนักงานใหญ่)"
+    assert len(index) == 1
+
+
+def test_busy_quota_keeps_local_data():
+    _, ws = customers_tab()
+    index = CustomerIndex(ws, refresh_interval=0)
+    index.rebuild()
+
+    def busy(*args, **kwargs):
+        raise SheetsBusy("read quota exceeded")
+
+    ws.get_values = busy
+    assert index.lookup("9999999999999") is None
+    assert index.contains("1000000000001")
+
+
+def test_add_after_append_is_not_duplicated_on_refresh():
+    _, ws = customers_tab(customers=1)
+    index = CustomerIndex(ws, refresh_interval=0)
+    index.rebuild()
+    row = ["ร้านใหม่", "0105551234567", "", "", ""]
+    ws.append_row(row)
+    index.add(row)
+    index.refresh(force=True)
+    assert len(index) == 2
+    assert len(index.search("0105551234567")) == 1
@@ -0,0 +1,58 @@
+from customer_search import CustomerSearch, normalize_name
+
+
+def customer(tax_id, name, phone=""):
+    return {'TaxID': tax_id, 'Name': name, 'Phone': phone}
+
+
+def make_search(*records):
+    search = CustomerSearch()
+    for record in records:
+        search.add(record)
+    return search
+
+
+def test_taxid_and_phone_prefix():
+    search = make_search(
+        customer("0105551234567", "บริษัท อัลฟ่า จำกัด", "081-234-5678"),
+        customer("0105559999999", "บริษัท เบต้า จำกัด", "+66 89 111 2222"),
+        customer("3100500000001", "ร้านแกมม่า", "0812000000"),
+    )
+    hits = search.search("010555")
+    assert [r['TaxID'] for r, _, field in hits] == ["0105551234567", "0105559999999"]
+    assert {field for _, _, field in hits} == {'taxid'}
+
+    exact = search.search("0105551234567")
+    assert exact[0][1] == 1.0
+
+    by_phone = search.search("0891112222")
+    assert by_phone[0][0]['TaxID'] == "0105559999999" and by_phone[0][2] == 'phone'
+    assert [r['TaxID'] for r, _, _ in search.search("08123")] == ["0105551234567"]
+
+
+def test_name_ranking_prefers_exact_then_contained():
+    search = make_search(
+        customer("1000000000001", "บริษัท นามิ เทรดดิ้ง จำกัด (สำนักงานใหญ่)"),
+        customer("1000000000002", "นามิ"),
+        customer("1000000000003", "ร้านอาหารทะเล"),
+    )
+    hits = search.search("นามิ")
+    assert [r['TaxID'] for r, _, _ in hits] == ["1000000000002", "1000000000001"]
+    assert hits[0][1] == 1.0 and hits[1][1] < 1.0
+    # คำบริษัท/จำกัด/สาขา และวรรณยุกต์ไม่มีผลต่อการค้นหา
+    assert normalize_name("บริษัท น้ำใส จำกัด (สาขา 2)") == normalize_name("นำใส")
+
+
+def test_reindex_removes_old_phone_and_name_postings():
+    search = make_search(customer("1000000000001", "อัลฟ่า การค้า", "0811111111"))
+    search.add(customer("1000000000001", "เบต้า ซัพพลาย", "0822222222"))
+
+    assert len(search) == 1
+    assert search.search("0811111111") == []
+    assert search.search("อัลฟ่า") == []
+    assert search.search("0822222222")[0][0]['Name'] == "เบต้า ซัพพลาย"
+    assert search.search("เบต้า")[0][0]['Name'] == "เบต้า ซัพพลาย"
+    # ลบแล้วเพิ่มซ้ำได้ โดยไม่มี id ซ้ำใน index
+    search.add(customer("1000000000001", "เบต้า ซัพพลาย", "0822222222"))
+    assert len(search.search("08222")) == 1
+    assert len(search.search("เบต้า")) == 1
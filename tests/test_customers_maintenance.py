@@ -0,0 +1,51 @@
+import math
+
+import pandas as pd
+import pytest
+
+from customers_maintenance import normalize_phones, normalize_tax_ids, plan
+from formatters import fix_phone_number, fix_tax_id
+
+# ค่าที่ get_all_values() ส่งมาเป็นข้อความเสมอ (ตัวเลขใส่ไว้เผื่ออ่านจาก CSV / SQLite)
+TAX_IDS = [
+    "0105551234567", "105551234567", " 1-2345-67890-12-3 ", "'0105551234567", "12345.0", "123.0.0",
+    "", "   ", "abc", "12a45", "01055512345678", "1 2 3", "1.5", "nan", 12345, 1234567890123.0,
+]
+PHONES = [
+    "0812345678", "812345678", "'812345678", "081-234-5678", "02,123,4567", " 812345678 ", "+66812345678",
+    "", "   ", None, math.nan, "81234567", "abc", "8123456789", 812345678,
+]
+
+
+@pytest.mark.parametrize("value", TAX_IDS)
+def test_normalize_tax_ids_matches_fix_tax_id(value):
+    assert normalize_tax_ids(pd.Series([value], dtype=object)).tolist() == [fix_tax_id(value)]
+
+
+@pytest.mark.parametrize("value", PHONES)
+def test_normalize_phones_matches_fix_phone_number(value):
+    assert normalize_phones(pd.Series([value], dtype=object)).tolist() == [fix_phone_number(value)]
+
+
+def test_whole_columns_match_row_by_row():
+    assert normalize_tax_ids(pd.Series(TAX_IDS, dtype=object)).tolist() == [fix_tax_id(v) for v in TAX_IDS]
+    assert normalize_phones(pd.Series(PHONES, dtype=object)).tolist() == [fix_phone_number(v) for v in PHONES]
+
+
+def test_plan_keeps_latest_duplicate_and_drops_empty_rows():
+    values = [
+        ["TaxID", "Name", "Phone"],
+        ["105551234567", "เก่า", "812345678"],
+        ["", "", ""],
+        ["", "ไม่มีเลขภาษี", ""],
+        ["0105551234567", "ใหม่", "0812345678"],
+        ["", "ไม่มีเลขภาษี", ""],
+    ]
+    result = plan(values)
+    assert result["rows"] == [
+        ["", "ไม่มีเลขภาษี", ""],
+        ["0105551234567", "ใหม่", "0812345678"],
+        ["", "ไม่มีเลขภาษี", ""],
+    ]
+    assert (result["duplicates"], result["empty"], result["old_rows"]) == (1, 1, 6)
+    assert sorted(result["changes"]) == [(2, "Phone", "812345678", "0812345678"), (2, "TaxID", "105551234567", "0105551234567")]
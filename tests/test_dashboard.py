@@ -0,0 +1,69 @@
+from datetime import date
+
+import pytest
+
+from bench.fake_sheets import FakeClient, seed_invoice_data
+from dashboard import Aggregates, TabColumns
+from storage import QUEUE_CONFLICT
+
+
+def queue_row(ts, price, status, token="T"):
+    return [ts, "ลูกค้า", "0105551234567", "", "", "", "สินค้า", "1", price, status, token]
+
+
+def test_apply_then_unapply_returns_to_zero():
+    agg = Aggregates()
+    agg.apply("Queue", "2026-01-02 10:15:00", "1,200", "Pending")
+    agg.apply("Queue", "2026-01-02 10:15:00", "1,200", "Pending", -1)
+    assert agg.pending == 0 and agg.pending_amount == 0
+    assert agg.revenue_day["2026-01-02"] == 0 and agg.orders_day["2026-01-02"] == 0
+    assert agg.revenue_hour["2026-01-02 10"] == 0
+
+
+def test_status_change_moves_pending_but_keeps_revenue():
+    agg = Aggregates()
+    agg.apply("Queue", "2026-01-02 10:15:00", "150", "Pending")
+    agg.apply("Queue", "2026-01-02 10:15:00", "150", "Pending", -1)
+    agg.apply("Queue", "2026-01-02 10:15:00", "150", "Invoiced")
+    assert (agg.pending, agg.pending_amount) == (0, 0.0)
+    assert agg.revenue_day["2026-01-02"] == 150.0 and agg.orders_day["2026-01-02"] == 1
+
+
+def test_conflict_rows_and_bad_dates_are_not_revenue():
+    agg = Aggregates()
+    agg.apply("Queue", "2026-01-02 10:15:00", "150", QUEUE_CONFLICT)
+    agg.apply("Queue", "Timestamp", "Price", "Status")
+    agg.apply("Queue", "", "150", "Pending")
+    assert agg.conflicts == 1
+    assert dict(agg.revenue_day) == {} and agg.pending == 0
+
+
+def test_token_counts_and_merge_round_trip():
+    agg = Aggregates()
+    agg.apply("TokenDB", "2026-01-02 09:00:00", "100", "Active")
+    agg.apply("TokenDB", "2026-01-02 09:00:00", "100", "Used")
+    other = Aggregates.from_dict(Aggregates.to_dict(agg))
+    merged = agg.merge(other)
+    assert merged.created_day["2026-01-02"] == 4 and merged.used_day["2026-01-02"] == 2
+    assert merged.daily("created_day", date(2026, 1, 1), date(2026, 1, 3)) == [
+        ("2026-01-01", 0), ("2026-01-02", 4), ("2026-01-03", 0)]
+
+
+def test_delta_applies_status_changes_like_a_full_reload():
+    book = seed_invoice_data(FakeClient(), customers=0)
+    ws = book.sheets["Queue"]
+    ws.append_row(queue_row("2026-01-02 10:15:00", "100", "Pending", "T1"))
+    ws.append_row(queue_row("2026-01-02 11:30:00", "250", "Pending", "T2"))
+    totals = Aggregates()
+    columns = TabColumns(ws, "Queue", totals)
+    assert columns.sync()
+
+    ws.rows[1][9] = "Invoiced"                      # อีกเครื่องออกใบกำกับ T1
+    ws.append_row(queue_row("2026-01-03 08:00:00", "50", "Pending", "T3"))
+    assert not columns.sync()                       # อ่านเพิ่มแบบ delta ไม่ต้องโหลดทั้งแท็บ
+
+    fresh = Aggregates()
+    TabColumns(ws, "Queue", fresh).sync()
+    for name in Aggregates.SUMS:
+        assert dict(getattr(totals, name)) == pytest.approx(dict(getattr(fresh, name)))
+    assert (totals.pending, totals.pending_amount) == (fresh.pending, fresh.pending_amount) == (2, 300.0)
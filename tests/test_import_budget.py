@@ -0,0 +1,23 @@
+import os
+
+import pytest
+
+pytest.importorskip("streamlit")
+
+from bench.import_budget import HEAVY_MODULES, app_imports, measure
+
+# งบเดียวกับ python -m bench.import_budget (เครื่อง CI ช้ากว่าให้ตั้ง IMPORT_BUDGET_MS เพิ่มได้)
+BUDGET_MS = float(os.environ.get("IMPORT_BUDGET_MS", 300))
+
+
+@pytest.fixture(scope="module")
+def startup():
+    return measure(app_imports(), repeat=3)
+
+
+def test_no_heavy_modules_at_startup(startup):
+    assert [m for m in HEAVY_MODULES if m in startup["loaded"]] == []
+
+
+def test_import_time_within_budget(startup):
+    assert startup["ms"] <= BUDGET_MS
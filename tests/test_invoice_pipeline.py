@@ -0,0 +1,80 @@
+import os
+
+import pytest
+
+import invoice_pipeline
+from bench.fake_sheets import FakeClient, seed_invoice_data
+from invoice_pipeline import mark_done, run_batch
+
+
+def queue_row(status, token):
+    return ["2026-03-01 10:00:00", "บริษัท ทดสอบ", "1000000000001", "a1", "a2", "0800000001", "สินค้า", "1", "107", status, token]
+
+
+@pytest.fixture
+def queue():
+    book = seed_invoice_data(FakeClient(), customers=0)
+    ws = book.sheets["Queue"]
+    ws.rows += [queue_row("Pending", "T1"), queue_row("Invoiced", "T2"), queue_row("Pending", "T3")]
+    return ws
+
+
+@pytest.fixture
+def inline_render(monkeypatch, tmp_path):
+    # ไม่วาดจริง (ไม่ต้องมีฟอนต์ไทย / process ลูก) ใช้เลขใบกำกับเป็นหน้าแทน
+    font = tmp_path / "font.ttf"
+    font.write_bytes(b"")
+
+    def no_pool(*args, **kwargs):
+        raise OSError("no pool in tests")
+
+    monkeypatch.setattr(invoice_pipeline, "ProcessPoolExecutor", no_pool)
+    monkeypatch.setattr(invoice_pipeline, "_init_worker", lambda font_path, seller: None)
+    monkeypatch.setattr(invoice_pipeline, "render_invoice", lambda invoice_no, row: invoice_no.encode())
+    monkeypatch.setattr(invoice_pipeline, "pdf_document", lambda pages: b"".join(pages))
+    return {"font_path": str(font)}
+
+
+def test_mark_done_returns_updated_rows(queue):
+    queue.rows[3][9] = "Conflict"      # แถว 4 ถูกแก้หลังอ่าน
+    assert mark_done(queue, [(2, "T1"), (4, "T3")]) == [2]
+    assert [row[9] for row in queue.rows[1:]] == ["Invoiced", "Invoiced", "Conflict"]
+
+
+def test_mark_done_skips_rows_with_other_token(queue):
+    assert mark_done(queue, [(2, "T9")]) == []
+    assert queue.rows[1][9] == "Pending"
+
+
+def test_run_batch_returns_only_marked_rows(queue, inline_render, tmp_path, monkeypatch):
+    real_mark_done = invoice_pipeline.mark_done
+
+    def edit_then_mark(worksheet, rows, status):
+        worksheet.rows[3][9] = "Conflict"   # มีคนแก้แถว 4 ระหว่างวาด
+        return real_mark_done(worksheet, rows, status)
+
+    monkeypatch.setattr(invoice_pipeline, "mark_done", edit_then_mark)
+    out = tmp_path / "out"
+    results = run_batch(queue, inline_render, out_dir=str(out))
+
+    assert [(invoice_no, row_no) for invoice_no, row_no, _ in results] == [("INV20260301-00002", 2)]
+    assert sorted(os.listdir(out)) == ["INV20260301-00002.pdf"]
+
+
+def test_run_batch_saves_before_marking(queue, inline_render, tmp_path, monkeypatch):
+    out = tmp_path / "out"
+
+    def fail(worksheet, rows, status):
+        assert sorted(os.listdir(out)) == ["INV20260301-00002.pdf", "INV20260301-00004.pdf"]
+        raise RuntimeError("sheets down")
+
+    monkeypatch.setattr(invoice_pipeline, "mark_done", fail)
+    with pytest.raises(RuntimeError):
+        run_batch(queue, inline_render, out_dir=str(out))
+    assert [row[9] for row in queue.rows[1:]] == ["Pending", "Invoiced", "Pending"]
+
+
+def test_dry_run_keeps_rows_pending(queue, inline_render):
+    results = run_batch(queue, inline_render, dry_run=True)
+    assert [row_no for _, row_no, _ in results] == [2, 4]
+    assert [row[9] for row in queue.rows[1:]] == ["Pending", "Invoiced", "Pending"]
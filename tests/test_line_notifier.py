@@ -0,0 +1,46 @@
+import pytest
+
+from bench.fake_line import FakeLineServer
+from line_notifier import MAX_MESSAGES_PER_PUSH, LineNotifier, LinePushError, retry_key
+
+
+@pytest.fixture
+def server():
+    server = FakeLineServer().start()
+    yield server
+    server.stop()
+
+
+def notifier(server, **kwargs):
+    return LineNotifier("test", "group", api_base=server.url, sleep=lambda s: None, **kwargs)
+
+
+def pushes(server):
+    return [n for method, path, n in server.requests if method == "POST"]
+
+
+def test_batches_five_messages_per_push(server):
+    notifier(server).push([f"m{i}" for i in range(12)], key="k1")
+
+    assert pushes(server) == [MAX_MESSAGES_PER_PUSH, MAX_MESSAGES_PER_PUSH, 2]
+    assert server.messages == [f"m{i}" for i in range(12)]
+
+
+def test_retry_with_same_key_does_not_post_twice(server):
+    line = notifier(server)
+    line.push("hello", key="k1")
+    line.push("hello", key="k1")     # เหมือน outbox ลองใหม่หลัง timeout: LINE ตอบ 409 ถือว่าสำเร็จ
+
+    assert server.messages == ["hello"]
+    assert retry_key("k1") == retry_key("k1") != retry_key("k1", 1)
+
+
+def test_raises_after_last_attempt_without_extra_sleep(server):
+    server.httpd.error_rate = 1.0
+    slept = []
+    line = LineNotifier("test", "group", api_base=server.url, max_retries=3, sleep=slept.append)
+
+    with pytest.raises(LinePushError):
+        line.push("hello", key="k1")
+    assert pushes(server) == [1, 1, 1]
+    assert slept == [1, 2]
@@ -0,0 +1,93 @@
+import json
+
+import pytest
+
+from outbox import FAILED, OK, SKIPPED, Outbox
+
+
+class Recorder:
+    # step ปลอม: จดว่าถูกเรียกด้วย retry อะไร และล้มได้ตามสั่ง
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.calls = []
+
+    def __call__(self, payload, retry):
+        self.calls.append((payload["n"], retry))
+        if self.fail:
+            raise RuntimeError("sheet down")
+
+
+def journal(path):
+    return [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+
+
+def write_journal(path, records, torn=""):
+    path.write_text("".join(json.dumps(r) + "\n" for r in records) + torn, encoding="utf-8")
+
+
+@pytest.fixture
+def path(tmp_path):
+    return tmp_path / "outbox.jsonl"
+
+
+def test_replay_skips_done_steps_and_marks_retry(path):
+    write_journal(path, [
+        {"op": "add", "key": "k1", "payload": {"n": 1}, "ts": 1.0},
+        {"op": "step", "key": "k1", "step": "queue"},
+    ])
+    queue, line = Recorder(), Recorder()
+    box = Outbox(str(path), [("queue", queue), ("line", line)])
+
+    [entry] = box.pending()
+    assert entry.done_steps == {"queue"}
+    box._process(entry)
+    assert queue.calls == []
+    assert line.calls == [(1, True)]
+    assert box.status("k1")["state"] == "done"
+
+
+def test_after_step_not_run_when_dependency_fails(path):
+    queue, token = Recorder(fail=True), Recorder()
+    box = Outbox(str(path), [("queue", queue), ("token", token, ["queue"])], base_delay=60)
+    box.submit("k1", {"n": 1})
+
+    [entry] = box.pending()
+    box._process(entry)
+    assert queue.calls == [(1, False)]
+    assert token.calls == []
+    steps = box.status("k1")["steps"]
+    assert (steps["queue"].status, steps["token"].status) == (FAILED, SKIPPED)
+    assert entry.failures == 1 and entry.next_attempt > 0
+
+    queue.fail = False
+    box._process(entry)
+    assert queue.calls[-1] == (1, True)
+    assert token.calls == [(1, True)]
+    assert box.status("k1")["steps"]["token"].status == OK
+
+
+def test_torn_last_line_is_ignored(path):
+    write_journal(path, [
+        {"op": "add", "key": "k1", "payload": {"n": 1}, "ts": 1.0},
+    ], torn='{"op": "step", "key": "k1", "st')
+    box = Outbox(str(path), [("queue", Recorder())])
+
+    [entry] = box.pending()
+    assert entry.key == "k1" and entry.done_steps == set()
+    assert [r["op"] for r in journal(path)] == ["add"]
+
+
+def test_completed_entry_is_compacted(path):
+    write_journal(path, [
+        {"op": "add", "key": "old", "payload": {"n": 0}, "ts": 0.5},
+        {"op": "step", "key": "old", "step": "queue"},
+        {"op": "done", "key": "old"},
+    ])
+    box = Outbox(str(path), [("queue", Recorder())])
+    assert box.pending() == []
+    assert path.read_text(encoding="utf-8") == ""
+
+    box.submit("k1", {"n": 1})
+    box._process(box.pending()[0])
+    assert path.read_text(encoding="utf-8") == ""
+    assert box.status("k1")["state"] == "done"
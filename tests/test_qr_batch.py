@@ -0,0 +1,46 @@
+import pytest
+
+from qr_batch import MAX_BATCH, parse_amounts
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("1,200", [1200.0]),
+    ("1200\t3", [1200.0] * 3),
+    ("250x4", [250.0] * 4),
+    ("1,200x3", [1200.0] * 3),
+    ("150 × 2", [150.0] * 2),
+    ("1,234,567.50", [1234567.5]),
+])
+def test_parse_amounts(text, expected):
+    assert parse_amounts(text) == expected
+
+
+@pytest.mark.parametrize("text", ["12,34", "1,20", "150,20", "1,200,3", "1,2000", "-5"])
+def test_parse_amounts_rejects_ambiguous_commas(text):
+    with pytest.raises(ValueError, match="บรรทัด 1"):
+        parse_amounts(text)
+
+
+@pytest.mark.parametrize("text, expected", [
+    ('"1,200",2', [1200.0] * 2),
+    ("150,20", [150.0] * 20),
+    ("150,2,หมายเหตุ", [150.0] * 2),
+    ("amount;copies\n99.5;2\n10;1", [99.5, 99.5, 10.0]),
+])
+def test_parse_amounts_csv_file(text, expected):
+    assert parse_amounts(text, csv_file=True) == expected
+
+
+@pytest.mark.parametrize("text", ['"12,34",2', "150,2x"])
+def test_parse_amounts_csv_file_rejects_bad_cells(text):
+    with pytest.raises(ValueError):
+        parse_amounts(text, csv_file=True)
+
+
+def test_parse_amounts_skips_header_blank_and_zero():
+    assert parse_amounts("amount\n150\nabc\n0\n\n99.5x2") == [150.0, 99.5, 99.5]
+
+
+def test_parse_amounts_rejects_oversized_batch():
+    with pytest.raises(ValueError):
+        parse_amounts(f"10x{MAX_BATCH + 1}")
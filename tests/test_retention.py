@@ -0,0 +1,94 @@
+from datetime import datetime
+
+import pytest
+
+from bench.fake_sheets import FakeClient, seed_invoice_data
+from retention import ARCHIVE_META, QUEUE_OFFSET_KEY, queue_offset, run_retention
+from sheets import SheetRegistry
+
+NOW = datetime(2026, 3, 20, 12, 0, 0)
+
+
+def queue_row(ts, status, token):
+    return [ts, "บริษัท ทดสอบ", "1000000000001", "addr1", "addr2", "0800000001", "สินค้า", "1", "100", status, token]
+
+
+@pytest.fixture
+def book():
+    client = FakeClient()
+    book = seed_invoice_data(client, customers=1)
+    book.sheets["TokenDB"].rows += [
+        ["T-USED-OLD", "100", "Used", "2026-02-01 10:00:00"],
+        ["T-ACTIVE-OLD", "200", "Active", "2025-11-01 10:00:00"],
+        ["T-USED-NEW", "300", "Used", "2026-03-19 10:00:00"],
+        ["T-ACTIVE-NEW", "400", "Active", "2026-03-01 10:00:00"],
+    ]
+    book.sheets["Queue"].rows += [
+        queue_row("2026-02-01 10:00:00", "Invoiced", "T-USED-OLD"),
+        queue_row("2026-02-02 10:00:00", "Invoiced", "Q2"),
+        queue_row("2026-02-03 10:00:00", "Pending", "Q3"),
+        queue_row("2026-02-04 10:00:00", "Invoiced", "Q4"),    # อยู่ใต้แถว Pending ต้องไม่ย้าย
+    ]
+    return client, book
+
+
+def registry(client):
+    return SheetRegistry(lambda: client)
+
+
+def tokens(book, title="TokenDB"):
+    return [row[0] for row in book.sheets[title].rows[1:]]
+
+
+def test_moves_used_and_expired_tokens(book):
+    client, book = book
+    summary = run_retention(registry(client), {"keep_days": 7, "expire_days": 90}, now=NOW)
+
+    assert summary["tokens"] == 2
+    assert tokens(book) == ["T-USED-NEW", "T-ACTIVE-NEW"]
+    assert book.sheets["TokenDB_2026-02"].rows[1:] == [["T-USED-OLD", "100", "Used", "2026-02-01 10:00:00"]]
+    assert book.sheets["TokenDB_2025-11"].rows[1:] == [["T-ACTIVE-OLD", "200", "Expired", "2025-11-01 10:00:00"]]
+    index = {row[0]: row[3] for row in book.sheets["ArchiveIndex"].rows[1:]}
+    assert index == {"T-USED-OLD": "TokenDB_2026-02", "T-ACTIVE-OLD": "TokenDB_2025-11"}
+
+
+def test_queue_stops_at_pending_and_records_offset(book):
+    client, book = book
+    reg = registry(client)
+    summary = run_retention(reg, now=NOW)
+
+    assert summary["queue"] == 2
+    assert summary["queue_offset"] == 2
+    assert [row[10] for row in book.sheets["Queue"].rows[1:]] == ["Q3", "Q4"]
+    assert [row[10] for row in book.sheets["Queue_2026-02"].rows[1:]] == ["T-USED-OLD", "Q2"]
+    assert book.sheets[ARCHIVE_META].rows[1][0] == QUEUE_OFFSET_KEY
+    assert queue_offset(reg) == 2
+
+
+def test_rerun_does_not_duplicate_archive_rows(book):
+    client, book = book
+    # รอบแรกเขียนแท็บเก็บถาวรแล้วแต่ล้มก่อนลบแถว: รันใหม่ต้องไม่เขียนซ้ำ
+    original = book.batch_update
+    book.batch_update = lambda body: (_ for _ in ()).throw(RuntimeError("network"))
+    with pytest.raises(RuntimeError):
+        run_retention(registry(client), now=NOW)
+    book.batch_update = original
+
+    summary = run_retention(registry(client), now=NOW)
+    assert summary["queue_offset"] == 2
+    assert len(book.sheets["TokenDB_2026-02"].rows) == 2
+    assert len(book.sheets["Queue_2026-02"].rows) == 3
+    assert len(book.sheets["ArchiveIndex"].rows) == 3
+
+    summary = run_retention(registry(client), now=NOW)
+    assert (summary["tokens"], summary["queue"]) == (0, 0)
+    assert queue_offset(registry(client)) == 2
+
+
+def test_dry_run_changes_nothing(book):
+    client, book = book
+    before = {title: [list(r) for r in ws.rows] for title, ws in book.sheets.items()}
+    summary = run_retention(registry(client), now=NOW, dry_run=True)
+
+    assert (summary["tokens"], summary["queue"]) == (2, 2)
+    assert {title: ws.rows for title, ws in book.sheets.items()} == before
@@ -0,0 +1,112 @@
+import pytest
+
+import sheets
+from sheets import CRITICAL, NORMAL, STALE_OK, SheetScheduler, SheetsBusy, TokenBucket
+
+
+class QuotaError(Exception):
+    def __init__(self, code=429):
+        super().__init__(code)
+        self.code = code
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(sheets.time, "monotonic", clock)
+    return clock
+
+
+def test_token_bucket_spends_capacity_then_refills(clock):
+    bucket = TokenBucket(per_minute=60, capacity=2)
+    assert bucket.take() == 0
+    assert bucket.take() == 0
+    assert bucket.take() == pytest.approx(1.0)    # 1 ครั้ง/วินาที
+    clock.now += 0.5
+    assert bucket.take() == pytest.approx(0.5)
+    clock.now += 0.5
+    assert bucket.take() == 0
+
+
+def test_token_bucket_throttle_halves_rate_and_recovers(clock):
+    bucket = TokenBucket(per_minute=60)
+    bucket.throttle()
+    assert bucket.tokens == 0
+    assert bucket.rate == pytest.approx(0.5)
+    for _ in range(10):
+        bucket.throttle()
+    assert bucket.rate == pytest.approx(1 / 16)    # ไม่ต่ำกว่า 1/16 ของอัตราปกติ
+    for _ in range(100):
+        bucket.recover()
+    assert bucket.rate == pytest.approx(1.0)       # ไม่เกินอัตราปกติ
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    slept = []
+    monkeypatch.setattr(sheets.time, "sleep", slept.append)
+    monkeypatch.setattr(sheets.random, "uniform", lambda low, high: high)
+    return slept
+
+
+def flaky(failures, code=429):
+    calls = []
+
+    def fn(value):
+        calls.append(value)
+        if len(calls) <= failures:
+            raise QuotaError(code)
+        return value
+
+    return fn, calls
+
+
+def test_429_backs_off_exponentially_then_succeeds(sleeps):
+    scheduler = SheetScheduler(reads_per_minute=60000, writes_per_minute=60000, base_delay=1.0, max_delay=3.0)
+    fn, calls = flaky(3)
+    assert scheduler.run("write", CRITICAL, fn, "x") == "x"
+    assert len(calls) == 4
+    assert sleeps == [1.0, 2.0, 3.0]    # 1, 2, 4 แต่ไม่เกิน max_delay
+    assert scheduler.buckets["write"].rate < scheduler.buckets["write"].base_rate
+    assert scheduler.buckets["read"].rate == scheduler.buckets["read"].base_rate
+
+
+def test_429_gives_up_after_max_retries(sleeps):
+    scheduler = SheetScheduler(reads_per_minute=60000, writes_per_minute=60000, max_retries=2)
+    fn, calls = flaky(10)
+    with pytest.raises(QuotaError):
+        scheduler.run("write", NORMAL, fn, "x")
+    assert len(calls) == 3
+    assert len(sleeps) == 2
+
+
+def test_stale_ok_read_is_deferred_on_429_without_retry(sleeps):
+    scheduler = SheetScheduler(reads_per_minute=60000)
+    fn, calls = flaky(1)
+    with pytest.raises(SheetsBusy):
+        scheduler.run("read", STALE_OK, fn, "x")
+    assert len(calls) == 1 and sleeps == []
+
+
+def test_other_errors_are_not_retried(sleeps):
+    scheduler = SheetScheduler(reads_per_minute=60000)
+    fn, calls = flaky(1, code=500)
+    with pytest.raises(QuotaError):
+        scheduler.run("read", NORMAL, fn, "x")
+    assert len(calls) == 1 and sleeps == []
+
+
+def test_stale_ok_gives_up_waiting_for_an_empty_bucket():
+    scheduler = SheetScheduler(reads_per_minute=1, stale_wait=0.05)
+    scheduler.buckets["read"].tokens = 0
+    with pytest.raises(SheetsBusy):
+        scheduler.run("read", STALE_OK, lambda: "x")
+    assert scheduler.depth() == {"read": 0, "write": 0}
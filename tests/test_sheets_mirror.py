@@ -0,0 +1,67 @@
+import time
+
+import pytest
+
+from bench.fake_sheets import FakeClient, seed_invoice_data
+from sheets import SheetRegistry
+from storage import SheetsMirror, SheetsStorage, SQLiteStorage
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "mirror did not catch up"
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def book():
+    return seed_invoice_data(FakeClient(), customers=0, tokens=[("T1", "100")])
+
+
+def storage_for(book, tmp_path, **kwargs):
+    client = FakeClient(book.backend)
+    client.spreadsheets[book.title] = book
+    mirror = SheetsMirror(SheetsStorage(SheetRegistry(lambda: client)), str(tmp_path / "mirror.jsonl"), **kwargs)
+    return SQLiteStorage(str(tmp_path / "nami.db"), mirror=mirror)
+
+
+def queue_row(token):
+    return ["2026-03-01 10:00:00", "n", "1000000000001", "a1", "a2", "0800000001", "i", 1, 107.0, "Pending", token]
+
+
+def test_redeem_mirrors_with_claim(book, tmp_path):
+    storage = storage_for(book, tmp_path)
+    storage.reserve_token("T1")
+    storage.redeem_token("T1", claim="sig-1")
+
+    wait_for(lambda: storage.mirror.pending() == 0)
+    assert book.sheets["TokenDB"].rows[1][2] == "Used"
+    assert book.sheets["TokenDB"].rows[1][4] == "sig-1"
+    assert book.backend.calls["TokenDB.update_cell"] == 0
+
+
+def test_writes_survive_restart(book, tmp_path):
+    # Sheets ล่มตลอดรอบแรก: งานค้างอยู่ใน journal ไม่ถูกทิ้ง
+    broken = storage_for(book, tmp_path, base_delay=60)
+    broken.mirror.target.append_queue = lambda row: (_ for _ in ()).throw(RuntimeError("sheets down"))
+    broken.append_queue(queue_row("T1"))
+    wait_for(lambda: broken.mirror.outbox.pending()[0].failures >= 1)
+    assert len(book.sheets["Queue"].rows) == 1
+
+    restarted = storage_for(book, tmp_path)
+    wait_for(lambda: restarted.mirror.pending() == 0)
+    assert [row[10] for row in book.sheets["Queue"].rows[1:]] == ["T1"]
+
+
+def test_retry_does_not_duplicate_queue_or_tokens(book, tmp_path):
+    storage = storage_for(book, tmp_path)
+    mirror = storage.mirror
+    mirror.target.append_queue(queue_row("T9"))
+    mirror.target.create_tokens([("T2", 50.0, "2026-03-01 10:00:00")])
+
+    mirror._apply({"method": "append_queue", "args": [queue_row("T9")]}, retry=True)
+    mirror._apply({"method": "create_tokens", "args": [[["T2", 50.0, "2026-03-01"], ["T3", 60.0, "2026-03-01"]]]}, retry=True)
+
+    assert [row[10] for row in book.sheets["Queue"].rows[1:]] == ["T9"]
+    assert [row[0] for row in book.sheets["TokenDB"].rows[1:]] == ["T1", "T2", "T3"]
@@ -0,0 +1,85 @@
+import threading
+
+import pytest
+
+from bench.fake_sheets import FakeClient, seed_invoice_data
+from sheets import SheetRegistry
+from storage import SheetsMirror, SheetsStorage, SQLiteStorage, TokenConflictError
+
+CUSTOMER = ["บริษัท อัลฟ่า จำกัด", "0105551234567", "1/2 ต.บางพูด", "อ.ปากเกร็ด นนทบุรี 11120", "0812345678"]
+
+
+@pytest.fixture
+def storage(tmp_path):
+    return SQLiteStorage(str(tmp_path / "db" / "nami.db"))
+
+
+def test_token_lifecycle(storage):
+    storage.create_tokens([("T1", 100, "2026-03-01 10:00:00"), ("T2", "250.5", "2026-03-01 10:00:00")])
+    assert storage.get_token("T2") == {"Token": "T2", "Amount": 250.5, "Status": "Active"}
+    assert storage.get_token("T9") is None
+
+    storage.reserve_token("T1")
+    with pytest.raises(TokenConflictError):
+        storage.reserve_token("T1")
+    storage.release_token("T1")
+    storage.reserve_token("T1")
+    assert storage.redeem_token("T1", claim="sig")
+    assert storage.token_claim("T1") == ("Used", None)
+    with pytest.raises(LookupError):
+        storage.reserve_token("T9")
+
+
+def test_reserve_is_atomic_across_threads(storage):
+    storage.create_tokens([("T1", 100, "2026-03-01 10:00:00")])
+    won, lost = [], []
+    barrier = threading.Barrier(8)
+
+    def reserve():
+        barrier.wait()
+        try:
+            storage.reserve_token("T1")
+            won.append(1)
+        except TokenConflictError:
+            lost.append(1)
+
+    threads = [threading.Thread(target=reserve) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert (len(won), len(lost)) == (1, 7)
+
+
+def test_customers_and_search(storage):
+    assert storage.upsert_customer(CUSTOMER)
+    assert not storage.upsert_customer(CUSTOMER)       # เลขภาษีเดิมไม่เพิ่มซ้ำ
+    assert storage.find_customer("105551234567")["Name"] == "บริษัท อัลฟ่า จำกัด"
+    assert [r["TaxID"] for r in storage.search_customers("อัลฟ่า")] == ["0105551234567"]
+
+    # ลูกค้าที่เพิ่มหลังสร้าง index แล้วค้นเจอทันที
+    storage.upsert_customer(["ร้านเบต้า", "3100500000001", "", "", ""])
+    assert [r["TaxID"] for r in storage.search_customers("31005")] == ["3100500000001"]
+
+
+def test_queue(storage):
+    row = ["2026-03-01 10:00:00", "n", "0105551234567", "a1", "a2", "0800000001", "i", 1, 107.0, "Pending", "T1"]
+    assert not storage.queue_has_token("T1")
+    storage.append_queue(row)
+    assert storage.queue_has_token(" T1 ")
+
+
+def test_falls_back_to_sheets_and_keeps_a_local_copy(tmp_path):
+    book = seed_invoice_data(FakeClient(), customers=2, tokens=[("OLD", "100")])
+    client = FakeClient(book.backend)
+    client.spreadsheets[book.title] = book
+    mirror = SheetsMirror(SheetsStorage(SheetRegistry(lambda: client)), str(tmp_path / "mirror.jsonl"))
+    storage = SQLiteStorage(str(tmp_path / "nami.db"), mirror=mirror)
+
+    assert storage.get_token("OLD")["Status"] == "Active"
+    assert storage.find_customer("1000000000001")["Name"] == "บริษัท ทดสอบ 1 จำกัด (สำนักงานใหญ่)"
+    calls = book.backend.snapshot()
+
+    assert storage.get_token("OLD")["Amount"] == 100.0
+    assert storage.find_customer("1000000000001") is not None
+    assert book.backend.snapshot() == calls       # ครั้งที่สองอ่านจาก SQLite
@@ -0,0 +1,108 @@
+import pytest
+
+from bench.fake_sheets import FakeClient, seed_invoice_data
+from sheets import SheetRegistry
+from storage import QUEUE_CONFLICT, SheetsStorage, SQLiteStorage, TokenConflictError
+
+
+@pytest.fixture
+def book():
+    return seed_invoice_data(FakeClient(), customers=0, tokens=[("T1", "100"), ("T2", "200")])
+
+
+def sheets_storage(book):
+    client = FakeClient(book.backend)
+    client.spreadsheets[book.title] = book
+    return SheetsStorage(SheetRegistry(lambda: client))
+
+
+def token_row(book, token):
+    return next(row for row in book.sheets["TokenDB"].rows if row[0] == token)
+
+
+def queue_row(token, ts, status="Pending"):
+    return [ts, "n", "1000000000001", "a1", "a2", "0800000001", "i", 1, 107.0, status, token]
+
+
+# ---------- redeem_token ----------
+def test_reserve_blocks_second_reservation(book):
+    storage = sheets_storage(book)
+    storage.reserve_token("T1")
+    with pytest.raises(TokenConflictError):
+        storage.reserve_token("T1")
+    assert storage.get_token("T1")["Status"] == "Used"     # จองไว้แล้วหน้าจออื่นเห็นเป็น Used
+    storage.release_token("T1")
+    storage.reserve_token("T1")
+
+
+def test_redeem_writes_used_and_claim_in_one_call(book):
+    storage = sheets_storage(book)
+    storage.reserve_token("T1")
+    before = book.backend.calls["TokenDB.batch_update"]
+    assert storage.redeem_token("T1", claim="sig-1")
+
+    assert token_row(book, "T1")[2] == "Used"
+    assert token_row(book, "T1")[4] == "sig-1"
+    assert book.backend.calls["TokenDB.batch_update"] == before + 1
+    assert book.backend.calls["TokenDB.find"] == 0
+
+
+def test_redeem_retry_with_same_claim_is_idempotent(book):
+    storage = sheets_storage(book)
+    storage.reserve_token("T1")
+    storage.redeem_token("T1", claim="sig-1")
+
+    restarted = sheets_storage(book)       # เปิดแอปใหม่ ลองขั้น token ซ้ำ: เทียบ claim ในแถว
+    assert restarted.redeem_token("T1", claim="sig-1")
+
+
+def test_redeem_by_other_claim_conflicts(book):
+    storage = sheets_storage(book)
+    storage.reserve_token("T1")
+    storage.redeem_token("T1", claim="sig-1")
+
+    with pytest.raises(TokenConflictError):
+        sheets_storage(book).redeem_token("T1", claim="sig-2")
+    assert token_row(book, "T1")[4] == "sig-1"
+
+
+def test_redeem_finds_row_after_rows_shift(book):
+    storage = sheets_storage(book)
+    storage.get_token("T2")                # จำแถวที่ 3 ไว้
+    del book.sheets["TokenDB"].rows[1]     # retention ลบแถวด้านบนออก
+    storage.reserve_token("T2")
+    storage.redeem_token("T2", claim="sig-2")
+    assert token_row(book, "T2")[2] == "Used"
+
+
+def test_redeem_unknown_token(book):
+    with pytest.raises(LookupError):
+        sheets_storage(book).redeem_token("NOPE")
+
+
+# ---------- set_queue_status ----------
+def test_set_queue_status_targets_this_entrys_row(book):
+    book.sheets["Queue"].rows += [queue_row("T1", "2026-03-01 10:00:00"), queue_row("T1", "2026-03-01 11:00:00")]
+    storage = sheets_storage(book)
+
+    assert storage.set_queue_status("T1", QUEUE_CONFLICT, ts="2026-03-01 11:00:00")
+    assert [row[9] for row in book.sheets["Queue"].rows[1:]] == ["Pending", QUEUE_CONFLICT]
+    assert not storage.set_queue_status("T1", QUEUE_CONFLICT, ts="2026-03-01 11:00:00")
+
+
+def test_set_queue_status_keeps_invoiced_rows(book):
+    book.sheets["Queue"].rows.append(queue_row("T1", "2026-03-01 10:00:00", status="Invoiced"))
+    assert not sheets_storage(book).set_queue_status("T1", QUEUE_CONFLICT)
+    assert book.sheets["Queue"].rows[1][9] == "Invoiced"
+    with pytest.raises(LookupError):
+        sheets_storage(book).set_queue_status("T9", QUEUE_CONFLICT)
+
+
+def test_sqlite_set_queue_status(tmp_path):
+    storage = SQLiteStorage(str(tmp_path / "nami.db"))
+    storage.append_queue(queue_row("T1", "2026-03-01 10:00:00"))
+    storage.append_queue(queue_row("T1", "2026-03-01 11:00:00"))
+
+    assert storage.set_queue_status("T1", QUEUE_CONFLICT, ts="2026-03-01 10:00:00")
+    statuses = [r[0] for r in storage._conn().execute("SELECT status FROM queue ORDER BY id")]
+    assert statuses == [QUEUE_CONFLICT, "Pending"]
@@ -0,0 +1,67 @@
+import uuid
+
+import pytest
+
+from token_signing import EXPIRED, FORGED, MALFORMED, InvalidToken, TokenSigner, signer_from_secrets
+
+NOW = 1_700_000_000
+
+
+def test_issue_and_verify_round_trip():
+    signer = TokenSigner("k" * 32, ttl_days=1)
+    token = signer.issue(1234.56, now=NOW)
+    claims = signer.verify(token, now=NOW + 60)
+    assert claims.amount == 1234.56
+    assert claims.expires_at == NOW + 86400
+    assert token.startswith(claims.id + ".")
+
+
+@pytest.mark.parametrize("token", ["", "abc", "not.a.signed.token", "a" * 16 + ".100.1700000000"])
+def test_malformed(token):
+    with pytest.raises(InvalidToken) as e:
+        TokenSigner("k" * 32).verify(token, now=NOW)
+    assert e.value.reason == MALFORMED
+
+
+def test_tampered_amount_is_forged():
+    signer = TokenSigner("k" * 32)
+    token_id, _, expires_at, signature = signer.issue(100, now=NOW).split(".")
+    with pytest.raises(InvalidToken) as e:
+        signer.verify(f"{token_id}.1.{expires_at}.{signature}", now=NOW)
+    assert e.value.reason == FORGED
+
+
+def test_unknown_key_is_forged():
+    token = TokenSigner("k" * 32).issue(100, now=NOW)
+    with pytest.raises(InvalidToken) as e:
+        TokenSigner("other" * 8).verify(token, now=NOW)
+    assert e.value.reason == FORGED
+
+
+def test_expired():
+    signer = TokenSigner("k" * 32, ttl_days=1)
+    token = signer.issue(50, now=NOW)
+    with pytest.raises(InvalidToken) as e:
+        signer.verify(token, now=NOW + 86401)
+    assert e.value.reason == EXPIRED
+
+
+def test_key_rotation_accepts_previous_keys_and_signs_with_new_one():
+    old = TokenSigner("old" * 11)
+    rotated = TokenSigner("new" * 11, previous_keys=["old" * 11])
+    assert rotated.verify(old.issue(10, now=NOW), now=NOW).amount == 10.0
+    with pytest.raises(InvalidToken):
+        old.verify(rotated.issue(10, now=NOW), now=NOW)
+
+
+def test_check_passes_legacy_tokens_through():
+    signer = TokenSigner("k" * 32)
+    assert signer.check(str(uuid.uuid4())) is None
+    with pytest.raises(InvalidToken):
+        signer.check("garbage")
+
+
+def test_signer_from_secrets():
+    assert signer_from_secrets({}) is None
+    assert signer_from_secrets({"token_signing": {"key": ""}}) is None
+    assert signer_from_secrets({"token_signing": {"key": "k" * 32, "ttl_days": 7}}).ttl_seconds == 7 * 86400
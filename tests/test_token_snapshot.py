@@ -0,0 +1,43 @@
+from bench.fake_sheets import FakeClient, seed_invoice_data
+from token_snapshot import TokenSnapshot
+
+
+def snapshot(tmp_path, tokens=()):
+    book = seed_invoice_data(FakeClient(), customers=0, tokens=tokens)
+    return book.sheets["TokenDB"], TokenSnapshot(book.sheets["TokenDB"], str(tmp_path / "snap.json"))
+
+
+def test_added_tokens_are_saved(tmp_path):
+    ws, snap = snapshot(tmp_path, tokens=[("T1", "100")])
+    assert snap.sync()
+    snap.add([["T2", "200", "Active", "2026-01-01 10:00:00"]])
+    assert snap.sync()
+
+    reloaded = TokenSnapshot(ws, snap.path)
+    assert reloaded.lookup("T2") == {"Token": "T2", "Amount": "200", "Status": "Active"}
+
+
+def test_delta_keeps_row_order_without_duplicates(tmp_path):
+    ws, snap = snapshot(tmp_path, tokens=[("T1", "100")])
+    assert snap.sync()
+    row = ["T2", "200", "Active", "2026-01-01 10:00:00"]
+    snap.add([row])
+    ws.append_row(row)
+    ws.append_row(["T3", "300", "Active", "2026-01-01 10:00:00"])
+    assert snap.sync()
+
+    assert snap._order == ["T1", "T2", "T3"]
+    assert len(snap) == 3
+
+
+def test_delta_sees_status_changed_elsewhere(tmp_path):
+    ws, snap = snapshot(tmp_path, tokens=[("T1", "100"), ("T2", "200")])
+    assert snap.sync()
+    ws.rows[2][2] = "Used"                 # อีกเครื่องปิด T2 ในแถวเดิม
+    ws.append_row(["T3", "300", "Active", "2026-01-01 10:00:00"])
+    assert snap.sync()
+
+    assert snap.lookup("T2")["Status"] == "Used"
+    assert snap.lookup("T1")["Status"] == "Active"
+    assert snap.lookup("T3")["Status"] == "Active"
+    assert ws.backend.calls["TokenDB.get_values"] == 1     # โหลดทั้งแท็บแค่ครั้งแรก
@@ -0,0 +1,88 @@
+import base64
+import hashlib
+import hmac
+import re
+import secrets
+import time
+from collections import namedtuple
+
+# ==========================================
+# 🔏 token แบบมีลายเซ็น (HMAC) ตรวจได้ในเครื่องโดยไม่ต้องถาม TokenDB
+# ==========================================
+# รูปแบบ: <id>.<ยอดเป็นสตางค์>.<หมดอายุ (unix)>.<ลายเซ็น>
+#   id      : สุ่ม 16 ตัวอักษร (base64 แบบใช้ใน URL ได้)
+#   ลายเซ็น : HMAC-SHA256(key, "id.ยอด.หมดอายุ") 16 ไบต์แรก
+# ลิงก์ที่พิมพ์ผิด / ปลอม / หมดอายุ ถูกปฏิเสธทันที ส่วน token แบบเดิม (uuid4) ยังใช้ได้โดยถาม TokenDB เหมือนเดิม
+#
+# [token_signing]
+# key = "สุ่มยาวๆ อย่างน้อย 32 ตัวอักษร"
+# previous_keys = []    # key เก่าที่ยังรับอยู่ (ตอนเปลี่ยน key ลิงก์ที่พิมพ์ไปแล้วยังใช้ได้)
+# ttl_days = 90
+
+MALFORMED = "malformed"
+FORGED = "forged"
+EXPIRED = "expired"
+
+SIGNED_TOKEN = re.compile(r"^([A-Za-z0-9_-]{16})\.(\d{1,12})\.(\d{9,11})\.([A-Za-z0-9_-]{22})$")
+LEGACY_TOKEN = re.compile(r"^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$")
+
+TokenClaims = namedtuple("TokenClaims", ["id", "amount", "expires_at"])
+
+
+class InvalidToken(ValueError):
+    # reason เป็น MALFORMED / FORGED / EXPIRED
+    def __init__(self, reason):
+        super().__init__(reason)
+        self.reason = reason
+
+
+def _b64(raw):
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+
+def is_legacy(token):
+    return bool(LEGACY_TOKEN.match(token))
+
+
+class TokenSigner:
+    def __init__(self, key, previous_keys=(), ttl_days=90):
+        if not key:
+            raise ValueError("token signing key is empty")
+        self._keys = [str(k).encode("utf-8") for k in [key, *previous_keys] if k]
+        self.ttl_seconds = int(ttl_days * 86400)
+
+    def _sign(self, key, payload):
+        return _b64(hmac.new(key, payload.encode("ascii"), hashlib.sha256).digest()[:16])
+
+    def issue(self, amount, now=None):
+        # คืน token ใหม่สำหรับยอด amount (บาท)
+        expires_at = int((now or time.time()) + self.ttl_seconds)
+        payload = f"{secrets.token_urlsafe(12)}.{round(float(amount) * 100)}.{expires_at}"
+        return f"{payload}.{self._sign(self._keys[0], payload)}"
+
+    def verify(self, token, now=None):
+        # คืน TokenClaims หรือ raise InvalidToken (ไม่แตะ Sheets)
+        match = SIGNED_TOKEN.match(token)
+        if not match:
+            raise InvalidToken(MALFORMED)
+        token_id, cents, expires_at, signature = match.groups()
+        payload = f"{token_id}.{cents}.{expires_at}"
+        if not any(hmac.compare_digest(self._sign(key, payload), signature) for key in self._keys):
+            raise InvalidToken(FORGED)
+        if int(expires_at) < (now or time.time()):
+            raise InvalidToken(EXPIRED)
+        return TokenClaims(token_id, int(cents) / 100.0, int(expires_at))
+
+    def check(self, token, now=None):
+        # ใช้ที่หน้าลูกค้า: token แบบเดิม (uuid4) คืน None ให้ไปถาม TokenDB ตามเดิม นอกนั้นต้องผ่าน verify
+        if is_legacy(token):
+            return None
+        return self.verify(token, now)
+
+
+def signer_from_secrets(secrets):
+    # คืน TokenSigner หรือ None ถ้ายังไม่ได้ตั้ง key (ใช้ uuid4 แบบเดิมทั้งหมด)
+    conf = secrets.get("token_signing", {})
+    if not conf.get("key"):
+        return None
+    return TokenSigner(conf["key"], conf.get("previous_keys", ()), conf.get("ttl_days", 90))
@@ -0,0 +1,220 @@
+import json
+import os
+import threading
+import time
+
+from metrics import METRICS
+from sheets import SheetsBusy
+
+# ==========================================
+# 🛰️ สำเนา TokenDB ในเครื่อง สำหรับตรวจ token ตอน Google Sheets ล่ม (โหมดออฟไลน์)
+# ==========================================
+# thread เบื้องหลังอ่านแถวใหม่ทุก refresh_interval วินาที (watermark แบบ CustomerIndex)
+# ในคำสั่งเดียวกันอ่านคอลัมน์สถานะ (C) ของแถวที่มีอยู่แล้วด้วย token ที่เครื่องอื่นเปลี่ยนเป็น Used จะเห็นภายในรอบเดียว
+# พร้อมเช็คแถวแรกและแถวที่ watermark ถ้าไม่ตรง (retention ลบแถวออก) หรือครบ full_interval จะโหลดใหม่ทั้งแท็บ
+# เขียนสำเนาลงไฟล์ทุกครั้งที่ข้อมูลเปลี่ยน เปิดแอปใหม่ตอนออฟไลน์ก็ยังตรวจ token ได้
+#
+# [offline]
+# enabled = true
+# snapshot_path = "data/token_snapshot.json"
+# refresh_interval = 5
+# full_interval = 300
+
+
+class TokenSnapshot:
+    def __init__(self, worksheet, path, refresh_interval=5.0, full_interval=300.0):
+        self.worksheet = worksheet
+        self.path = path
+        self.refresh_interval = refresh_interval
+        self.full_interval = full_interval
+        self.online = True              # ผลการ sync ครั้งล่าสุด (SheetsBusy ไม่นับว่าออฟไลน์)
+        self.last_error = None
+        self._tokens = {}               # token -> [ยอด, สถานะ]
+        self._order = []                # token ตามลำดับแถว (แถว 2 เป็นต้นไป)
+        self._row_tokens = []           # token ของแต่ละแถวในชีต (index 0 = แถว 2, แถวว่างเป็น "") ใช้จับคู่คอลัมน์สถานะ
+        self._watermark = None          # แถวที่อ่านแล้ว (รวมหัวตารางและแถวว่าง) None = ต้องโหลดทั้งแท็บ
+        self._head = ""                 # token ในแถวที่ 2
+        self._edge = ""                 # token ในแถวที่ watermark (เช็คว่ามีแถวถูกลบก่อนหน้านั้นหรือไม่)
+        self._dirty = False             # มีการแก้ในเครื่องที่ยังไม่ได้เขียนลงไฟล์
+        self._synced_at = None          # time.time() ของการ sync ที่สำเร็จครั้งล่าสุด
+        self._last_full = 0.0
+        self._listeners = []
+        self._lock = threading.Lock()
+        self._thread = None
+        self._load()
+
+    def __len__(self):
+        return len(self._tokens)
+
+    # ---------- ไฟล์ในเครื่อง ----------
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+        except ValueError:
+            return  # ไฟล์เสีย รอ sync ครั้งแรก
+        for token, amount, status in data.get("tokens", []):
+            self._tokens[token] = [amount, status]
+            self._order.append(token)
+        self._synced_at = data.get("synced_at")
+
+    def _save(self):
+        folder = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(folder, exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with self._lock:
+            data = {"synced_at": self._synced_at,
+                    "tokens": [[t, *self._tokens[t]] for t in self._order if t in self._tokens]}
+            self._dirty = False
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    # ---------- sync ----------
+    @staticmethod
+    def _last_token(values):
+        return str(values[-1][0]).strip() if values and values[-1] else ""
+
+    def _rows(self, values):
+        out = []
+        for row in values:
+            row = list(row) + [""] * (3 - len(row))
+            token = str(row[0]).strip()
+            if token:
+                out.append((token, row[1], str(row[2]).strip()))
+        return out
+
+    def _full(self):
+        values = self.worksheet.get_values("A2:C")
+        rows = self._rows(values)
+        with self._lock:
+            self._tokens = {token: [amount, status] for token, amount, status in rows}
+            self._order = [token for token, _, _ in rows]
+            self._row_tokens = [str(row[0]).strip() if row else "" for row in values]
+            self._watermark = 1 + len(values)
+            self._head = self._last_token(values[:1])
+            self._edge = self._last_token(values)
+            self._last_full = time.monotonic()
+        return True
+
+    def _delta(self):
+        # คำสั่งเดียว: แถวแรก + แถวที่ watermark (เช็คว่าแถวถูกลบ/เลื่อนหรือไม่) + แถวใหม่หลัง watermark
+        # + สถานะของแถวที่อ่านแล้ว (Active -> Used จากเครื่องอื่น)
+        ranges = ["A2:A2", f"A{self._watermark}:A{self._watermark}", f"A{self._watermark + 1}:C"]
+        if self._watermark > 1:
+            ranges.append(f"C2:C{self._watermark}")
+        first, edge, new, *statuses = self.worksheet.batch_get(ranges)
+        if self._last_token(first) != self._head or \
+                (self._watermark > 1 and self._last_token(edge) != self._edge):
+            return self._full()
+        rows = self._rows(new)
+        changed = bool(rows)
+        with self._lock:
+            for token, cell in zip(self._row_tokens, statuses[0] if statuses else []):
+                entry = self._tokens.get(token)
+                status = str(cell[0]).strip() if cell else ""
+                if entry is not None and status and entry[1] != status:
+                    entry[1] = status
+                    changed = True
+            for token, amount, status in rows:
+                if token not in self._tokens:
+                    self._order.append(token)
+                self._tokens[token] = [amount, status]
+            if new:
+                self._row_tokens += [str(row[0]).strip() if row else "" for row in new]
+                self._watermark += len(new)
+                self._edge = self._last_token(new)
+        return changed
+
+    def sync(self):
+        # คืน True ถ้า sync สำเร็จ
+        try:
+            with METRICS.timer("sheets", "token_snapshot"):
+                if self._watermark is None or time.monotonic() - self._last_full >= self.full_interval:
+                    changed = self._full()
+                else:
+                    changed = self._delta()
+        except SheetsBusy:
+            return False  # โควตาอ่านไม่พอ รอบหน้าค่อยอ่าน
+        except Exception as e:
+            self.last_error = str(e)
+            self.mark_offline()
+            return False
+        self._synced_at = time.time()
+        if changed or self._dirty:
+            self._save()
+        self._set_online(True)
+        return True
+
+    def _set_online(self, online):
+        with self._lock:
+            reconnected = online and not self.online
+            self.online = online
+            listeners = list(self._listeners)
+        if reconnected:
+            print("Google Sheets reachable again")
+            for fn in listeners:
+                try:
+                    fn()
+                except Exception as e:
+                    print(f"Reconnect listener failed: {e}")
+
+    def mark_offline(self):
+        # เรียกได้จากที่อื่นที่เจอ error ของ Sheets (ไม่ต้องรอ sync รอบหน้า)
+        if self.online:
+            METRICS.inc("offline_total", component="token_snapshot")
+            print(f"Google Sheets unreachable, switching to offline mode ({self.last_error})")
+        with self._lock:
+            self.online = False
+
+    def invalidate(self):
+        # ให้ sync รอบหน้าโหลดทั้งแท็บ (หลังย้ายแถวไปเก็บถาวร)
+        with self._lock:
+            self._watermark = None
+
+    def on_reconnect(self, fn):
+        # fn() ถูกเรียกเมื่อ sync สำเร็จหลังจากออฟไลน์ (เช่นให้ outbox ส่งงานที่ค้างทันที)
+        with self._lock:
+            self._listeners.append(fn)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="token-snapshot", daemon=True)
+            self._thread.start()
+        return self
+
+    def _run(self):
+        while True:
+            self.sync()
+            time.sleep(self.refresh_interval)
+
+    # ---------- อ่าน / แก้ในเครื่อง ----------
+    def age(self):
+        # วินาทีนับจาก sync สำเร็จครั้งล่าสุด (None = ยังไม่เคย)
+        return None if self._synced_at is None else time.time() - self._synced_at
+
+    def lookup(self, token):
+        # คืนค่าแบบเดียวกับ get_token หรือ None
+        with self._lock:
+            entry = self._tokens.get(token)
+        if entry is None:
+            return None
+        return {'Token': token, 'Amount': entry[0], 'Status': entry[1]}
+
+    def add(self, rows):
+        # rows = [[token, ยอด, สถานะ, ...]] ที่แอปเพิ่งต่อท้าย TokenDB เอง
+        # ไม่นับเข้า watermark (แถวจะถูกอ่านซ้ำรอบ sync หน้า ซึ่งทับค่าเดิม) ใช้ได้ทันทีแม้ sync ไม่ได้
+        with self._lock:
+            for token, amount, status, *_ in rows:
+                if token not in self._tokens:
+                    self._order.append(token)   # ต้องอยู่ใน _order ด้วย _save จึงจะเขียนลงไฟล์
+                self._tokens[token] = [amount, status]
+            self._dirty = True
+
+    def set_status(self, token, status):
+        with self._lock:
+            if token in self._tokens:
+                self._tokens[token][1] = status
+                self._dirty = True